@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Stand-in for a command an extend runs, replaying a recorded output.
+
+replay.py installs this script into a directory under the names of the
+commands it replaces (ss, iw, wg, ...), next to a replay.json describing what
+each of them prints:
+
+    {
+        "latency": 0.05,            seconds to wait before answering
+        "jitter": 0.02,             plus or minus up to this many seconds
+        "log": "spawns.log",        one line appended per invocation
+        "commands": {
+            "ss": [
+                {"args": "--tcp\\b", "output": "ss.0.out", "exit": 0},
+                {"args": null, "output": null, "exit": 0}
+            ]
+        }
+    }
+
+The first entry whose "args" regex is found in the space-joined arguments (or
+whose "args" is null) answers: its "output" file is copied to stdout, its
+"stderr" text to stderr, and the stand-in exits with its "exit" status.  An
+invocation no entry matches fails with status 64.  Relative paths are taken
+from the directory holding replay.json, which is the directory the stand-in
+was started from, so putting that directory first on PATH is all an extend
+needs.
+"""
+
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import time
+
+CONFIG_NAME = "replay.json"
+NO_MATCH_STATUS = 64
+
+
+def main():
+    invoked = os.path.abspath(sys.argv[0])
+    directory = os.path.dirname(invoked)
+    name = os.path.basename(invoked)
+    with open(os.path.join(directory, CONFIG_NAME), "r", encoding="utf-8") as handle:
+        config = json.load(handle)
+
+    args = " ".join(sys.argv[1:])
+    if config.get("log"):
+        # O_APPEND keeps the lines of concurrent invocations whole.
+        with open(os.path.join(directory, config["log"]), "a") as log:
+            log.write("%s %s\n" % (name, args))
+
+    for entry in config["commands"].get(name, []):
+        if entry.get("args") is None or re.search(entry["args"], args):
+            break
+    else:
+        print("%s: no recording for '%s'" % (name, args), file=sys.stderr)
+        return NO_MATCH_STATUS
+
+    latency = entry.get("latency", config.get("latency", 0.0))
+    jitter = entry.get("jitter", config.get("jitter", 0.0))
+    delay = latency + random.uniform(-jitter, jitter)
+    if delay > 0:
+        time.sleep(delay)
+
+    if entry.get("output"):
+        with open(os.path.join(directory, entry["output"]), "rb") as output:
+            shutil.copyfileobj(output, sys.stdout.buffer)
+        sys.stdout.flush()
+    if entry.get("stderr"):
+        sys.stderr.write(entry["stderr"])
+    return entry.get("exit", 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
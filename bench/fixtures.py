@@ -0,0 +1,339 @@
+"""
+Recorded and synthetically scaled command output for the extend benchmarks.
+
+The files in fixtures/ are recorded (and anonymised) outputs of the commands
+the extends run.  The generators below scale them up to the sizes seen on
+large hosts by repeating and renaming the recorded records, so the parsers
+see realistic line shapes at any volume.
+"""
+
+import base64
+import hashlib
+import itertools
+import json
+import os
+import struct
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load(name):
+    """Return the recorded fixture *name* as bytes."""
+    with open(os.path.join(FIXTURE_DIR, name), "rb") as handle:
+        return handle.read()
+
+
+def repeat_lines(raw, count):
+    """Repeat the lines of *raw* cyclically until there are *count* of them."""
+    lines = raw.rstrip(b"\n").split(b"\n")
+    full, rest = divmod(count, len(lines))
+    return b"\n".join(lines * full + lines[:rest]) + b"\n"
+
+
+def ss_sockets(count, netids=False):
+    """`ss --all --no-header` output with *count* sockets, with the netid
+    column (--family inet) or without it (--tcp)."""
+    return repeat_lines(load("ss_inet.txt" if netids else "ss_tcp.txt"), count)
+
+
+# Kernel TCP state numbers of the states in ss's output.
+TCP_STATES = {
+    b"ESTAB": 1,
+    b"SYN-SENT": 2,
+    b"SYN-RECV": 3,
+    b"FIN-WAIT-1": 4,
+    b"FIN-WAIT-2": 5,
+    b"TIME-WAIT": 6,
+    b"UNCONN": 7,
+    b"CLOSE-WAIT": 8,
+    b"LAST-ACK": 9,
+    b"LISTEN": 10,
+    b"CLOSING": 11,
+}
+
+
+def sockdiag_dump(count, chunk_size=256 * 1024):
+    """The NETLINK_SOCK_DIAG replies to a dump of *count* TCP sockets, in the
+    states of ss_tcp.txt, as the list of datagrams recv() would return of at
+    most *chunk_size* bytes each, the last one ending the dump."""
+    states = [
+        TCP_STATES[line.split(None, 1)[0]]
+        for line in ss_sockets(count).split(b"\n")
+        if line
+    ]
+    # nlmsghdr (NLM_F_MULTI) and inet_diag_msg with an all-zero socket id.
+    messages = [
+        struct.pack("=IHHIIBBBB68x", 88, 20, 2, 1, 0, 2, state, 0, 0)
+        for state in states
+    ]
+    per_chunk = chunk_size // 88
+    chunks = [
+        b"".join(messages[i : i + per_chunk])
+        for i in range(0, len(messages), per_chunk)
+    ]
+    chunks.append(struct.pack("=IHHIIi", 20, 3, 2, 1, 0, 0))
+    return chunks
+
+
+def ss_stream(count, netids=False):
+    """The lines of ss_sockets(count, netids), decoded and without their line
+    endings as executor.iter_lines() yields them, generated as they are
+    consumed rather than held in memory."""
+    raw = load("ss_inet.txt" if netids else "ss_tcp.txt").decode("utf-8")
+    return itertools.islice(itertools.cycle(raw.rstrip("\n").split("\n")), count)
+
+
+def ss_dump(count):
+    """`ss --all --no-header` output of every socket type and address family
+    at once, with *count* sockets."""
+    return repeat_lines(load("ss_all.txt"), count)
+
+
+# ss.py's per-invocation arguments -> (netids listed, keeps the netid column,
+# address family or None).
+SS_INVOCATIONS = {
+    "--dccp": ((b"dccp",), False, None),
+    "--mptcp": ((b"mptcp",), False, None),
+    "--raw": ((b"raw", b"icmp6"), False, None),
+    "--sctp": ((b"sctp",), False, None),
+    "--tcp": ((b"tcp",), False, None),
+    "--udp": ((b"udp",), False, None),
+    "--xdp": ((b"xdp",), False, None),
+    "--family netlink": ((b"nl",), False, None),
+    "--family link": ((b"p_dgr", b"p_raw"), True, None),
+    "--family tipc": ((b"ti_dg", b"ti_rd", b"ti_sq", b"ti_st"), True, None),
+    "--family unix": ((b"u_dgr", b"u_seq", b"u_str"), True, None),
+    "--family vsock": ((b"v_dgr", b"v_str"), True, None),
+}
+SS_INET_NETIDS = (b"dccp", b"icmp6", b"mptcp", b"raw", b"sctp", b"tcp", b"udp", b"???")
+for family in ("inet", "inet6"):
+    SS_INVOCATIONS["--family " + family] = (SS_INET_NETIDS, True, family)
+
+
+def ss_split(dump):
+    """Split the ss_dump() *dump* into what ss.py's per socket type and
+    address family invocations print: {arguments: output}.  The fixtures
+    print IPv6 addresses bracketed, or as * for dual-stack sockets."""
+    outputs = {}
+    for args, (netids, keep_netid, family) in SS_INVOCATIONS.items():
+        lines = []
+        for line in dump.split(b"\n"):
+            fields = line.split()
+            if not fields or fields[0] not in netids:
+                continue
+            if family:
+                host = fields[4].rpartition(b":")[0]
+                if (host[:1] in (b"[", b"*")) != (family == "inet6"):
+                    continue
+            lines.append(b" ".join(fields if keep_netid else fields[1:]))
+        outputs[args] = b"".join(line + b"\n" for line in lines)
+    return outputs
+
+
+# The /proc/net table listing the sockets of each netid ss_dump() prints that
+# has one.
+PROC_NET_TABLES = {
+    b"tcp": "tcp",
+    b"udp": "udp",
+    b"raw": "raw",
+    b"u_str": "unix",
+    b"u_dgr": "unix",
+    b"u_seq": "unix",
+    b"p_raw": "packet",
+    b"p_dgr": "packet",
+    b"nl": "netlink",
+}
+PROC_NET_HEADERS = {
+    "tcp": b"  sl  local_address rem_address   st tx_queue rx_queue tr tm->when"
+    b" retrnsmt   uid  timeout inode\n",
+    "tcp6": b"  sl  local_address                         remote_address"
+    b"                        st tx_queue rx_queue tr tm->when retrnsmt   uid"
+    b"  timeout inode\n",
+    "unix": b"Num       RefCount Protocol Flags    Type St Inode Path\n",
+    "packet": b"sk               RefCnt Type Proto  Iface R Rmem   User   Inode\n",
+    "netlink": b"sk               Eth Pid        Groups   Rmem     Wmem     Dump"
+    b"  Locks    Drops    Inode\n",
+}
+for name in ("udp", "raw"):
+    PROC_NET_HEADERS[name] = PROC_NET_HEADERS["tcp"]
+    PROC_NET_HEADERS[name + "6"] = PROC_NET_HEADERS["tcp6"]
+# /proc/net/unix's type of each netid, and flags and state of each state.
+PROC_UNIX_TYPES = {b"u_str": 1, b"u_dgr": 2, b"u_seq": 5}
+PROC_UNIX_STATES = {b"LISTEN": (1 << 16, 1), b"ESTAB": (0, 3), b"UNCONN": (0, 1)}
+
+
+def ss_proc_dump(count):
+    """ss_dump() of only the sockets the /proc/net tables list, *count* of
+    them."""
+    lines = [
+        line
+        for line in load("ss_all.txt").split(b"\n")
+        if line.split(None, 1)[:1] and line.split(None, 1)[0] in PROC_NET_TABLES
+    ]
+    return repeat_lines(b"\n".join(lines), count)
+
+
+def proc_net(dump):
+    """The /proc/net tables listing the sockets of the ss_dump() *dump*, as
+    {file name: content}.  Sockets of netids no table lists are left out."""
+    rows = {name: [] for name in PROC_NET_HEADERS}
+    for line in dump.split(b"\n"):
+        fields = line.split()
+        if not fields or fields[0] not in PROC_NET_TABLES:
+            continue
+        netid, state, local = fields[0], fields[1], fields[4]
+        name = PROC_NET_TABLES[netid]
+        inode = len(rows[name]) + 1
+        if name in ("tcp", "udp", "raw"):
+            host, _, port = local.rpartition(b":")
+            width = 8
+            if host[:1] in (b"[", b"*"):
+                name += "6"
+                width = 32
+            address = b"0" * width
+            rows[name].append(
+                b"%4d: %s:%04X %s:0000 %02X 00000000:00000000 00:00000000"
+                b" 00000000     0        0 %d 1 0000000000000000 100 0 0 10 0"
+                % (
+                    len(rows[name]),
+                    address,
+                    int(port),
+                    address,
+                    TCP_STATES[state],
+                    inode,
+                )
+            )
+        elif name == "unix":
+            flags, unix_state = PROC_UNIX_STATES[state]
+            rows[name].append(
+                b"%016x: 00000002 00000000 %08X %04X %02X %5d"
+                % (inode, flags, PROC_UNIX_TYPES[netid], unix_state, inode)
+            )
+        elif name == "packet":
+            sock_type = 3 if netid == b"p_raw" else 2
+            rows[name].append(
+                b"%016x 3      %-4d 0003   2     1 0      0      %-6d"
+                % (inode, sock_type, inode)
+            )
+        else:
+            rows[name].append(
+                b"%016x 0   0          00000000 0        0        0     2"
+                b"        0        %-8d" % (inode, inode)
+            )
+    return {
+        name: PROC_NET_HEADERS[name] + b"".join(row + b"\n" for row in table)
+        for name, table in rows.items()
+    }
+
+
+def systemctl_units(count):
+    """`systemctl list-units` output with *count* uniquely named units."""
+    lines = load("systemctl_list_units.txt").rstrip(b"\n").split(b"\n")
+    return (
+        b"\n".join(
+            b"u%d-%s" % (index, lines[index % len(lines)]) for index in range(count)
+        )
+        + b"\n"
+    )
+
+
+def public_key(index):
+    """A deterministic, well-formed WireGuard public key."""
+    return base64.b64encode(hashlib.sha256(b"peer%d" % index).digest()).decode()
+
+
+def wg_dump(peers):
+    """`wg show wg0 dump` output with *peers* peers, and the matching
+    public_key_to_arbitrary_name config for wireguard.py."""
+    header, *records = load("wg_show_dump.txt").rstrip(b"\n").split(b"\n")
+    lines = [header]
+    names = {}
+    for index in range(peers):
+        key = public_key(index)
+        fields = records[index % len(records)].split(b"\t")
+        fields[0] = key.encode()
+        lines.append(b"\t".join(fields))
+        names[key] = "client%d" % index
+    return b"\n".join(lines) + b"\n", {"wg0": names}
+
+
+def mac_address(index):
+    """A deterministic MAC address in the documentation range."""
+    octets = (index >> 16 & 0xFF, index >> 8 & 0xFF, index & 0xFF)
+    return "00:53:00:%02x:%02x:%02x" % octets
+
+
+def iw_stations(count):
+    """`iw dev wlan0 station get <mac>` output for *count* stations."""
+    template = load("iw_station_get.txt")
+    return [
+        template.replace(b"00:53:00:00:00:01", mac_address(index).encode())
+        for index in range(count)
+    ]
+
+
+def storcli_drives(count, per_enclosure=24):
+    """`storcli64 /call/eALL/sALL show all J` output with *count* drives on
+    controller 0, spread over enclosures of *per_enclosure* slots."""
+    document = json.loads(load("storcli_pd_show_all.json"))
+    template = document["Controllers"][0]["Response Data"]
+    prefix = "Drive /c0/e252/s0"
+    recorded = {k: v for k, v in template.items() if k.startswith(prefix + " ")}
+    recorded[prefix] = template[prefix]
+    encoded = json.dumps(recorded)
+
+    response = {}
+    for index in range(count):
+        eid, slot = divmod(index, per_enclosure)
+        base = "Drive /c0/e%d/s%d" % (252 + eid, slot)
+        drive = json.loads(encoded.replace(prefix, base))
+        drive[base][0]["EID:Slt"] = "%d:%d" % (252 + eid, slot)
+        drive[base][0]["DID"] = index
+        response.update(drive)
+    document["Controllers"][0]["Response Data"] = response
+    return json.dumps(document).encode()
+
+
+def iw_station_dump(count):
+    """`iw dev wlan0 station dump` output for *count* stations."""
+    return b"".join(iw_stations(count))
+
+
+def chronyc_sources(count):
+    """`chronyc -c sources` and `chronyc -c sourcestats` output for *count*
+    sources, as a pair."""
+    outputs = []
+    for name in ("chronyc_sources.csv", "chronyc_sourcestats.csv"):
+        lines = load(name).rstrip(b"\n").split(b"\n")
+        renamed = []
+        for index in range(count):
+            line = lines[index % len(lines)]
+            address = b"192.0.2.%d" % (index % 254 + 1)
+            # The address is the third field of a source, the first of a stat.
+            fields = line.split(b",")
+            fields[2 if name == "chronyc_sources.csv" else 0] = address
+            renamed.append(b",".join(fields))
+        outputs.append(b"\n".join(renamed) + b"\n")
+    return tuple(outputs)
+
+
+def docker_stats(count):
+    """`docker stats --no-stream --format '{{ json . }}'` output for *count*
+    uniquely named containers."""
+    stats = json.loads(load("docker_stats.jsonl"))
+    lines = []
+    for index in range(count):
+        stats["Name"] = "web%d" % index
+        lines.append(json.dumps(stats).encode())
+    return b"\n".join(lines) + b"\n"
+
+
+def zpool_list(count):
+    """`zpool list -p -H` output with *count* uniquely named pools."""
+    lines = load("zpool_list.txt").rstrip(b"\n").split(b"\n")
+    return (
+        b"\n".join(
+            b"p%d-%s" % (index, lines[index % len(lines)]) for index in range(count)
+        )
+        + b"\n"
+    )
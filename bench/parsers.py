@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the parsers of the Python extends.
+
+Each case feeds recorded or synthetically scaled command output (see
+fixtures.py) through an extend's own parse functions, the same way the
+extend's main() does, without running the command.  For every case it
+reports the items parsed, the latency percentiles of a full parse over
+--repeat runs, the throughput at the median, and the peak memory traced by
+tracemalloc during one extra run.
+
+    python3 bench/parsers.py                   # all cases, full size
+    python3 bench/parsers.py --scale 0.1 ss    # ss cases at a tenth the size
+    python3 bench/parsers.py --json > before.json
+    python3 bench/parsers.py --scale 0.25,0.5,1 ss_stream    # at 3 sizes
+
+The default sizes are those of our largest hosts: 1M sockets (2M in the
+ss_stream cases, which generate their lines while they are parsed, as ss's
+pipe delivers them, so that the peak memory is the parser's own), 5k systemd
+units, 10k WireGuard peers, 240 storcli drives and 500 wireless stations.
+The *_readlines and *_procfs cases compare reading kernel stat files the
+old way with librenms_extend/procfs.py, 1000 samples each, and ss_sockdiag
+counts ss_tcp's sockets from NETLINK_SOCK_DIAG replies instead of ss text,
+and ss_proc_tcp from the /proc/net tables listing them.
+"""
+
+import argparse
+import atexit
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import fixtures
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SNMP_DIR = os.path.join(REPO_DIR, "snmp")
+sys.path.insert(0, SNMP_DIR)
+
+from librenms_extend import loader, procfs, sockdiag  # noqa: E402
+
+CASES = {}
+
+
+def case(name, size):
+    """Register a benchmark case.  The decorated function takes the number of
+    items to generate and returns a zero-argument callable doing one full
+    parse."""
+
+    def register(setup):
+        CASES[name] = (setup, size)
+        return setup
+
+    return register
+
+
+def extend(script):
+    """Import an extend from the snmp/ directory."""
+    return loader.load_script(os.path.join(SNMP_DIR, script))
+
+
+@case("ss_tcp", 1000000)
+def bench_ss_tcp(count):
+    ss = extend("ss.py")
+    raw = fixtures.ss_sockets(count)
+
+    def run():
+        data = {}
+        ss.lines_parser(
+            raw.decode("utf-8").split("\n"), "tcp", data, ss.SOCKET_ALLOW_LIST
+        )
+        return data
+
+    return run
+
+
+@case("ss_inet", 1000000)
+def bench_ss_inet(count):
+    ss = extend("ss.py")
+    raw = fixtures.ss_sockets(count, netids=True)
+
+    def run():
+        data = {netid: {} for netid in ss.SOCKET_MAPPINGS["inet"]["netids"]}
+        ss.lines_parser(
+            raw.decode("utf-8").split("\n"), "inet", data, ss.SOCKET_ALLOW_LIST
+        )
+        return data
+
+    return run
+
+
+@case("ss_stream_tcp", 2000000)
+def bench_ss_stream_tcp(count):
+    ss = extend("ss.py")
+
+    def run():
+        # Lines generated as they are read, as from ss's pipe: the peak
+        # memory is the parser's own.
+        data = {}
+        ss.lines_parser(fixtures.ss_stream(count), "tcp", data, ss.SOCKET_ALLOW_LIST)
+        return data
+
+    return run
+
+
+@case("ss_stream_inet", 2000000)
+def bench_ss_stream_inet(count):
+    ss = extend("ss.py")
+
+    def run():
+        data = {netid: {} for netid in ss.SOCKET_MAPPINGS["inet"]["netids"]}
+        lines = fixtures.ss_stream(count, netids=True)
+        ss.lines_parser(lines, "inet", data, ss.SOCKET_ALLOW_LIST)
+        return data
+
+    return run
+
+
+@case("ss_sockdiag", 1000000)
+def bench_ss_sockdiag(count):
+    chunks = fixtures.sockdiag_dump(count)
+
+    def run():
+        # What the netlink backend does with the kernel's replies instead of
+        # parsing ss_tcp's text.
+        counts = {}
+        for chunk in chunks:
+            if sockdiag.count_replies(chunk, len(chunk), sockdiag.INET_STATE, counts):
+                break
+        return counts
+
+    return run
+
+
+@case("ss_proc_tcp", 1000000)
+def bench_ss_proc_tcp(count):
+    ss = extend("ss.py")
+    # ss_tcp's sockets, as /proc/net/tcp and tcp6 list them.
+    dump = b"".join(
+        b"tcp " + line + b"\n"
+        for line in fixtures.ss_sockets(count).split(b"\n")
+        if line
+    )
+    tables = fixtures.proc_net(dump)
+    ss.PROC_NET_DIR = scratch_dir({name: tables[name] for name in ("tcp", "tcp6")})
+
+    def run():
+        data = {"tcp": {}}
+        ss.proc_pass(data)
+        return data["tcp"]
+
+    return run
+
+
+@case("ss_proc", 1000000)
+def bench_ss_proc(count):
+    ss = extend("ss.py")
+    ss.PROC_NET_DIR = scratch_dir(fixtures.proc_net(fixtures.ss_proc_dump(count)))
+
+    def run():
+        data = {
+            gentype: {netid: {} for netid in mapping["netids"]}
+            for gentype, mapping in ss.SOCKET_MAPPINGS.items()
+        }
+        ss.proc_pass(data)
+        return data
+
+    return run
+
+
+@case("systemd", 5000)
+def bench_systemd(count):
+    systemd = extend("systemd.py")
+    raw = fixtures.systemctl_units(count)
+
+    def run():
+        data = {}
+        for line in raw.decode("utf-8").split("\n"):
+            if not line:
+                continue
+            data = systemd.unit_parser(line, data)
+        return data
+
+    return run
+
+
+@case("wireguard", 10000)
+def bench_wireguard(count):
+    wireguard = extend("wireguard.py")
+    raw, names = fixtures.wg_dump(count)
+
+    def run():
+        data = {}
+        for line in raw.decode("utf-8").split("\n")[1:]:
+            if not line:
+                continue
+            data.update(wireguard.output_parser(line, names, "wg0"))
+        return data
+
+    return run
+
+
+@case("linux_iw", 500)
+def bench_linux_iw(count):
+    linux_iw = extend("linux_iw.py")
+    outputs = fixtures.iw_stations(count)
+    iw_parser = linux_iw.SUB_PARSERS["station_get"]
+
+    def run():
+        return [linux_iw.output_parser(output, iw_parser) for output in outputs]
+
+    return run
+
+
+@case("pwrstatd", 1000)
+def bench_pwrstatd(count):
+    pwrstatd = extend("pwrstatd.py")
+    raw = fixtures.load("pwrstat_status.txt")
+
+    def run():
+        return [pwrstatd.output_parser(raw) for _ in range(count)]
+
+    return run
+
+
+@case("zfs_arcstats", 1000)
+def bench_zfs_arcstats(count):
+    zfs = extend("zfs-linux")
+    raw = fixtures.load("arcstats.txt")
+
+    def run():
+        # main() reads the file with readlines() and strips every line.
+        return [
+            zfs.arcstats_parser([x.strip() for x in raw.decode().splitlines()], 2)
+            for _ in range(count)
+        ]
+
+    return run
+
+
+def scratch_file(data):
+    """Write *data* to a temporary file, removed at exit, and return its
+    path."""
+    fd, path = tempfile.mkstemp(prefix="bench-")
+    with os.fdopen(fd, "wb") as handle:
+        handle.write(data)
+    atexit.register(os.unlink, path)
+    return path
+
+
+def scratch_dir(files):
+    """Write *files*, {name: data}, to a temporary directory, removed at
+    exit, and return its path."""
+    path = tempfile.mkdtemp(prefix="bench-")
+    for name, data in files.items():
+        with open(os.path.join(path, name), "wb") as handle:
+            handle.write(data)
+    atexit.register(shutil.rmtree, path)
+    return path
+
+
+@case("zfs_arcstats_readlines", 1000)
+def bench_zfs_arcstats_readlines(count):
+    zfs = extend("zfs-linux")
+    path = scratch_file(fixtures.load("arcstats.txt"))
+
+    def run():
+        # What main() did before procfs.py: open, readlines, strip, split.
+        stats = []
+        for _ in range(count):
+            with open(path, "r") as handle:
+                lines = [x.strip() for x in handle.readlines()]
+            stats.append(zfs.arcstats_parser(lines, 2))
+        return stats
+
+    return run
+
+
+@case("zfs_arcstats_procfs", 1000)
+def bench_zfs_arcstats_procfs(count):
+    path = scratch_file(fixtures.load("arcstats.txt"))
+    reader = procfs.KstatReader(path)
+
+    def run():
+        # main() now: one kept-open reader, as under the collector daemon.
+        return [reader.sample() for _ in range(count)]
+
+    return run
+
+
+@case("vmstat_readlines", 1000)
+def bench_vmstat_readlines(count):
+    def run():
+        stats = []
+        for _ in range(count):
+            with open("/proc/vmstat", "r") as handle:
+                rows = [line.split() for line in handle.readlines()]
+            stats.append({name: int(value) for name, value in rows})
+        return stats
+
+    return run
+
+
+@case("vmstat_procfs", 1000)
+def bench_vmstat_procfs(count):
+    reader = procfs.PairsReader("/proc/vmstat")
+
+    def run():
+        return [reader.sample() for _ in range(count)]
+
+    return run
+
+
+@case("storraid_pd", 240)
+def bench_storraid_pd(count):
+    storraid = extend("storraid.py")
+    raw = fixtures.storcli_drives(count)
+
+    def run():
+        # run_storcli() decodes the JSON before parse_physical_disks() sees it.
+        return storraid.parse_physical_disks([0], json.loads(raw))
+
+    return run
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = round(pct / 100 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(len(sorted_values) - 1, rank))]
+
+
+def measure(run, repeat):
+    """Time *repeat* runs, then trace one more for its peak memory."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return timings, peak
+
+
+def run_cases(names, scales, repeat):
+    results = []
+    for name in names:
+        setup, size = CASES[name]
+        for scale in scales:
+            items = max(1, int(size * scale))
+            timings, peak = measure(setup(items), repeat)
+            p50 = percentile(timings, 50)
+            results.append(
+                {
+                    "case": name,
+                    "items": items,
+                    "p50_ms": p50 * 1000,
+                    "p95_ms": percentile(timings, 95) * 1000,
+                    "max_ms": timings[-1] * 1000,
+                    "items_per_s": items / p50 if p50 else 0.0,
+                    "peak_kib": peak / 1024,
+                }
+            )
+    return results
+
+
+def scales(value):
+    """The comma separated scale factors of --scale."""
+    return [float(scale) for scale in value.split(",")]
+
+
+def print_table(results):
+    print(
+        "%-22s %9s %11s %11s %11s %13s %11s"
+        % ("case", "items", "p50 ms", "p95 ms", "max ms", "items/s", "peak KiB")
+    )
+    for r in results:
+        print(
+            "%-22s %9d %11.2f %11.2f %11.2f %13.0f %11.0f"
+            % (
+                r["case"],
+                r["items"],
+                r["p50_ms"],
+                r["p95_ms"],
+                r["max_ms"],
+                r["items_per_s"],
+                r["peak_kib"],
+            )
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the extend parsers")
+    parser.add_argument(
+        "cases",
+        nargs="*",
+        help="Cases (or case prefixes) to run (default: all of %s)" % ", ".join(CASES),
+    )
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=5, help="Timed runs per case (default: 5)"
+    )
+    parser.add_argument(
+        "-s",
+        "--scale",
+        type=scales,
+        default=[1.0],
+        help="Multiply the fixture sizes by this factor, or run every case at"
+        " each of several, e.g. 0.25,0.5,1 (default: 1.0)",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    names = [
+        name
+        for name in CASES
+        if not args.cases or any(name.startswith(prefix) for prefix in args.cases)
+    ]
+    if not names:
+        print("No such case: %s" % ", ".join(args.cases), file=sys.stderr)
+        return 1
+    results = run_cases(names, args.scale, max(1, args.repeat))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+End-to-end replay benchmark for the extends.
+
+Each case runs a whole extend in a child process, the way snmpd does, with
+the commands it calls replaced by stand-ins (fakecmd.py) that replay recorded
+or synthetically scaled output (see fixtures.py).  Extends find the
+stand-ins through PATH or, where they run a fixed path, through their own
+"*_cmd" setting.  Module-level settings the extend offers no option for (the
+config file location, storraid's output file, zfs-linux's zpool and arcstats
+paths) are replaced in the child before main() runs (runextend.py), so
+nothing outside the case's scratch directory is read or written.
+
+For every case it reports the latency percentiles of a run over --repeat
+runs, the stand-ins spawned and the bytes printed by one run, and the exit
+status of the last run.  --latency and --jitter make every stand-in wait
+before answering, like a slow ioctl or a daemon round trip would:
+
+    python3 bench/replay.py                              # all cases
+    python3 bench/replay.py --latency 0.05 --jitter 0.02 linux_iw
+    python3 bench/replay.py --scale 10 --json ss > ss.json
+
+--install DIR writes the stand-ins, recordings and extend configs of the
+chosen cases to DIR and prints the command line of each case instead, for
+running an extend against them by hand.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+import fixtures
+from parsers import percentile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SNMP_DIR = os.path.join(os.path.dirname(BENCH_DIR), "snmp")
+FAKECMD = os.path.join(BENCH_DIR, "fakecmd.py")
+RUNEXTEND = os.path.join(BENCH_DIR, "runextend.py")
+SPAWN_LOG = "spawns.log"
+RUN_TIMEOUT = 300
+
+CASES = {}
+
+
+def case(name, script, size):
+    """Register a case running snmp/*script*.  The decorated function takes
+    the number of items to generate and the scratch directory, and returns a
+    dict with the stand-ins' recordings ("commands": {command: [(args regex
+    or None, output bytes or None, exit status), ...]}) and optionally the
+    extend's "args" and module "overrides"."""
+
+    def register(setup):
+        CASES[name] = (script, setup, size)
+        return setup
+
+    return register
+
+
+def write_config(directory, name, config):
+    """Write the extend config *config* as JSON and return its path."""
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(config, handle)
+    return path
+
+
+@case("ss", "ss.py", 100000)
+def replay_ss(count, directory):
+    config = {
+        "ss_cmd": os.path.join(directory, "ss"),
+        "socket_types": "all",
+        "addr_families": "all",
+    }
+    return {
+        "commands": {
+            "ss": [
+                (r"^--tcp\b", fixtures.ss_sockets(count), 0),
+                (r"^--family inet\b", fixtures.ss_sockets(count, netids=True), 0),
+                (None, None, 0),
+            ]
+        },
+        "args": ["--config", write_config(directory, "ss.json", config)],
+    }
+
+
+@case("ss_split", "ss.py", 100000)
+def replay_ss_split(count, directory):
+    config = {
+        "ss_cmd": os.path.join(directory, "ss"),
+        "socket_types": "all",
+        "addr_families": "all",
+    }
+    outputs = fixtures.ss_split(fixtures.ss_dump(count))
+    return {
+        "commands": {
+            "ss": [
+                (r"^%s --all\b" % re.escape(args), output, 0)
+                for args, output in outputs.items()
+            ]
+        },
+        "args": ["--config", write_config(directory, "ss.json", config)],
+    }
+
+
+@case("ss_once", "ss.py", 100000)
+def replay_ss_once(count, directory):
+    config = {
+        "ss_cmd": os.path.join(directory, "ss"),
+        "socket_types": "all",
+        "addr_families": "all",
+        "backend": "ss-once",
+    }
+    return {
+        "commands": {"ss": [(None, fixtures.ss_dump(count), 0)]},
+        "args": ["--config", write_config(directory, "ss.json", config)],
+    }
+
+
+@case("ss_proc", "ss.py", 100000)
+def replay_ss_proc(count, directory):
+    config = {
+        "ss_cmd": os.path.join(directory, "ss"),
+        "socket_types": "all",
+        "addr_families": "all",
+        "backend": "proc",
+    }
+    proc_net = os.path.join(directory, "proc_net")
+    os.makedirs(proc_net, exist_ok=True)
+    for name, table in fixtures.proc_net(fixtures.ss_proc_dump(count)).items():
+        with open(os.path.join(proc_net, name), "wb") as handle:
+            handle.write(table)
+    return {
+        "commands": {},
+        "args": ["--config", write_config(directory, "ss.json", config)],
+        "overrides": {"PROC_NET_DIR": proc_net},
+    }
+
+
+@case("systemd", "systemd.py", 5000)
+def replay_systemd(count, directory):
+    config = {
+        "systemctl_cmd": os.path.join(directory, "systemctl"),
+        "include_inactive_units": "false",
+    }
+    return {
+        "commands": {"systemctl": [(None, fixtures.systemctl_units(count), 0)]},
+        "overrides": {"CONFIG_FILE": write_config(directory, "systemd.json", config)},
+    }
+
+
+@case("wireguard", "wireguard.py", 1000)
+def replay_wireguard(count, directory):
+    dump, names = fixtures.wg_dump(count)
+    config = {
+        "wg_cmd": os.path.join(directory, "wg"),
+        "public_key_to_arbitrary_name": names,
+    }
+    return {
+        "commands": {
+            "wg": [
+                (r"^show interfaces$", b"wg0\n", 0),
+                (r"^show wg0 dump$", dump, 0),
+            ]
+        },
+        "overrides": {"CONFIG_FILE": write_config(directory, "wireguard.json", config)},
+    }
+
+
+@case("linux_iw", "linux_iw.py", 50)
+def replay_linux_iw(count, directory):
+    # Every "station get" answers with the same recorded station; the extend
+    # files it under the MAC address from "station dump".
+    config = {"iw_cmd": os.path.join(directory, "iw")}
+    return {
+        "commands": {
+            "iw": [
+                (r"^dev$", fixtures.load("iw_dev.txt"), 0),
+                (r"^dev wlan0 info$", fixtures.load("iw_info.txt"), 0),
+                (r"^wlan0 survey dump$", fixtures.load("iw_survey_dump.txt"), 0),
+                (r"^dev wlan0 station dump$", fixtures.iw_station_dump(count), 0),
+                (r"^dev wlan0 station get ", fixtures.load("iw_station_get.txt"), 0),
+            ]
+        },
+        "overrides": {"CONFIG_FILE": write_config(directory, "linux_iw.json", config)},
+    }
+
+
+@case("pwrstatd", "pwrstatd.py", 1)
+def replay_pwrstatd(count, directory):
+    config = {"pwrstat_cmd": os.path.join(directory, "pwrstat")}
+    return {
+        "commands": {
+            "pwrstat": [(r"^-status$", fixtures.load("pwrstat_status.txt"), 0)]
+        },
+        "overrides": {"CONFIG_FILE": write_config(directory, "pwrstatd.json", config)},
+    }
+
+
+@case("storraid", "storraid.py", 240)
+def replay_storraid(count, directory):
+    return {
+        "commands": {
+            "storcli64": [
+                (r"^/call show all J$", fixtures.load("storcli_call_show_all.json"), 0),
+                (r"^/call/bbu show J$", fixtures.load("storcli_bbu_show.json"), 0),
+                (r"^/call/vALL show J$", fixtures.load("storcli_vall_show.json"), 0),
+                (r"^/call/eALL/sALL show all J$", fixtures.storcli_drives(count), 0),
+                # No CacheVault on this controller.
+                (None, None, 0),
+            ]
+        },
+        "overrides": {
+            "STORCLI_PATHS": [os.path.join(directory, "storcli64")],
+            "OUTPUT_PATH": os.path.join(directory, "storraid.json"),
+        },
+    }
+
+
+@case("zfs", "zfs-linux", 20)
+def replay_zfs(count, directory):
+    arcstats = os.path.join(directory, "arcstats")
+    with open(arcstats, "wb") as handle:
+        handle.write(fixtures.load("arcstats.txt"))
+    return {
+        "commands": {"zpool": [(r"^list -p -H$", fixtures.zpool_list(count), 0)]},
+        "overrides": {
+            "ARCSTATS": arcstats,
+            "ZPOOL_CMD": [os.path.join(directory, "zpool")],
+        },
+    }
+
+
+@case("chrony", "chrony", 8)
+def replay_chrony(count, directory):
+    sources, sourcestats = fixtures.chronyc_sources(count)
+    return {
+        "commands": {
+            "chronyc": [
+                (r"^-c tracking$", fixtures.load("chronyc_tracking.csv"), 0),
+                (r"^-c sources$", sources, 0),
+                (r"^-c sourcestats$", sourcestats, 0),
+            ]
+        },
+    }
+
+
+@case("docker", "docker-stats.py", 20)
+def replay_docker(count, directory):
+    return {
+        "commands": {
+            "docker": [
+                (r"^stats ", fixtures.docker_stats(count), 0),
+                (r"^inspect -s ", fixtures.load("docker_inspect.json"), 0),
+            ]
+        },
+    }
+
+
+@case("ntp_client", "ntp-client", 1)
+def replay_ntp_client(count, directory):
+    return {
+        "commands": {"ntpq": [(r"^-c rv\b", fixtures.load("ntpq_rv.txt"), 0)]},
+    }
+
+
+def install(directory, scenario, latency, jitter):
+    """Write the stand-ins and recordings of *scenario* to *directory*,
+    keeping those of other scenarios already installed there."""
+    commands = {}
+    with contextlib.suppress(FileNotFoundError):
+        with open(os.path.join(directory, "replay.json"), encoding="utf-8") as handle:
+            commands = json.load(handle)["commands"]
+    for command, recordings in scenario["commands"].items():
+        entries = []
+        for index, (args, output, status) in enumerate(recordings):
+            entry = {"args": args, "output": None, "exit": status}
+            if output is not None:
+                entry["output"] = "%s.%d.out" % (command, index)
+                with open(os.path.join(directory, entry["output"]), "wb") as handle:
+                    handle.write(output)
+            entries.append(entry)
+        commands[command] = entries
+        link = os.path.join(directory, command)
+        if os.path.lexists(link):
+            os.unlink(link)
+        os.symlink(FAKECMD, link)
+    replay = {
+        "latency": latency,
+        "jitter": jitter,
+        "log": SPAWN_LOG,
+        "commands": commands,
+    }
+    write_config(directory, "replay.json", replay)
+
+
+def extend_argv(script, scenario):
+    """The command line running *script* for *scenario*."""
+    path = os.path.join(SNMP_DIR, script)
+    args = scenario.get("args", [])
+    if scenario.get("overrides"):
+        overrides = json.dumps(scenario["overrides"])
+        return [sys.executable, RUNEXTEND, path, overrides] + args
+    with open(path, "r", encoding="utf-8") as handle:
+        shebang = handle.readline()
+    if "python" in shebang:
+        return [sys.executable, path] + args
+    return ["/bin/sh", path] + args
+
+
+def run_once(argv, directory, env):
+    """Run the extend once.  Returns (seconds, exit status, stdout, stderr,
+    stand-in invocations)."""
+    log = os.path.join(directory, SPAWN_LOG)
+    open(log, "w").close()
+    started = time.perf_counter()
+    proc = subprocess.run(
+        argv,
+        cwd=directory,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=RUN_TIMEOUT,
+    )
+    elapsed = time.perf_counter() - started
+    with open(log, "r", encoding="utf-8") as handle:
+        spawns = [line.split(" ", 1)[0] for line in handle]
+    return elapsed, proc.returncode, proc.stdout, proc.stderr, spawns
+
+
+def run_case(name, scale, repeat, latency, jitter):
+    script, setup, size = CASES[name]
+    items = max(1, int(size * scale))
+    with tempfile.TemporaryDirectory(prefix="replay-%s-" % name) as directory:
+        scenario = setup(items, directory)
+        install(directory, scenario, latency, jitter)
+        env = dict(os.environ)
+        env["PATH"] = directory + os.pathsep + env.get("PATH", os.defpath)
+        argv = extend_argv(script, scenario)
+
+        timings = []
+        for _ in range(repeat):
+            elapsed, status, stdout, stderr, spawns = run_once(argv, directory, env)
+            timings.append(elapsed)
+    timings.sort()
+    if status:
+        last = stderr.decode("utf-8", errors="replace").strip().splitlines()
+        print(
+            "%s: exit %d%s" % (name, status, ": " + last[-1] if last else ""),
+            file=sys.stderr,
+        )
+    by_command = {}
+    for command in spawns:
+        by_command[command] = by_command.get(command, 0) + 1
+    return {
+        "case": name,
+        "items": items,
+        "p50_ms": percentile(timings, 50) * 1000,
+        "p95_ms": percentile(timings, 95) * 1000,
+        "max_ms": timings[-1] * 1000,
+        "spawns": len(spawns),
+        "spawns_by_command": by_command,
+        "output_bytes": len(stdout),
+        "exit": status,
+    }
+
+
+def install_cases(names, directory, scale, latency, jitter):
+    """Install the stand-ins of *names* into *directory* and print how to run
+    each extend against them."""
+    os.makedirs(directory, exist_ok=True)
+    directory = os.path.abspath(directory)
+    for name in names:
+        script, setup, size = CASES[name]
+        scenario = setup(max(1, int(size * scale)), directory)
+        install(directory, scenario, latency, jitter)
+        argv = extend_argv(script, scenario)
+        command = " ".join(shlex.quote(arg) for arg in argv)
+        print("PATH=%s:$PATH %s" % (shlex.quote(directory), command))
+
+
+def print_table(results):
+    print(
+        "%-12s %7s %11s %11s %11s %7s %11s %5s"
+        % ("case", "items", "p50 ms", "p95 ms", "max ms", "spawns", "out bytes", "exit")
+    )
+    for r in results:
+        print(
+            "%-12s %7d %11.2f %11.2f %11.2f %7d %11d %5d"
+            % (
+                r["case"],
+                r["items"],
+                r["p50_ms"],
+                r["p95_ms"],
+                r["max_ms"],
+                r["spawns"],
+                r["output_bytes"],
+                r["exit"],
+            )
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark whole extends against replayed command output"
+    )
+    parser.add_argument(
+        "cases",
+        nargs="*",
+        help="Cases (or case prefixes) to run (default: all of %s)" % ", ".join(CASES),
+    )
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=5, help="Runs per case (default: 5)"
+    )
+    parser.add_argument(
+        "-s",
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiply the recorded output sizes by this factor (default: 1.0)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds every stand-in waits before answering (default: 0)",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="Vary the latency by up to this many seconds either way (default: 0)",
+    )
+    parser.add_argument(
+        "--install",
+        metavar="DIR",
+        help="Only install the stand-ins into DIR and print the extend commands",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    names = [
+        name
+        for name in CASES
+        if not args.cases or any(name.startswith(prefix) for prefix in args.cases)
+    ]
+    if not names:
+        print("No such case: %s" % ", ".join(args.cases), file=sys.stderr)
+        return 1
+    if args.install:
+        install_cases(names, args.install, args.scale, args.latency, args.jitter)
+        return 0
+    results = [
+        run_case(name, args.scale, max(1, args.repeat), args.latency, args.jitter)
+        for name in names
+    ]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Run an extend the way its __main__ block does, after replacing module-level
+settings it has no option for.
+
+    python3 bench/runextend.py snmp/systemd.py '{"CONFIG_FILE": "/tmp/s.json"}' [ARG...]
+
+The second argument is a JSON object of module attributes to set once the
+extend is imported; the remaining arguments become the extend's own.
+"""
+
+import inspect
+import json
+import os
+import sys
+
+
+def main():
+    script, overrides = sys.argv[1], json.loads(sys.argv[2])
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    from librenms_extend import loader, publish
+
+    module = loader.load_script(script)
+    for name, value in overrides.items():
+        setattr(module, name, value)
+    sys.argv = [script] + sys.argv[3:]
+    entry = module.main
+    if inspect.signature(entry).parameters:
+        # e.g. zfs-linux's main(args)
+        entry = lambda: module.main(sys.argv[1:])  # noqa: E731
+    return publish.run(entry)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Start-up benchmark for the Python extends.
+
+Most extends do a few milliseconds of real work, so starting the interpreter
+and importing modules is a large share of every poll.  For every extend in
+snmp/ with a __main__ guard, this loads the extend in a fresh interpreter
+without running main() and reports, over --repeat runs:
+
+  - the median time spent importing, from `python -X importtime`, less what
+    the measuring harness itself imports.  What it takes above the floor,
+    importing json and subprocess, is held to the extend's budget;
+  - the imports that cost the most;
+  - the median wall time of the whole process.
+
+    python3 bench/startup.py                        # every extend
+    python3 bench/startup.py ss systemd             # extends by prefix
+    python3 bench/startup.py --bundle extends.pyz   # loaded from a bundle
+
+With --bundle the extends in a bundle built by snmp/librenms_bundle.py are
+loaded from it, under `python -S -E` as the bundle runs them.
+The exit status is 1 if an extend is over its import budget.
+"""
+
+import argparse
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import zipfile
+
+from parsers import percentile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SNMP_DIR = os.path.join(os.path.dirname(BENCH_DIR), "snmp")
+
+# Import time budgets in milliseconds, over and above the floor: what json
+# and subprocess, which nearly every extend needs, take to import on this
+# host.  Extends built on asyncio or httpclient pay for them on every run.
+DEFAULT_BUDGET_MS = 12
+BUDGETS_MS = {
+    "adguard": 90,
+    "certificate.py": 90,
+    "seafile.py": 90,
+    "i2pd-stats.py": 50,
+    "routinator.py": 50,
+}
+FLOOR_MODULES = ("json", "subprocess")
+# Not measured: they import modules this host may not have.
+THIRD_PARTY = ("docker-stats.py", "puppet_agent.py", "supervisord.py")
+
+# Loads *path* without running main(); avoids runpy so only the extend's own
+# imports are measured.
+SCRIPT_HARNESS = """
+import sys
+path = sys.argv[1]
+sys.path.insert(0, path.rsplit("/", 1)[0])
+with open(path, "rb") as handle:
+    code = compile(handle.read(), path, "exec")
+exec(code, {"__name__": "startup", "__file__": path})
+"""
+BUNDLE_HARNESS = """
+import sys, zipimport
+sys.path.insert(0, sys.argv[1])
+from librenms_extend import bundle
+bundle.load(sys.argv[2], zipimport.zipimporter(sys.argv[1]), "startup")
+"""
+BASELINE_HARNESS = "import sys, zipimport"
+
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+def extends():
+    """The extend scripts in snmp/ that can be loaded without running."""
+    names = []
+    for name in sorted(os.listdir(SNMP_DIR)):
+        path = os.path.join(SNMP_DIR, name)
+        if not os.path.isfile(path) or name.startswith("librenms_"):
+            continue
+        with open(path, "r", encoding="utf-8", errors="replace") as handle:
+            source = handle.read()
+        if source.startswith("#!") and "python" in source.split("\n", 1)[0]:
+            if re.search(r"^if __name__ == .__main__.:", source, re.M):
+                names.append(name)
+    return names
+
+
+def bundled(path):
+    """The extends in the bundle at *path*."""
+    with zipfile.ZipFile(path) as archive:
+        source = archive.read("librenms_extend/_bundle_index.py").decode("utf-8")
+    return sorted(ast.literal_eval(source.split("=", 1)[1].strip()))
+
+
+def import_times(stderr):
+    """{top-level module: cumulative microseconds} from -X importtime."""
+    modules = {}
+    for line in stderr.decode("utf-8", errors="replace").splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match and not match.group(3):
+            modules[match.group(4)] = int(match.group(2))
+    return modules
+
+
+def run_harness(argv):
+    """Run *argv* once.  Returns (wall seconds, import times)."""
+    started = time.perf_counter()
+    proc = subprocess.run(
+        argv,
+        cwd=SNMP_DIR,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    elapsed = time.perf_counter() - started
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.decode("utf-8", errors="replace").strip())
+    return elapsed, import_times(proc.stderr)
+
+
+def harness_argv(name, bundle):
+    if bundle:
+        return [sys.executable, "-S", "-E", "-X", "importtime", "-c"] + [
+            BUNDLE_HARNESS,
+            os.path.abspath(bundle),
+            name,
+        ]
+    return [sys.executable, "-X", "importtime", "-c", SCRIPT_HARNESS] + [
+        os.path.join(SNMP_DIR, name)
+    ]
+
+
+def measure(name, bundle, repeat, baseline, floor):
+    """Load *name* *repeat* times; returns its result dict."""
+    walls = []
+    imports = []
+    heaviest = {}
+    for _ in range(repeat):
+        wall, modules = run_harness(harness_argv(name, bundle))
+        walls.append(wall)
+        own = {mod: us for mod, us in modules.items() if mod not in baseline}
+        imports.append(sum(own.values()))
+        for mod, us in own.items():
+            heaviest.setdefault(mod, []).append(us)
+    walls.sort()
+    imports.sort()
+    top = sorted(
+        ((percentile(sorted(us), 50), mod) for mod, us in heaviest.items()),
+        reverse=True,
+    )[:3]
+    import_ms = percentile(imports, 50) / 1000
+    budget = BUDGETS_MS.get(name, DEFAULT_BUDGET_MS)
+    return {
+        "extend": name,
+        "import_ms": import_ms,
+        "budget_ms": budget,
+        "over_budget": import_ms - floor > budget,
+        "wall_ms": percentile(walls, 50) * 1000,
+        "heaviest": ["%s %.1f" % (mod, us / 1000) for us, mod in top],
+    }
+
+
+def baseline(bundle, repeat):
+    """The harness's own (wall seconds, imported modules), and the floor in
+    milliseconds."""
+    argv = [sys.executable, "-X", "importtime", "-c", BASELINE_HARNESS]
+    if bundle:
+        argv[1:1] = ["-S", "-E"]
+    walls = []
+    modules = set()
+    for _ in range(repeat):
+        wall, times = run_harness(argv)
+        walls.append(wall)
+        modules.update(times)
+    argv[-1] += "; import " + ", ".join(FLOOR_MODULES)
+    floors = []
+    for _ in range(repeat):
+        _, times = run_harness(argv)
+        floors.append(sum(times.get(mod, 0) for mod in FLOOR_MODULES))
+    walls.sort()
+    floors.sort()
+    return percentile(walls, 50), modules, percentile(floors, 50) / 1000
+
+
+def print_table(results, base_wall, floor):
+    print(
+        "%-22s %10s %10s %10s  %s"
+        % ("extend", "import ms", "budget", "wall ms", "heaviest imports (ms)")
+    )
+    print("%-22s %10s %10s %10.1f" % ("(interpreter)", "", "", base_wall * 1000))
+    print("%-22s %10.1f" % ("(floor)", floor))
+    for r in results:
+        if "error" in r:
+            print("%-22s %s" % (r["extend"], r["error"]))
+            continue
+        print(
+            "%-22s %10.1f %9d%s %10.1f  %s"
+            % (
+                r["extend"],
+                r["import_ms"],
+                r["budget_ms"],
+                "!" if r["over_budget"] else " ",
+                r["wall_ms"],
+                ", ".join(r["heaviest"]),
+            )
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the extends' start-up")
+    parser.add_argument(
+        "extends", nargs="*", help="Extends (or prefixes) to load (default: all)"
+    )
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=9, help="Runs per extend (default: 9)"
+    )
+    parser.add_argument(
+        "--bundle", metavar="PATH", help="Load the extends from this bundle"
+    )
+    parser.add_argument(
+        "--all", action="store_true", help="Include extends needing third-party modules"
+    )
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.bundle:
+        names = bundled(args.bundle)
+    else:
+        names = [name for name in extends() if args.all or name not in THIRD_PARTY]
+    if args.extends:
+        names = [n for n in names if any(n.startswith(p) for p in args.extends)]
+    if not names:
+        print("No such extend: %s" % ", ".join(args.extends), file=sys.stderr)
+        return 1
+    repeat = max(1, args.repeat)
+    base_wall, base_modules, floor = baseline(args.bundle, repeat)
+    results = []
+    for name in names:
+        try:
+            results.append(measure(name, args.bundle, repeat, base_modules, floor))
+        except RuntimeError as err:
+            last = str(err).splitlines()[-1:] or [""]
+            results.append({"extend": name, "error": last[0]})
+    if args.json:
+        print(
+            json.dumps(
+                {
+                    "interpreter_ms": base_wall * 1000,
+                    "floor_ms": floor,
+                    "extends": results,
+                }
+            )
+        )
+    else:
+        print_table(results, base_wall, floor)
+    return 1 if any(r.get("over_budget") for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
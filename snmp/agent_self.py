@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+#
+# Name: LibreNMS Agent Self-Monitoring Script
+# Version: 1.0
+# Description: Reports what monitoring costs this host: the run time
+#              percentiles, timeouts, failures and output size of every Python
+#              extend that ran within the window, read from the run log the
+#              extends append to (see librenms_extend/runlog.py).
+# Installation:
+#     1. Copy this script and the librenms_extend directory to /etc/snmp/ and
+#        make the script executable:
+#         chmod +x /etc/snmp/agent_self.py
+#     2. Create the run log directory, writable only by root and snmpd's group
+#        (Debian-snmp on Debian and Ubuntu, snmpd on most others), and have it
+#        created again at boot:
+#         install -d -o root -g Debian-snmp -m 2770 /var/run/librenms-agent
+#         echo "d /run/librenms-agent 2770 root Debian-snmp -" \
+#             > /etc/tmpfiles.d/librenms-agent.conf
+#        Extends run by root or by snmpd append to
+#        /var/run/librenms-agent/agent_self.ring from then on; set
+#        LIBRENMS_RUNLOG in their environment to use another file, or to an
+#        empty string to turn recording off.  Extends run as any other user
+#        need to be in that group.
+#     3. Edit your snmpd.conf and include:
+#         extend agent_self /etc/snmp/agent_self.py
+#     4. (Optional) Add --window <seconds> to summarise a period other than the
+#        last 300 seconds, and --runlog <path> to read another file.
+#     5. Restart snmpd and activate the app for desired host.
+#
+# Output, per extend (durations in seconds):
+#     {"runs": 5, "p50": 0.412, "p95": 0.733, "max": 0.733, "errors": 0,
+#      "timeouts": 0, "command_timeouts": 1, "not_started": 0, "deferred": 0,
+#      "bytes": 10462, "bytes_max": 2100}
+# "timeouts" counts runs killed by the runner or the collector daemon,
+# "command_timeouts" runs that had one of their commands killed and
+# "deferred" runs skipped for host pressure (see librenms_extend/pressure.py).
+
+import json
+import sys
+import time
+import types
+
+from librenms_extend import envelope, publish, runlog
+
+DEFAULT_WINDOW = 300
+
+
+def error_handler(error_name, err):
+    """
+    error_handler(): Common error handler for config/output parsing and
+                     command execution.
+    Inputs:
+        error_name: String describing the error handled.
+        err: The error message in its entirety.
+    Outputs:
+        None
+    """
+    output_data = {
+        "errorString": f"{error_name}: '{err}'",
+        "error": 1,
+        "version": 1,
+        "data": {},
+    }
+    print(json.dumps(output_data))
+    sys.exit(1)
+
+
+def parse_args():
+    # snmpd runs this without arguments; argparse is only imported, at a
+    # cost of more than the summary itself, when there are some.
+    if len(sys.argv) == 1:
+        return types.SimpleNamespace(
+            window=DEFAULT_WINDOW, runlog=runlog.default_path()
+        )
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Extend Self-Monitoring Script for LibreNMS"
+    )
+    parser.add_argument(
+        "-w",
+        "--window",
+        type=float,
+        default=DEFAULT_WINDOW,
+        help="Seconds of runs to summarise (default: %d)" % DEFAULT_WINDOW,
+    )
+    parser.add_argument(
+        "-r",
+        "--runlog",
+        default=runlog.default_path(),
+        help="Path to the run log (default: %s)" % runlog.RUNLOG_PATH,
+    )
+    return parser.parse_args()
+
+
+def percentile(sorted_values, pct):
+    """
+    percentile(): Nearest-rank percentile of an already sorted list.
+
+    Inputs:
+        sorted_values: The sorted values.
+        pct: The percentile, 0-100.
+    Outputs:
+        The value at that rank.
+    """
+    rank = round(pct / 100 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(len(sorted_values) - 1, rank))]
+
+
+def summarise(runs):
+    """
+    summarise(): Aggregates the runs of one extend.
+
+    Inputs:
+        runs: The runlog.Run records of the extend.
+    Outputs:
+        summary: A dictionary of run counts, latency percentiles and sizes.
+    """
+    skipped = runlog.NOT_STARTED | runlog.DEFERRED
+    started = [run for run in runs if not run.flags & skipped]
+    durations = sorted(run.duration for run in started)
+    sizes = [run.size for run in started]
+    return {
+        "runs": len(started),
+        "p50": round(percentile(durations, 50), 3) if durations else None,
+        "p95": round(percentile(durations, 95), 3) if durations else None,
+        "max": round(durations[-1], 3) if durations else None,
+        "errors": sum(1 for run in started if run.exit),
+        "timeouts": sum(1 for run in runs if run.flags & runlog.TIMED_OUT),
+        "command_timeouts": sum(
+            1 for run in runs if run.flags & runlog.COMMAND_TIMEOUT
+        ),
+        "not_started": sum(1 for run in runs if run.flags & runlog.NOT_STARTED),
+        "deferred": sum(1 for run in runs if run.flags & runlog.DEFERRED),
+        "bytes": sum(sizes),
+        "bytes_max": max(sizes) if sizes else 0,
+    }
+
+
+def main():
+    """
+    main(): main function that reads the run log and prints the summary of
+            every extend as JSON.
+
+    Inputs:
+        None
+    Outputs:
+        None
+    """
+    args = parse_args()
+
+    try:
+        runs = runlog.read(args.runlog)
+    except OSError as err:
+        error_handler("Run Log Error", err)
+
+    since = time.time() - args.window
+    by_extend = {}
+    for run in runs:
+        if run.finished >= since:
+            by_extend.setdefault(run.name, []).append(run)
+
+    output_data = {
+        "errorString": "",
+        "error": 0,
+        "version": 1,
+        "data": {
+            "window": args.window,
+            "extends": {
+                name: summarise(extend_runs)
+                for name, extend_runs in sorted(by_extend.items())
+            },
+        },
+    }
+    print(envelope.encode(output_data))
+
+
+if __name__ == "__main__":
+    sys.exit(publish.run(main))
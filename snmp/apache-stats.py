@@ -17,32 +17,24 @@
 #
 #
 #
-import os
-import time
-import urllib.request
+# Requires the librenms_extend directory next to this script.
+#
+from librenms_extend import cache, httpclient
 
 cachetime = 30
+# Never reuse a copy older than this while another poll refreshes it.
+cachemaxstale = 300
 cachefile = "/var/cache/librenms/apache-snmp"
 
-# Check for a cache file newer than cachetime seconds ago
 
-if os.path.isfile(cachefile) and (time.time() - os.stat(cachefile)[8]) < cachetime:
-    # Use cached data
-    f = open(cachefile, "r")
-    data = f.read()
-    f.close()
-else:
-    # Grab the status URL (fresh data), needs package urllib3
-    data = (
-        urllib.request.urlopen("http://localhost/server-status?auto")
-        .read()
-        .decode("UTF-8")
-    )
-    # Write file
-    f = open(cachefile + ".TMP." + str(os.getpid()), "w")
-    f.write(data)
-    f.close()
-    os.rename(cachefile + ".TMP." + str(os.getpid()), cachefile)
+def fetch_status():
+    # Grab the status URL (fresh data)
+    return httpclient.get("http://localhost/server-status?auto").text("UTF-8")
+
+
+# Only one concurrent poll refetches an expired cache; the others reuse the
+# previous copy while it is being refreshed.
+data = cache.Cache(cachefile, ttl=cachetime, max_stale=cachemaxstale).get(fetch_status)
 
 
 # dice up the data
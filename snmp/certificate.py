@@ -4,8 +4,16 @@ import datetime
 import json
 import socket
 import ssl
+import sys
+
+from librenms_extend import aio, envelope, publish
 
 CONFIGFILE = "/etc/snmp/certificate.json"
+# Requires the librenms_extend directory next to this script.  To collect in the
+# background, run it from cron with --publish /var/run/librenms/certificate.json
+# (optionally --interval <seconds>) and use "extend certificate /bin/cat <file>".
+# All domains are checked concurrently, so a poll takes about as long as the
+# slowest handshake.
 # {"domains": [
 #     {"fqdn": "www.mydomain.com"},
 #     {"fqdn": "www2.mydomain.com"}
@@ -13,14 +21,8 @@ CONFIGFILE = "/etc/snmp/certificate.json"
 # }
 
 
-def get_certificate_data(domain, cert_location, port=443):
+async def get_certificate_data(domain, cert_location, port=443):
     context = ssl.create_default_context()
-    conn = context.wrap_socket(
-        socket.socket(socket.AF_INET),
-        server_hostname=domain,
-    )
-    # 3 second timeout because Lambda has runtime limitations
-    conn.settimeout(3.0)
 
     error_msg = None
     ssl_info = {}
@@ -34,8 +36,10 @@ def get_certificate_data(domain, cert_location, port=443):
             return ssl_info, error_msg
 
     try:
-        conn.connect((domain, port))
-        ssl_info = conn.getpeercert()
+        # 3 second timeout because Lambda has runtime limitations
+        ssl_info = await aio.open_tls(
+            domain, port, context, timeout=3.0, family=socket.AF_INET
+        )
     except ConnectionRefusedError as err:
         error_msg = err
     # Manage expired certificates
@@ -63,18 +67,33 @@ def main():
             output["errorString"] = "Configfile Error: '%s'" % err
 
     if not output["error"]:
-        output_data_list = []
-        for domain in configfile["domains"]:
-            output_data = {}
-
+        domains = configfile["domains"]
+        for domain in domains:
             if "port" not in domain.keys():
                 domain["port"] = 443
             if "cert_location" not in domain.keys():
                 domain["cert_location"] = None
-            certificate_data, error_msg = get_certificate_data(
-                domain["fqdn"], domain["cert_location"], domain["port"]
+
+        async def collect():
+            return await aio.gather(
+                [
+                    get_certificate_data(
+                        domain["fqdn"], domain["cert_location"], domain["port"]
+                    )
+                    for domain in domains
+                ]
             )
 
+        output_data_list = []
+        for domain, result in zip(domains, aio.run(collect)):
+            output_data = {}
+
+            if isinstance(result, Exception):
+                # e.g. a timeout or an unknown host
+                certificate_data, error_msg = {}, result
+            else:
+                certificate_data, error_msg = result
+
             output_data["cert_name"] = domain["fqdn"]
 
             if not error_msg:
@@ -101,8 +120,8 @@ def main():
 
         output["data"] = output_data_list
 
-    print(json.dumps(output))
+    print(envelope.encode(output))
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(publish.run(main))
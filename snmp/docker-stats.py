@@ -1,19 +1,59 @@
 #!/usr/bin/env python3
 import datetime
 import json
+import re
 import subprocess
-
-from dateutil import parser
-
+import sys
+
+from librenms_extend import envelope, publish, timing
+
+# Requires the librenms_extend directory next to this script.  `docker inspect -s`
+# is slow on hosts with many containers; to keep it off the poll path run this
+# from cron with --publish /var/run/librenms/docker.json (optionally --interval
+# <seconds>) and use "extend docker /bin/cat /var/run/librenms/docker.json".
+# Run it once with --memory (see librenms_extend/memprofile.py) to check its
+# peak memory on small hosts.  Add --splay <seconds> and --spacing <seconds> to
+# spread the guests of one hypervisor over the cycle and keep the collection
+# clear of the host's other heavy ones (see librenms_extend/schedule.py), and
+# --pressure io=20,load=1.5 to skip `docker inspect -s` while the host is
+# saturated (see librenms_extend/pressure.py).  Served from
+# librenms_collectord.py, the output must fit in the 4094 bytes snmpd reads of
+# a pass_persist value; on hosts with more containers set "compress": true for
+# it in that daemon's config, or keep the host on "extend" lines.
 VERSION = 2
 ONLY_RUNNING_CONTAINERS = True
 
 
 def run(cmd):
-    res = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+    with timing.command(cmd):
+        res = subprocess.check_output(cmd, stderr=subprocess.STDOUT)
     return res
 
 
+# Docker's RFC 3339 timestamps, e.g. 2024-05-01T10:20:30.123456789Z
+_TIMESTAMP = re.compile(
+    r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d+))?(Z|[+-]\d\d:\d\d)$"
+)
+
+
+def parse_time(text):
+    # datetime only takes microseconds and, before 3.11, no "Z"; dateutil,
+    # which takes anything, is only imported for what this does not match.
+    match = _TIMESTAMP.match(text)
+    if match:
+        seconds, fraction, zone = match.groups()
+        fraction = (fraction or "")[:6].ljust(6, "0")
+        zone = "+00:00" if zone == "Z" else zone
+        return datetime.datetime.strptime(
+            "%s.%s%s" % (seconds, fraction, zone.replace(":", "")),
+            "%Y-%m-%dT%H:%M:%S.%f%z",
+        )
+
+    from dateutil import parser
+
+    return parser.parse(text)
+
+
 def inspectContainer(container):
     raw = run(["docker", "inspect", "-s", container])
     data = json.loads(raw)
@@ -64,12 +104,12 @@ def dump():
         except subprocess.CalledProcessError:
             continue
 
-        started_at = parser.parse(inspected_container[0]["State"]["StartedAt"])
+        started_at = parse_time(inspected_container[0]["State"]["StartedAt"])
 
         if inspected_container[0]["State"]["Running"]:
             finished_at = datetime.datetime.now(started_at.tzinfo)
         else:
-            finished_at = parser.parse(inspected_container[0]["State"]["FinishedAt"])
+            finished_at = parse_time(inspected_container[0]["State"]["FinishedAt"])
 
         uptime = finished_at - started_at
 
@@ -97,7 +137,7 @@ def dump():
         )
 
     print(
-        json.dumps(
+        envelope.encode(
             {
                 "version": VERSION,
                 "data": containers,
@@ -109,4 +149,4 @@ def dump():
 
 
 if __name__ == "__main__":
-    dump()
+    sys.exit(publish.run(dump))
@@ -10,7 +10,7 @@
 #   Set I2P Control socket params below!
 #
 #   Installation:
-#       1. copy this file to /etc/snmp/i2pd-stats.py
+#       1. copy this file and the librenms_extend directory to /etc/snmp/
 #       2. chmod +x /etc/snmp/i2pd-stats.py
 #       3. edit /etc/snmp/snmpd.conf and add following line:
 #           extend i2pd /etc/snmp/i2pd-stats.py
@@ -20,14 +20,17 @@
 
 import json
 import os
-import ssl
-import urllib.error
-import urllib.parse
-import urllib.request
+
+from librenms_extend import cache, httpclient
 
 ######### CONFIGURATION ##############
 I2PC_URL = "https://127.0.0.1:7650/"
 I2PC_PASS = "itoopie"
+# RouterInfo is cached in /var/cache/librenms/i2pd so concurrent polls cost a
+# single I2PControl round trip; stale copies are served for at most
+# CACHE_MAX_STALE seconds while another poll refreshes it.
+CACHE_TTL = 30
+CACHE_MAX_STALE = 300
 ##### END OF CONFIGURATION ###########
 
 
@@ -65,19 +68,15 @@ class I2PControl(object):
         return self._token
 
     def do_post(self, url, data):
-        """HTTP(S) handler"""
-        req = urllib.request.Request(url, data=data.encode())
+        """HTTP(S) handler, authentication and request share one connection"""
         try:
-            with urllib.request.urlopen(
-                req, context=ssl._create_unverified_context(), timeout=5
-            ) as f:
-                resp = f.read().decode("utf-8")
-        except urllib.error.URLError:
-            post_error("2", "Unable to connect I2PControl socket!")
-            exit(1)
+            resp = httpclient.post(url, data, timeout=5, insecure=True).text()
         except TimeoutError:
             post_error("3", "Connection timed out to I2PControl socket!")
             exit(1)
+        except OSError:
+            post_error("2", "Unable to connect I2PControl socket!")
+            exit(1)
         return json.loads(resp)
 
     def request(self, method, params):
@@ -104,7 +103,14 @@ def main():
 
     ctl = I2PControl(I2PC_URL, I2PC_PASS)
 
-    resp = ctl.request("RouterInfo", JSON_REQUEST)["result"]
+    def fetch():
+        return json.dumps(ctl.request("RouterInfo", JSON_REQUEST)["result"])
+
+    try:
+        resp = json.loads(cache.Cache("i2pd", CACHE_TTL, CACHE_MAX_STALE).get(fetch))
+    except TimeoutError as err:
+        post_error("3", "Cache Error: '%s'" % err)
+        exit(1)
     resp_full = {"data": resp, "version": JSONVER, "error": "0", "errorString": ""}
 
     print(json.dumps(resp_full))
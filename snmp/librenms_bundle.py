@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+#
+# Name: LibreNMS Extend Bundler
+# Version: 1.0
+# Description: Packs Python extends and the librenms_extend directory into one
+#              executable zip archive with precompiled byte code, run with
+#              `python3 -S -E` so that every poll starts faster.
+# Installation:
+#     1. Copy this script and the librenms_extend directory to /etc/snmp/ and make
+#        the script executable:
+#         chmod +x /etc/snmp/librenms_bundle.py
+#     2. Bundle the extends the host runs, with the Python snmpd will run them
+#        with (the byte code is only used by that version):
+#         /usr/bin/python3 /etc/snmp/librenms_bundle.py -o /etc/snmp/extends.pyz \
+#             /etc/snmp/ss.py /etc/snmp/systemd.py /etc/snmp/zfs-linux
+#        Rebuild it whenever an extend or librenms_extend is updated.  Extends
+#        that import third-party modules are listed as such; they still work,
+#        but start without the -S saving.
+#     3. Point the extend lines in snmpd.conf at the bundle, naming the script
+#        as its first argument (other arguments follow it):
+#         extend ss /etc/snmp/extends.pyz ss.py
+#         extend zfs /etc/snmp/extends.pyz zfs-linux
+#        or keep the extend lines and put a symlink to the bundle where the
+#        script was.  The link replaces the script, which step 2 still needs
+#        for every rebuild, so move the script to a source directory first
+#        and bundle it from there:
+#         install -d /usr/local/lib/librenms-agent
+#         mv /etc/snmp/ss.py /usr/local/lib/librenms-agent/ss.py
+#         /usr/bin/python3 /etc/snmp/librenms_bundle.py -o /etc/snmp/extends.pyz \
+#             /usr/local/lib/librenms-agent/ss.py ...
+#         ln -s extends.pyz /etc/snmp/ss.py
+#        Configuration files are still looked up next to the bundle, as they
+#        were next to the scripts.  See librenms_extend/bundle.py.
+#     4. Restart snmpd.
+
+import sys
+
+from librenms_extend import bundle
+
+if __name__ == "__main__":
+    sys.exit(bundle.main())
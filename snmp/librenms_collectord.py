@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+#
+# Name: LibreNMS Collector Daemon
+# Version: 1.0
+# Description: Keeps the Python extends loaded in one long-running process, runs
+#              each of them on its own interval and answers snmpd from memory via
+#              pass_persist, instead of snmpd starting a new interpreter for every
+#              extend on every poll.
+# Installation:
+#     1. Copy this script and the librenms_extend directory to /etc/snmp/ and make
+#        the script executable:
+#         chmod +x /etc/snmp/librenms_collectord.py
+#     2. Create /etc/snmp/librenms_collectord.json listing the extends to serve.
+#        The key is the extend name LibreNMS polls (the name that used to follow
+#        "extend" in snmpd.conf).  Each extend takes:
+#           a.) "script"   - Path to a Python extend, loaded once and run in-process.
+#           b.) "command"  - Alternatively, a command list run as a subprocess
+#                            (for shell/perl extends).
+#           c.) "args"     - (optional) Extra arguments for the script or command.
+#           d.) "interval" - (optional) Seconds between collections [300].
+#           e.) "entry"    - (optional) Function to call in the script ["main"].
+#                            Scripts without it are re-executed as a whole.
+#           f.) "timeout"  - (optional) Seconds before a "command" is killed [30].
+#           g.) "splay", "jitter", "spacing" - (optional) Spread the collections
+#                            over time, see librenms_extend/schedule.py.
+#           h.) "pressure" - (optional) Serve the last result while the host is
+#                            over thresholds such as {"io": 20, "load": 1.5}, see
+#                            librenms_extend/pressure.py.
+#           i.) "compress" - (optional) gzip+base64 encode the output, which
+#                            LibreNMS detects by itself [false].
+#           j.) "labels"   - (optional) OpenMetrics label names for the levels
+#                            of the extend's data, e.g. ["interface", "client"];
+#                            see step 5.
+#         ```
+#         {
+#             "extends": {
+#                 "ss": {"script": "/etc/snmp/ss.py", "interval": 300},
+#                 "systemd": {"script": "/etc/snmp/systemd.py", "interval": 60},
+#                 "docker": {"script": "/etc/snmp/docker-stats.py", "entry": "dump"},
+#                 "zfs": {"script": "/etc/snmp/zfs-linux"},
+#                 "osupdate": {"command": ["/etc/snmp/osupdate"], "interval": 3600}
+#             }
+#         }
+#         ```
+#     3. Remove the matching "extend" lines from snmpd.conf and add:
+#         pass_persist .1.3.6.1.4.1.8072.1.3.2 /etc/snmp/librenms_collectord.py
+#        This serves nsExtendOutput1Table and nsExtendOutput2Table, which hides
+#        any remaining "extend" lines, so move every extend of the host into the
+#        config.
+#        Output size limit: snmpd reads at most 4094 bytes of each value, and
+#        output of more than one line takes three bytes per byte, so about 1364.
+#        LibreNMS reads nsExtendOutputFull.  An output that does not fit there
+#        is served line by line in nsExtendOutLine only, and reported on
+#        stderr; lines that do not fit are left out.  For an extend that prints
+#        more as one JSON line, set "compress": true.  If it still does not
+#        fit, keep that host on snmpd's "extend" lines (optionally with
+#        librenms_runner.py) instead of this daemon.
+#     4. Restart snmpd.  Results are available once each extend has run once.
+#     5. (Optional) To have Prometheus scrape the same results, add
+#         "openmetrics": "127.0.0.1:9923"
+#        next to "extends".  The numbers of every extend's output are then served
+#        in OpenMetrics text format at http://127.0.0.1:9923/metrics, rendered
+#        once per collection (see librenms_extend/openmetrics.py).  Only this
+#        daemon serves the endpoint: extends still run from snmpd's "extend"
+#        lines are not in it.  Each level of an extend's data becomes a label,
+#        named by the extend's "labels", by the built-in names for systemd, ss
+#        and wireguard, or else key1, key2, ... by depth.
+
+import sys
+
+from librenms_extend import daemon
+
+if __name__ == "__main__":
+    sys.exit(daemon.main())
@@ -0,0 +1,19 @@
+"""
+Shared helpers for the LibreNMS Python snmp extends.
+
+The extends in this directory are single-file scripts that snmpd runs once per
+poll.  This package holds the machinery they share: loading an extend in a
+long-lived process, serving results to snmpd over pass_persist, and so on.
+
+Installation:
+    Copy this directory next to the extends that use it, e.g.
+    /etc/snmp/librenms_extend/.  Python puts the directory of the running
+    script first on sys.path, so `import librenms_extend` resolves without
+    any further setup.
+
+    The extends that import this package do not run without it.  To install
+    them as a single file, pack them and the package into one archive with
+    librenms_bundle.py (see bundle.py).
+
+Requires: Python >= 3.7
+"""
@@ -0,0 +1,126 @@
+"""
+Concurrent network calls for extends that query several endpoints.
+
+An extend that asks N servers one after the other takes the sum of N round
+trips.  Under one event loop the requests overlap and a poll costs roughly
+the slowest of them:
+
+    from librenms_extend import aio, httpclient
+
+    async def collect():
+        return await aio.gather(
+            [aio.call(httpclient.get, url) for url in urls], timeout=5
+        )
+
+    results = aio.run(collect)
+
+run() is the synchronous entry point the extends' main() (and so snmpd, the
+runner and the daemon) call.  gather() runs the awaitables concurrently under
+one shared deadline: whatever has not finished when it passes is cancelled
+and reported as a TimeoutError, and a failure is returned in place of its
+result instead of aborting the others.
+
+Blocking calls (httpclient, xmlrpc, ...) go through call(), which runs them
+in a daemon thread; a call cancelled at the deadline is abandoned rather than
+waited for, so it cannot hold the extend's exit past it.  open_tls() opens a
+TLS connection natively on the loop.
+"""
+
+import asyncio
+import threading
+
+# Concurrent calls per gather(), so a long list of endpoints does not turn
+# into as many threads and connections at once.
+DEFAULT_LIMIT = 16
+
+
+def run(main, timeout=None):
+    """Run the coroutine function *main* on a new event loop and return its
+    result.  Raises TimeoutError if it takes longer than *timeout* seconds."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(asyncio.wait_for(main(), timeout))
+    except asyncio.TimeoutError:
+        raise TimeoutError("not done within %ss" % timeout) from None
+    finally:
+        loop.close()
+
+
+async def gather(aws, timeout=None, limit=DEFAULT_LIMIT):
+    """Run *aws* concurrently, at most *limit* at a time, and return their
+    results in order.  A failed one's exception is returned in its place;
+    those not done after *timeout* seconds are cancelled and get a
+    TimeoutError."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def limited(aw):
+        async with semaphore:
+            return await aw
+
+    tasks = [asyncio.ensure_future(limited(aw)) for aw in aws]
+    if not tasks:
+        return []
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+
+    results = []
+    for task in tasks:
+        if task in pending:
+            results.append(TimeoutError("not done within %ss" % timeout))
+        elif task.exception() is not None:
+            results.append(task.exception())
+        else:
+            results.append(task.result())
+    return results
+
+
+def _settle(future, result, error):
+    if future.done():
+        return  # cancelled in the meantime
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+async def call(function, *args, **kwargs):
+    """Await the blocking *function*(*args, **kwargs), run in a daemon
+    thread."""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def work():
+        result, error = None, None
+        try:
+            result = function(*args, **kwargs)
+        except Exception as err:
+            error = err
+        try:
+            loop.call_soon_threadsafe(_settle, future, result, error)
+        except RuntimeError:
+            pass  # the loop is gone: the call was abandoned
+
+    threading.Thread(target=work, name="aio-call", daemon=True).start()
+    return await future
+
+
+async def open_tls(host, port, context, timeout=None, family=0):
+    """Complete a TLS handshake with *host*:*port* and return the peer's
+    certificate as ssl.SSLSocket.getpeercert() does."""
+    try:
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                host, port, ssl=context, server_hostname=host, family=family
+            ),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        raise TimeoutError("TLS handshake timed out after %ss" % timeout) from None
+    try:
+        return writer.get_extra_info("peercert")
+    finally:
+        # Nothing was sent: drop the connection without a TLS shutdown.
+        writer.transport.abort()
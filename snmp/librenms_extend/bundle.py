@@ -0,0 +1,214 @@
+"""
+Pack the Python extends into one precompiled, executable zip archive.
+
+snmpd starts a new interpreter for every extend on every poll.  Much of that
+start-up goes into finding and compiling modules: `site` scanning
+site-packages, and the byte code caches next to every script, which are
+missing or stale wherever /etc/snmp is read-only to snmpd.  A bundle carries
+the extends and the librenms_extend package with their byte code compiled
+ahead of time (unchecked hash-based .pyc files, so nothing is stat()ed to
+validate them), and runs them with `python3 -S -E`: no site-packages, no
+PYTHON* environment variables.  An extend that imports modules from
+site-packages (dateutil, yaml, ...) has `site` set up again before it
+loads; the bundle records which ones do when it is built.
+
+    librenms_bundle.py -o /etc/snmp/extends.pyz /etc/snmp/ss.py /etc/snmp/systemd.py
+
+    extend ss /etc/snmp/extends.pyz ss.py
+    extend systemd /etc/snmp/extends.pyz systemd.py
+
+An extend also runs through a symlink to the bundle named like it.  The
+link takes the script's place, so the script is bundled from elsewhere:
+
+    librenms_bundle.py -o /etc/snmp/extends.pyz /usr/local/lib/librenms-agent/ss.py
+    ln -s extends.pyz /etc/snmp/ss.py
+
+build() refuses a script that is the bundle, i.e. such a link.
+
+Either way the extend sees the arguments that follow, and a __file__ and
+sys.argv[0] in the bundle's directory, as if it had been run from there.
+The .pyc files are only used by the Python version that built the bundle;
+any other version compiles the sources in the bundle instead.
+"""
+
+import os
+import sys
+import types
+
+# Every run of a bundled extend imports this module for dispatch(): what only
+# build() needs is imported there.
+
+DEFAULT_INTERPRETER = "/usr/bin/python3 -SE"
+INDEX_MODULE = "_bundle_index"
+PACKAGE = "librenms_extend"
+
+MAIN = """\
+import sys
+
+from librenms_extend import bundle
+
+sys.exit(bundle.dispatch(sys.argv, __loader__))
+"""
+
+
+def _imported(source):
+    """The top-level names of the modules *source* imports, at any depth."""
+    import ast
+
+    names = set()
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+            names.add(node.module.split(".")[0])
+    return names
+
+
+def _in_stdlib(name):
+    import importlib.util
+    import sysconfig
+
+    if name in sys.builtin_module_names or name == PACKAGE:
+        return True
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        spec = None
+    if spec is None:
+        # Not installed on the building host: most likely site-packages.
+        return False
+    if spec.origin in (None, "built-in", "frozen"):
+        return True
+    stdlib = os.path.realpath(sysconfig.get_paths()["stdlib"])
+    origin = os.path.realpath(spec.origin)
+    return origin.startswith(stdlib + os.sep) and "site-packages" not in origin
+
+
+def needs_site(source):
+    """Whether *source* imports a module from outside the standard
+    library."""
+    return not all(_in_stdlib(name) for name in _imported(source))
+
+
+def _add(root, name, source):
+    """Write *source* to *root*/*name* and compile it next to it."""
+    import py_compile
+
+    path = os.path.join(root, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write(source)
+    py_compile.compile(
+        path,
+        cfile=path + "c",
+        dfile=name,
+        doraise=True,
+        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+    )
+
+
+def _read(path):
+    with open(path, "r", encoding="utf-8") as handle:
+        return handle.read()
+
+
+def build(output, scripts, interpreter=DEFAULT_INTERPRETER):
+    """Write the bundle of *scripts* to *output*.  Returns {extend name:
+    (module name, needs site)}."""
+    import tempfile
+    import zipapp
+
+    from librenms_extend import loader
+
+    index = {}
+    with tempfile.TemporaryDirectory() as root:
+        package = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(package)):
+            if name.endswith(".py") and name != INDEX_MODULE + ".py":
+                source = _read(os.path.join(package, name))
+                _add(root, os.path.join(PACKAGE, name), source)
+        for path in scripts:
+            if os.path.exists(output) and os.path.samefile(path, output):
+                raise OSError("%s: is the bundle, not an extend's source" % path)
+            source = _read(path)
+            module = loader.module_name(path)
+            _add(root, module + ".py", source)
+            index[os.path.basename(path)] = (module, needs_site(source))
+        source = "EXTENDS = %r\n" % (index,)
+        _add(root, os.path.join(PACKAGE, INDEX_MODULE + ".py"), source)
+        _add(root, "__main__.py", MAIN)
+        zipapp.create_archive(root, output, interpreter)
+    return index
+
+
+def load(name, importer, run_name="__main__"):
+    """Run the bundled extend *name* from the bundle *importer* (a
+    zipimporter) as the module *run_name*."""
+    from librenms_extend._bundle_index import EXTENDS
+
+    module_name, site_needed = EXTENDS[name]
+    if site_needed and sys.flags.no_site:
+        import site
+
+        site.main()
+    code = importer.get_code(module_name)
+    module = types.ModuleType(run_name)
+    module.__file__ = os.path.join(os.path.dirname(importer.archive), name)
+    module.__loader__ = importer
+    sys.modules[run_name] = module
+    sys.argv[0] = module.__file__
+    exec(code, module.__dict__)
+
+
+def dispatch(argv, importer):
+    """Run the extend named by the bundle's *argv*: the name it was run as,
+    or else its first argument."""
+    from librenms_extend._bundle_index import EXTENDS
+
+    name = os.path.basename(argv[0])
+    if name not in EXTENDS:
+        if len(argv) < 2 or argv[1] not in EXTENDS:
+            print(
+                "usage: %s EXTEND [ARG...]\nextends: %s"
+                % (name, " ".join(sorted(EXTENDS))),
+                file=sys.stderr,
+            )
+            return 2
+        name = argv[1]
+        del argv[1]
+    load(name, importer)
+    return 0
+
+
+def parse_args():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Bundle Python extends into one precompiled zip archive"
+    )
+    parser.add_argument("scripts", nargs="+", help="Extend scripts to bundle")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="extends.pyz",
+        help="Path of the bundle (default: extends.pyz)",
+    )
+    parser.add_argument(
+        "-p",
+        "--python",
+        default=DEFAULT_INTERPRETER,
+        help="Interpreter line of the bundle (default: %s)" % DEFAULT_INTERPRETER,
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        index = build(args.output, args.scripts, args.python)
+    except (OSError, SyntaxError, UnicodeDecodeError) as err:
+        print("Bundle Error: '%s'" % err, file=sys.stderr)
+        return 1
+    for name, (_, site_needed) in sorted(index.items()):
+        print("%s%s" % (name, " (imports site-packages)" if site_needed else ""))
+    return 0
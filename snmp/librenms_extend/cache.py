@@ -0,0 +1,109 @@
+"""
+Single-flight, stale-while-revalidate cache for extends that query a service.
+
+When several pollers hit snmpd at once, every extend run used to refetch the
+upstream status page as soon as its cache expired.  Cache.get() makes sure
+only one of them does:
+
+  - a copy younger than the TTL is returned as is;
+  - otherwise the first run to take the flock on <path>.lock refreshes it,
+    while concurrent runs return the stale copy instead of waiting, provided
+    it is younger than max_stale;
+  - a copy older than max_stale is never returned, so those runs wait for the
+    refresher to finish and use its result, but for at most `wait` seconds:
+    past that they raise TimeoutError, which the extend reports as an error,
+    instead of piling up behind a refresher that hangs;
+  - if the refresh itself fails, the error is raised even when a stale copy
+    exists, so the extend reports the outage instead of the last good data.
+
+If the cache directory is missing or not writable the cache is bypassed and
+every run fetches, which is how the extends behaved before.
+"""
+
+import fcntl
+import os
+import time
+
+from librenms_extend import publish
+
+CACHE_DIR = "/var/cache/librenms"
+DEFAULT_TTL = 30
+DEFAULT_MAX_STALE = 300
+DEFAULT_WAIT = 5
+# Seconds between attempts to take the lock from the refreshing run.
+LOCK_POLL = 0.05
+
+
+class Cache(object):
+    """A cached copy of one upstream document, stored as text in a file."""
+
+    def __init__(
+        self, path, ttl=DEFAULT_TTL, max_stale=DEFAULT_MAX_STALE, wait=DEFAULT_WAIT
+    ):
+        # A bare name is stored in the shared cache directory.
+        self.path = path if os.path.isabs(path) else os.path.join(CACHE_DIR, path)
+        self.ttl = ttl
+        self.max_stale = max(max_stale, ttl)
+        self.wait = wait
+
+    def read(self):
+        """Return (age in seconds, text) of the cached copy, or (None, None)."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as handle:
+                age = time.time() - os.fstat(handle.fileno()).st_mtime
+                return age, handle.read()
+        except OSError:
+            return None, None
+
+    def wait_lock(self, lock):
+        """Take the flock on *lock* once the refreshing run releases it.
+        Raises TimeoutError if it still holds it after self.wait seconds."""
+        deadline = time.monotonic() + self.wait
+        while True:
+            time.sleep(LOCK_POLL)
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(
+                        "%s: still being refreshed by another run after %gs"
+                        % (self.path, self.wait)
+                    )
+
+    def get(self, fetch):
+        """Return the cached text, calling *fetch* (which must return str) to
+        refresh it when needed.  A TTL of 0 or less disables caching."""
+        if self.ttl <= 0:
+            return fetch()
+
+        age, text = self.read()
+        if age is not None and age < self.ttl:
+            return text
+
+        try:
+            lock = open(self.path + ".lock", "a")
+        except OSError:
+            return fetch()
+
+        with lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Someone else is refreshing: serve stale if we may.
+                if age is not None and age < self.max_stale:
+                    return text
+                self.wait_lock(lock)
+
+            # The previous holder may have just refreshed it.
+            age, text = self.read()
+            if age is not None and age < self.ttl:
+                return text
+
+            # Errors propagate: a dead service must not look healthy.
+            fresh = fetch()
+            try:
+                publish.write_atomic(self.path, fresh, end="")
+            except OSError:
+                pass  # Non-fatal: the caller still gets fresh data
+            return fresh
@@ -0,0 +1,222 @@
+"""
+Resident collector daemon.
+
+Loads every configured extend once, runs each on its own interval in a
+background thread, and answers snmpd from the in-memory results through the
+pass_persist protocol.  A walk therefore costs a dictionary lookup instead of
+an interpreter start-up per extend.
+
+The results are published under NET-SNMP-EXTEND-MIB::nsExtendOutput1Table,
+and line by line under nsExtendOutput2Table, with the same index snmpd uses
+for `extend` lines, so LibreNMS finds them exactly where it looks today.
+snmpd reads at most 4094 bytes of a value over pass_persist: an output that
+does not fit in nsExtendOutputFull is only served line by line (see
+passpersist.py).  Registering the daemon on nsExtendObjects hides snmpd's
+own `extend` entries, so every extend the host serves has to move into the
+daemon's config; non-Python extends can be listed with "command".
+
+Every collection is recorded in the run log read by agent_self.py (see
+runlog.py).  With "openmetrics" set, the same results are also served to
+Prometheus over HTTP (see openmetrics.py).
+
+An extend's "splay" and "jitter" move its collections off the moment the
+daemon starts and off each other, and "spacing" keeps it from running at the
+same time as the host's other heavy collections (see schedule.py); it waits
+for its turn no longer than until the next extend is due, and tries again a
+few seconds later, so the others never stall behind it.  One
+with "pressure" thresholds keeps serving its last result, marked as deferred,
+while the host is over them, and is checked again a minute later (see
+pressure.py).
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+
+from librenms_extend import (
+    executor,
+    loader,
+    openmetrics,
+    passpersist,
+    pressure,
+    runlog,
+    schedule,
+)
+
+DEFAULT_CONFIG_FILE = "/etc/snmp/librenms_collectord.json"
+DEFAULT_INTERVAL = 300
+# Seconds before an extend that did not get its heavy slot turn tries again.
+SPACING_RETRY = 5
+
+
+def config_file_parser(config_path):
+    """Return the configured extends, in config file order, and the address
+    to serve OpenMetrics on (None if not configured)."""
+    with open(config_path, "r", encoding="utf-8") as json_file:
+        config = json.load(json_file)
+    extends = []
+    for name, extend_config in config["extends"].items():
+        extend_config.setdefault("interval", DEFAULT_INTERVAL)
+        extend = loader.Extend.from_config(name, extend_config)
+        if extend.script:
+            # Load up front so a broken script fails at start-up.
+            extend.load()
+        extends.append(extend)
+    return extends, config.get("openmetrics")
+
+
+class Collector(object):
+    """Runs extends on their intervals and keeps the OID table current."""
+
+    def __init__(self, extends, runlog_path=""):
+        self.extends = extends
+        self.runlog_path = runlog_path
+        self.table = passpersist.OidTable()
+        self.metrics = openmetrics.Snapshot()
+        # name -> its OpenMetrics label names, where configured
+        self.labels = {
+            extend.name: extend.labels for extend in extends if extend.labels
+        }
+        self.results = {}
+        # name -> its nsExtendOutput1Table and nsExtendOutput2Table rows
+        self._rows = {}
+        self._collected = {}
+        self._stop = threading.Event()
+        # name -> when it first missed its heavy slot turn
+        self._waiting = {}
+        now = time.monotonic()
+        self._due = {
+            extend.name: now
+            + schedule.offset(extend.splay, extend.name)
+            + schedule.jitter(extend.jitter)
+            for extend in extends
+        }
+
+    def collect(self, extend):
+        """Run *extend* once and publish its result."""
+        started = time.monotonic()
+        output, code = extend.run()
+        self.record(extend, time.monotonic() - started, output, code)
+        self._collected[extend.name] = time.time()
+        self.publish(extend, output, code)
+
+    def collect_spaced(self, extend):
+        """Collect *extend* in its heavy slot turn, see schedule.py.  Returns
+        False if the turn did not come before the next extend is due; once
+        it has waited an interval it is collected regardless."""
+        now = time.monotonic()
+        limit = min(
+            [extend.interval]
+            + [due - now for name, due in self._due.items() if name != extend.name]
+        )
+        waiting = self._waiting.setdefault(extend.name, now)
+        with schedule.spaced(extend.spacing, max(0.0, limit)) as turn:
+            if not turn and now - waiting < extend.interval:
+                return False
+            self.collect(extend)
+        del self._waiting[extend.name]
+        return True
+
+    def defer(self, extend):
+        """Publish the last result of *extend* again, marked as deferred, if
+        the host is over its pressure thresholds.  Returns whether it did."""
+        if extend.pressure is None or extend.name not in self.results:
+            return False
+        output, code = self.results[extend.name]
+        collected = self._collected[extend.name]
+        output = pressure.defer(extend.pressure, output, collected, extend.name)
+        if output is None:
+            return False
+        size = len(output.encode("utf-8"))
+        runlog.append(extend.name, 0.0, code, size, runlog.DEFERRED, self.runlog_path)
+        self.publish(extend, output, code)
+        return True
+
+    def publish(self, extend, output, code):
+        """Make *output* the current result of *extend*."""
+        self.results[extend.name] = (output, code)
+        self._rows[extend.name] = passpersist.extend_rows(extend.name, output, code)
+        rows = [passpersist.num_entries_row(len(self.extends))]
+        rows.extend(row for table in self._rows.values() for row in table)
+        self.table.update(rows)
+        self.metrics.update(self.results, self.labels)
+
+    def record(self, extend, duration, output, code):
+        """Append a collection to the run log."""
+        flags = 0
+        if code == loader.TIMEOUT_STATUS:
+            flags |= runlog.TIMED_OUT
+        # In-process runs start with executor.reset(), see loader.call_captured().
+        if extend.script and executor.timeout_count():
+            flags |= runlog.COMMAND_TIMEOUT
+        size = len(output.encode("utf-8"))
+        runlog.append(extend.name, duration, code, size, flags, self.runlog_path)
+
+    def run(self):
+        """Scheduler loop; returns once stop() has been called."""
+        while not self._stop.is_set():
+            for extend in self.extends:
+                if self._stop.is_set():
+                    return
+                if self._due[extend.name] > time.monotonic():
+                    continue
+                if self.defer(extend):
+                    retry = min(extend.interval, pressure.RETRY_INTERVAL)
+                    self._due[extend.name] = time.monotonic() + retry
+                    continue
+                if not self.collect_spaced(extend):
+                    self._due[extend.name] = time.monotonic() + SPACING_RETRY
+                    continue
+                self._due[extend.name] = (
+                    time.monotonic() + extend.interval + schedule.jitter(extend.jitter)
+                )
+            self._stop.wait(max(0.0, min(self._due.values()) - time.monotonic()))
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name="collector", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Resident LibreNMS extend collector for snmpd pass_persist"
+    )
+    parser.add_argument(
+        "-c",
+        "--config",
+        default=DEFAULT_CONFIG_FILE,
+        help="Path to configuration JSON file (default: %s)" % DEFAULT_CONFIG_FILE,
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        extends, metrics_address = config_file_parser(args.config)
+    except (KeyError, TypeError, ValueError, OSError, SyntaxError) as err:
+        print("Config File Error: '%s'" % err, file=sys.stderr)
+        return 1
+
+    # Extends print through a redirected sys.stdout, so keep hold of the real
+    # one for the protocol.
+    stdout = sys.stdout
+    collector = Collector(extends, runlog.take_over())
+    if metrics_address:
+        try:
+            openmetrics.serve(collector.metrics, metrics_address)
+        except (OSError, ValueError) as err:
+            print("OpenMetrics Error: '%s'" % err, file=sys.stderr)
+            return 1
+    collector.start()
+    try:
+        passpersist.serve(collector.table, sys.stdin, stdout)
+    finally:
+        collector.stop()
+    return 0
@@ -0,0 +1,138 @@
+"""
+Encode an extend's output for LibreNMS, as JSON or gzip+base64 compressed.
+
+LibreNMS accepts an extend's JSON either as is or gzipped and base64
+encoded, which it detects by itself.  encode() prints the JSON as is unless
+the extend asks for compression:
+
+    from librenms_extend import envelope
+    print(envelope.encode({"version": 1, "error": 0, "errorString": "",
+                           "data": data}))
+
+Compression is opt-in, so an extend's output stays in the form its pollers
+know.  Extends that always compressed pass compress=True; for the others,
+every extend run through publish.run() takes -Z (or --compress), and the
+collector daemon takes "compress": true per extend, both through
+compressed().
+
+  - The gzip level follows the payload size and a CPU budget: the highest of
+    9, 6 and 1 expected to compress the payload within DEFAULT_BUDGET
+    seconds, so small documents get the best ratio and multi-megabyte ones
+    are not held up by it.
+  - The compressed text is remembered in memory, so the collector daemon and
+    publish --interval loops compress again only when the data changed.
+    Nothing is kept on disk.
+  - Under --timings (see timing.py) the encode phase reports the sizes, the
+    ratio, the level and whether the memo was used.
+
+decode() turns either form back into the JSON text.
+"""
+
+import binascii
+import json
+import os
+import re
+import sys
+import zlib
+
+from librenms_extend import timing
+
+DEFAULT_BUDGET = 0.01
+# (level, conservative bytes per second compressing JSON), best ratio first.
+LEVELS = ((9, 20e6), (6, 80e6), (1, 150e6))
+# From this size on, the memo keeps a hash of the JSON text instead of the
+# text itself.
+DIGEST_MIN_SIZE = 64 * 1024
+
+_BASE64 = re.compile(r"[A-Za-z0-9+/\n]+=*\n*")
+
+# gzip container, see zlib.compressobj()
+_GZIP_WBITS = 31
+# zlib or gzip container, whichever it is
+_ANY_WBITS = 47
+
+# name -> (JSON text or its digest, compressed) of the last document
+# compressed by each extend.
+_memo = {}
+
+
+def level_for(size, budget=DEFAULT_BUDGET):
+    """The gzip level to compress *size* bytes with, within *budget*
+    seconds."""
+    for level, rate in LEVELS:
+        if size <= rate * budget:
+            return level
+    return LEVELS[-1][0]
+
+
+def gzip_base64(payload, level):
+    """gzip and base64 encode the bytes *payload*."""
+    # zlib and binascii rather than gzip and base64, which take longer to
+    # import than a small document takes to compress.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+    gzipped = compressor.compress(payload) + compressor.flush()
+    return binascii.b2a_base64(gzipped, newline=False).decode("ascii")
+
+
+def encode(document, name=None, compress=False, budget=DEFAULT_BUDGET):
+    """Return the text to print for *document*, a JSON-serialisable object
+    or its JSON text: the JSON itself, or with *compress* the JSON gzipped
+    and base64 encoded.  *name* keys the memo (the script's file name by
+    default)."""
+    with timing.phase("encode"):
+        text = document if isinstance(document, str) else json.dumps(document)
+        payload = text.encode("utf-8")
+        name = name or os.path.basename(sys.argv[0])
+
+        memoized = False
+        level = None
+        encoded = text
+        if compress:
+            digest = None
+            if len(payload) >= DIGEST_MIN_SIZE:
+                # Imported here: small documents, the usual case, never need it.
+                import hashlib
+
+                digest = hashlib.sha1(payload).hexdigest()
+            # Small documents are remembered as they are.
+            key = digest or text
+            memoized = _memo.get(name, (None,))[0] == key
+            if memoized:
+                encoded = _memo[name][1]
+            else:
+                level = level_for(len(payload), budget)
+                encoded = gzip_base64(payload, level)
+                _memo[name] = (key, encoded)
+
+        timing.annotate(
+            "encode",
+            {
+                "bytes_in": len(payload),
+                "bytes_out": len(encoded),
+                "ratio": round(len(encoded) / max(len(payload), 1), 3),
+                "compressed": encoded != text,
+                "level": level,
+                "memoized": memoized,
+            },
+        )
+    return encoded
+
+
+def compressed(output, name=None):
+    """*output*, the text an extend printed, gzip+base64 encoded unless it
+    is empty or already is."""
+    if not output or decode(output) is not output:
+        return output
+    return encode(output, name, compress=True)
+
+
+def decode(text):
+    """Return the JSON text of an extend's output, decompressing it if it
+    is gzipped and base64 encoded."""
+    if _BASE64.fullmatch(text):
+        try:
+            gzipped = binascii.a2b_base64(text)
+            return zlib.decompress(gzipped, _ANY_WBITS).decode("utf-8")
+        except (binascii.Error, zlib.error, UnicodeDecodeError):
+            pass
+    return text
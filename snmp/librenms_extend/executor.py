@@ -0,0 +1,181 @@
+"""
+Run commands with a hard timeout.
+
+subprocess.check_output() without a timeout lets a hung tool (iw on a wedged
+driver, systemctl waiting on dbus, rpmconf on a locked rpmdb) pin the extend
+forever, and snmpd starts another one on every poll.  check_output() here
+takes the same arguments plus a timeout, runs the command in its own session
+and, once the timeout passes, terminates the whole process group: SIGTERM,
+then SIGKILL after KILL_GRACE seconds.  Anything the command forked dies with
+it.  The caller then gets subprocess.TimeoutExpired, carrying whatever output
+was read before the kill.
+
+Extends that run several commands can keep what the others returned:
+
+    except subprocess.TimeoutExpired as err:
+        poutput = executor.record_timeout(err)
+    ...
+    executor.mark_partial(output_data)
+
+record_timeout() returns empty output for the command and remembers it, and
+mark_partial() flags the envelope with an error naming the commands that
+timed out while leaving the data that was collected in place.
+
+iter_lines() runs a command under the same timeout but yields its output one
+decoded line at a time as the command writes it, so parsing overlaps with the
+command and memory stays flat however much it prints.  Lines already yielded
+stay parsed when it raises TimeoutExpired or CalledProcessError at the end.
+"""
+
+import contextlib
+import io
+import os
+import signal
+import subprocess
+import threading
+
+DEFAULT_TIMEOUT = 10
+KILL_GRACE = 2
+
+# Commands that timed out since the last mark_partial() or reset().
+_timeouts = []
+# Commands killed since the last reset(), for runlog.py.
+_killed = 0
+
+
+def kill_group(proc, grace=KILL_GRACE):
+    """Terminate *proc* and every process in its group, then reap it."""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(proc.pid, sig)
+        try:
+            return proc.communicate(timeout=grace)
+        except subprocess.TimeoutExpired:
+            continue
+    return proc.communicate()
+
+
+def run(cmd, timeout=DEFAULT_TIMEOUT, stdin=subprocess.DEVNULL, stderr=subprocess.PIPE):
+    """Run *cmd* and return (exit status, stdout, stderr).  Raises OSError if
+    it cannot be started and subprocess.TimeoutExpired once it has been killed
+    for running longer than *timeout* seconds."""
+    proc = subprocess.Popen(
+        cmd,
+        stdin=stdin,
+        stdout=subprocess.PIPE,
+        stderr=stderr,
+        start_new_session=True,
+    )
+    try:
+        stdout, errout = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        stdout, errout = kill_group(proc)
+        _count_kill()
+        raise subprocess.TimeoutExpired(cmd, timeout, output=stdout, stderr=errout)
+    return proc.returncode, stdout, errout
+
+
+def check_output(cmd, timeout=DEFAULT_TIMEOUT, stderr=subprocess.PIPE):
+    """subprocess.check_output() with a hard *timeout* and process-group kill."""
+    returncode, stdout, errout = run(cmd, timeout, stderr=stderr)
+    if returncode:
+        raise subprocess.CalledProcessError(
+            returncode, cmd, output=stdout, stderr=errout
+        )
+    return stdout
+
+
+def iter_lines(cmd, timeout=DEFAULT_TIMEOUT):
+    """Run *cmd* and yield its stdout line by line, decoded and without the
+    line ending.  Raises OSError if it cannot be started, and once the output
+    ends, subprocess.TimeoutExpired if it was killed for running longer than
+    *timeout* seconds or subprocess.CalledProcessError if it failed."""
+    import tempfile
+
+    # stderr goes to a file: a pipe nobody reads could fill up and stall the
+    # command while stdout is being streamed.
+    with tempfile.TemporaryFile() as errfile:
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=errfile,
+            start_new_session=True,
+        )
+        finished = threading.Event()
+        expired = threading.Event()
+
+        def expire():
+            expired.set()
+            for sig in (signal.SIGTERM, signal.SIGKILL):
+                with contextlib.suppress(ProcessLookupError):
+                    os.killpg(proc.pid, sig)
+                if finished.wait(KILL_GRACE):
+                    return
+
+        timer = threading.Timer(timeout, expire)
+        timer.daemon = True
+        timer.start()
+        out = io.TextIOWrapper(proc.stdout, encoding="utf-8", errors="replace")
+        try:
+            for line in out:
+                yield line.rstrip("\n")
+            proc.wait()
+        finally:
+            timer.cancel()
+            if proc.returncode is None:
+                # The caller stopped reading early.
+                with contextlib.suppress(ProcessLookupError):
+                    os.killpg(proc.pid, signal.SIGKILL)
+                proc.wait()
+            out.close()
+            finished.set()
+        if expired.is_set():
+            _count_kill()
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        if proc.returncode:
+            errfile.seek(0)
+            raise subprocess.CalledProcessError(
+                proc.returncode, cmd, stderr=errfile.read()
+            )
+
+
+def record_timeout(err):
+    """Remember the timed-out command of *err* for mark_partial() and return
+    empty output to parse in its place."""
+    _timeouts.append(err)
+    return b""
+
+
+def mark_partial(output_data):
+    """Flag the envelope *output_data* as partial if any command timed out
+    since the last call, and forget those commands."""
+    if not _timeouts:
+        return output_data
+    commands = "; ".join(
+        "'%s' after %ss" % (" ".join(str(arg) for arg in err.cmd), err.timeout)
+        for err in _timeouts
+    )
+    del _timeouts[:]
+    if not output_data["error"]:
+        output_data["error"] = 1
+        output_data["errorString"] = "Command Timeout: partial data, killed " + commands
+    return output_data
+
+
+def _count_kill():
+    global _killed
+    _killed += 1
+
+
+def timeout_count():
+    """The number of commands killed for running too long since the last
+    reset()."""
+    return _killed
+
+
+def reset():
+    """Forget recorded timeouts, e.g. those of a run that exited early."""
+    global _killed
+    del _timeouts[:]
+    _killed = 0
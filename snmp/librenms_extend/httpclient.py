@@ -0,0 +1,468 @@
+"""
+Keep-alive HTTP client for the extends that query a web API.
+
+urllib.request.urlopen() opens a new TCP connection, and for https a new TLS
+session, for every request and closes it again, so an extend making a dozen
+API calls pays a dozen handshakes.  A Pool keeps the connection to each
+server open instead:
+
+  - connections are kept per (scheme, host, port, certificate checking,
+    proxy) and reused by later requests to the same server, within one run and, in the
+    collector daemon or a publish --interval loop, across runs;
+  - a kept connection the server closed in the meantime is noticed before it
+    is reused, and a request failing on a reused connection before any
+    response arrived is sent once more on a fresh one;
+  - get_many() pipelines GETs to a server that has already kept a connection
+    open, writing them all before reading the answers in order.  Anything the
+    server did not answer is sent again one at a time;
+  - redirects are followed, at most MAX_REDIRECTS of them, as urlopen() and
+    requests follow them;
+  - GETs are conditional: the ETag/Last-Modified of the last answer for a URL
+    is sent back, and a 304 Not Modified returns the body remembered from it;
+  - timeouts are per request, falling back to the longest matching URL prefix
+    in Pool.timeouts and then to Pool.timeout.  That defaults to None: like
+    urlopen(), a request waits as long as the server takes unless the caller
+    gives a timeout;
+  - http_proxy, https_proxy and no_proxy are honoured as urlopen() honours
+    them: plain http goes to the proxy with the full URL, https through a
+    CONNECT tunnel, with Basic credentials from the proxy URL.  Nothing is
+    pipelined through a proxy.
+
+All failures raise OSError (HTTPError for error statuses), like urlopen().
+
+The module-level functions use a shared default pool:
+
+    from librenms_extend import httpclient
+    status = httpclient.get("http://localhost/server-status?auto").text()
+"""
+
+import base64
+import http.client
+import io
+import json
+import select
+import socket
+import ssl
+import threading
+import urllib.parse
+import urllib.request
+
+# None: no timeout, as with urlopen().
+DEFAULT_TIMEOUT = None
+# Requests written ahead of reading their answers; bounded so neither side
+# blocks writing while the other is not reading yet.
+PIPELINE_DEPTH = 16
+
+# Followed like urlopen() and requests do; 301-303 turn into a GET.
+REDIRECTS = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+
+# Failures that mean a kept-alive connection was closed under us.
+_STALE = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class HTTPError(OSError):
+    """A failed request; *status* is the HTTP status, or None if there was
+    no (valid) answer."""
+
+    def __init__(self, url, status, reason):
+        super().__init__("%s: %s %s" % (url, status, reason))
+        self.url = url
+        self.status = status
+        self.reason = reason
+
+
+class Response(object):
+    """A complete HTTP answer.  *not_modified* is set when the body is the
+    one remembered from an earlier answer the server confirmed with a 304."""
+
+    def __init__(self, url, status, reason, headers, body, not_modified=False):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.not_modified = not_modified
+
+    def text(self, encoding="utf-8"):
+        return self.body.decode(encoding)
+
+    def json(self):
+        return json.loads(self.body.decode("utf-8"))
+
+
+class _SharedReader(io.BufferedReader):
+    """One buffered reader for all the answers to pipelined requests, so what
+    is read ahead while reading one answer is not lost to the next.  Stands
+    in for the socket HTTPResponse reads from, and stays open when it is done
+    with an answer."""
+
+    def __init__(self, sock):
+        super().__init__(socket.SocketIO(sock, "rb"))
+
+    def makefile(self, mode):
+        return self
+
+    def close(self):
+        pass
+
+    def release(self):
+        super().close()
+
+
+def _dropped(conn):
+    """True if an idle connection was closed by the server (or has unasked
+    data waiting, which makes it unusable as well)."""
+    if conn.sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([conn.sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
+def _redirected(resp, method, body, headers):
+    """The (method, url, body, headers) to follow the redirect *resp* with.
+    Like requests, credentials are not sent on to another host."""
+    url = urllib.parse.urljoin(resp.url, resp.headers["Location"])
+    headers = dict(headers or {})
+    if resp.status in (301, 302, 303) and method != "HEAD":
+        method, body = "GET", None
+        headers.pop("Content-Type", None)
+    old_host = urllib.parse.urlsplit(resp.url).hostname
+    if urllib.parse.urlsplit(url).hostname != old_host:
+        headers.pop("Authorization", None)
+    return method, url, body, headers
+
+
+def _proxy_auth(proxy):
+    """The Proxy-Authorization header for the credentials in *proxy*."""
+    parts = urllib.parse.urlsplit(proxy)
+    if parts.username is None:
+        return {}
+    credentials = "%s:%s" % (
+        urllib.parse.unquote(parts.username),
+        urllib.parse.unquote(parts.password or ""),
+    )
+    token = base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+    return {"Proxy-Authorization": "Basic " + token}
+
+
+class Pool(object):
+    """Open connections, grouped by server, plus the validators of the last
+    answer to each conditional GET.  *proxies* maps a scheme to a proxy URL,
+    plus "no" to the no_proxy list; it defaults to the environment."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, timeouts=None, proxies=None):
+        self.timeout = timeout
+        # URL prefix -> seconds, e.g. {"http://127.0.0.1:3000/control/": 2}
+        self.timeouts = dict(timeouts or {})
+        if proxies is None:
+            proxies = urllib.request.getproxies_environment()
+        self.proxies = proxies
+        self._idle = {}
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._contexts = {}
+
+    def timeout_for(self, url, timeout=None):
+        if timeout is not None:
+            return timeout
+        prefixes = [prefix for prefix in self.timeouts if url.startswith(prefix)]
+        if prefixes:
+            return self.timeouts[max(prefixes, key=len)]
+        return self.timeout
+
+    def _context(self, insecure):
+        # Loading the CA store costs more than a handshake; do it once.
+        if insecure not in self._contexts:
+            context = ssl.create_default_context()
+            if insecure:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            self._contexts[insecure] = context
+        return self._contexts[insecure]
+
+    def _proxy(self, scheme, host):
+        """The proxy URL to reach *host* over *scheme* through, or None."""
+        proxy = self.proxies.get(scheme)
+        if not proxy or urllib.request.proxy_bypass_environment(host, self.proxies):
+            return None
+        if "://" not in proxy:
+            proxy = "http://" + proxy
+        return proxy
+
+    def _acquire(self, key, timeout):
+        """Return (connection, reused) for *key*."""
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                conn = idle.pop()
+                if not _dropped(conn):
+                    conn.timeout = timeout
+                    conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+        scheme, host, port, insecure, proxy = key
+        if proxy is not None:
+            parts = urllib.parse.urlsplit(proxy)
+            if parts.scheme != "http":
+                raise HTTPError(proxy, None, "unsupported proxy scheme")
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(
+                    parts.hostname,
+                    parts.port or 80,
+                    timeout=timeout,
+                    context=self._context(insecure),
+                )
+                conn.set_tunnel(host, port, _proxy_auth(proxy))
+            else:
+                conn = http.client.HTTPConnection(
+                    parts.hostname, parts.port or 80, timeout=timeout
+                )
+        elif scheme == "https":
+            conn = http.client.HTTPSConnection(
+                host, port, timeout=timeout, context=self._context(insecure)
+            )
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        return conn, False
+
+    def _release(self, key, conn):
+        with self._lock:
+            self._idle.setdefault(key, []).append(conn)
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+            self._idle.clear()
+
+    def _split(self, url, insecure):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise HTTPError(url, None, "unsupported URL scheme")
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        proxy = self._proxy(parts.scheme, parts.hostname)
+        if proxy is not None and parts.scheme == "http":
+            # A proxy is sent the whole URL.
+            target = urllib.parse.urlunsplit(parts[:4] + ("",))
+        key = (parts.scheme, parts.hostname, parts.port, bool(insecure), proxy)
+        return key, target
+
+    def _conditional(self, url, headers):
+        headers = dict(headers or {})
+        seen = self._seen.get(url)
+        if seen:
+            etag, modified, _ = seen
+            if etag:
+                headers.setdefault("If-None-Match", etag)
+            if modified:
+                headers.setdefault("If-Modified-Since", modified)
+        return headers
+
+    def _answer(self, url, status, reason, headers, body, check):
+        """Build the Response, resolving 304s and remembering validators."""
+        if status == 304 and url in self._seen:
+            return Response(url, 200, reason, headers, self._seen[url][2], True)
+        if status == 200:
+            etag = headers.get("ETag")
+            modified = headers.get("Last-Modified")
+            if etag or modified:
+                self._seen[url] = (etag, modified, body)
+            else:
+                self._seen.pop(url, None)
+        if check and status >= 400:
+            raise HTTPError(url, status, reason)
+        return Response(url, status, reason, headers, body)
+
+    def request(
+        self,
+        method,
+        url,
+        body=None,
+        headers=None,
+        timeout=None,
+        insecure=False,
+        check=True,
+    ):
+        """Send one request, following redirects, and return its Response.
+        Statuses of 400 and up raise HTTPError unless *check* is false."""
+        for _ in range(MAX_REDIRECTS + 1):
+            resp = self._send(method, url, body, headers, timeout, insecure)
+            if resp.status not in REDIRECTS or "Location" not in resp.headers:
+                break
+            method, url, body, headers = _redirected(resp, method, body, headers)
+        else:
+            raise HTTPError(url, resp.status, "too many redirects")
+        if check and resp.status >= 400:
+            raise HTTPError(url, resp.status, resp.reason)
+        return resp
+
+    def _send(self, method, url, body, headers, timeout, insecure):
+        """Send one request and return its Response, whatever the status."""
+        key, target = self._split(url, insecure)
+        timeout = self.timeout_for(url, timeout)
+        if method == "GET":
+            headers = self._conditional(url, headers)
+        proxy = key[4]
+        if proxy is not None and key[0] == "http":
+            headers = dict(headers or {}, **_proxy_auth(proxy))
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        conn, reused = self._acquire(key, timeout)
+        while True:
+            try:
+                conn.request(method, target, body, headers or {})
+                resp = conn.getresponse()
+                break
+            except _STALE:
+                conn.close()
+                if not reused:
+                    raise
+                # The server closed it between our check and the request.
+                conn, reused = self._acquire(key, timeout)
+                reused = False
+            except (OSError, http.client.HTTPException) as err:
+                conn.close()
+                if isinstance(err, OSError):
+                    raise
+                raise HTTPError(url, None, err) from err
+
+        try:
+            data = resp.read()
+        except (OSError, http.client.HTTPException) as err:
+            conn.close()
+            if isinstance(err, OSError):
+                raise
+            raise HTTPError(url, resp.status, err) from err
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+        return self._answer(url, resp.status, resp.reason, resp.msg, data, False)
+
+    def get(self, url, headers=None, timeout=None, insecure=False, check=True):
+        return self.request("GET", url, None, headers, timeout, insecure, check)
+
+    def post(self, url, body, headers=None, timeout=None, insecure=False, check=True):
+        return self.request("POST", url, body, headers, timeout, insecure, check)
+
+    def get_many(self, urls, headers=None, timeout=None, insecure=False, check=True):
+        """GET every URL and return the Responses in the same order.  GETs to
+        a server that has already kept a connection open are pipelined."""
+        responses = [None] * len(urls)
+        by_server = {}
+        for index, url in enumerate(urls):
+            key, target = self._split(url, insecure)
+            by_server.setdefault(key, []).append((index, url, target))
+
+        for key, pending in by_server.items():
+            while pending:
+                url_timeout = self.timeout_for(pending[0][1], timeout)
+                conn, reused = self._acquire(key, url_timeout)
+                if reused and len(pending) > 1 and key[4] is None:
+                    batch = pending[:PIPELINE_DEPTH]
+                    answers = self._pipeline(key, conn, batch, headers, url_timeout)
+                else:
+                    # Pipeline only once the server has shown it keeps
+                    # connections open: send the request on its own.
+                    conn.close()
+                    answers = []
+                if not answers:
+                    url = pending[0][1]
+                    answers = [
+                        self.request(
+                            "GET", url, None, headers, timeout, insecure, False
+                        )
+                    ]
+                for (index, _, _), resp in zip(pending, answers):
+                    responses[index] = resp
+                del pending[: len(answers)]
+
+        for index, resp in enumerate(responses):
+            if resp.status in REDIRECTS and "Location" in resp.headers:
+                method, url, _, url_headers = _redirected(resp, "GET", None, headers)
+                resp = responses[index] = self.request(
+                    method, url, None, url_headers, timeout, insecure, False
+                )
+            if check and resp.status >= 400:
+                raise HTTPError(resp.url, resp.status, resp.reason)
+        return responses
+
+    def _pipeline(self, key, conn, batch, headers, timeout):
+        """Write all of *batch* on *conn*, then read the answers in order.
+        Returns the Responses of those answered; the connection is kept only
+        if all were."""
+        _, host, port, _, _ = key
+        if ":" in host:
+            host = "[%s]" % host
+        if port is not None:
+            host += ":%d" % port
+        wire = []
+        for _, url, target in batch:
+            lines = ["GET %s HTTP/1.1" % target, "Host: %s" % host]
+            lines.append("Accept-Encoding: identity")
+            for name, value in self._conditional(url, headers).items():
+                lines.append("%s: %s" % (name, value))
+            wire.append("\r\n".join(lines) + "\r\n\r\n")
+
+        answers = []
+        will_close = True
+        reader = None
+        try:
+            conn.sock.settimeout(timeout)
+            conn.sock.sendall("".join(wire).encode("latin-1"))
+            reader = _SharedReader(conn.sock)
+            for _, url, _ in batch:
+                resp = http.client.HTTPResponse(reader, method="GET")
+                resp.begin()
+                data = resp.read()
+                answers.append(
+                    self._answer(url, resp.status, resp.reason, resp.msg, data, False)
+                )
+                will_close = resp.will_close
+                if will_close:
+                    break
+        except (OSError, http.client.HTTPException):
+            # Whatever is missing is sent again.
+            will_close = True
+        finally:
+            if reader is not None:
+                reader.release()
+        if will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+        return answers
+
+
+_pool = Pool()
+
+
+def request(
+    method, url, body=None, headers=None, timeout=None, insecure=False, check=True
+):
+    return _pool.request(method, url, body, headers, timeout, insecure, check)
+
+
+def get(url, headers=None, timeout=None, insecure=False, check=True):
+    return _pool.get(url, headers, timeout, insecure, check)
+
+
+def post(url, body, headers=None, timeout=None, insecure=False, check=True):
+    return _pool.post(url, body, headers, timeout, insecure, check)
+
+
+def get_many(urls, headers=None, timeout=None, insecure=False, check=True):
+    return _pool.get_many(urls, headers, timeout, insecure, check)
+
+
+def close():
+    _pool.close()
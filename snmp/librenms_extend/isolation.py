@@ -0,0 +1,150 @@
+"""
+CPU, I/O and memory limits for extends run in a child process.
+
+An extend configured with
+
+    "nice": 10,                     scheduling niceness, see nice(1)
+    "ionice": "idle",               I/O class, or "best-effort:7" with a level,
+                                    see ionice(1)
+    "cpu_quota": 20,                percent of one CPU
+    "memory_max": "256M"            hard memory cap, as for cgroup memory.max
+
+is started through nice and ionice, and with a CPU quota or memory cap inside
+a transient cgroup v2 created for the run under CGROUP_ROOT.  The child moves
+itself into the cgroup before it execs the extend, so everything it forks is
+limited too.  After the run the cgroup's counters are read and the cgroup is
+removed:
+
+    {"nr_periods": 40, "nr_throttled": 12, "throttled_usec": 1830551,
+     "usage_usec": 801442, "memory_peak": 98951168, "oom_kill": 0}
+
+Creating the cgroup needs root and the cpu and memory controllers enabled for
+the root cgroup (systemd enables both).  When it cannot be created the extend
+runs with nice and ionice only.
+
+The runner applies all of these.  The collector daemon runs scripts in its own
+process, so only its "command" extends get nice and ionice.
+"""
+
+import contextlib
+import os
+import re
+
+CGROUP_ROOT = "/sys/fs/cgroup/librenms"
+CPU_PERIOD = 100000
+IONICE_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+NICE_CMD = "nice"
+IONICE_CMD = "ionice"
+
+
+class Limits(object):
+    """The priority and resource limits of one extend."""
+
+    def __init__(self, nice=None, ionice=None, cpu_quota=None, memory_max=None):
+        self.nice = None if nice is None else int(nice)
+        self.ionice = None
+        if ionice is not None:
+            io_class, _, level = str(ionice).partition(":")
+            if io_class not in IONICE_CLASSES:
+                raise ValueError("invalid ionice class %s" % io_class)
+            self.ionice = (IONICE_CLASSES[io_class], int(level) if level else None)
+        self.cpu_quota = None if cpu_quota is None else float(cpu_quota)
+        if self.cpu_quota is not None and self.cpu_quota <= 0:
+            raise ValueError("cpu_quota must be positive")
+        self.memory_max = None if memory_max is None else str(memory_max)
+        if self.memory_max is not None and not re.match(
+            r"^(\d+[KMGT]?|max)$", self.memory_max
+        ):
+            raise ValueError("invalid memory_max %s" % self.memory_max)
+
+    @property
+    def cgroup(self):
+        """True if the limits need a cgroup."""
+        return self.cpu_quota is not None or self.memory_max is not None
+
+    def prefix(self):
+        """The nice/ionice command line the extend is run under."""
+        prefix = []
+        if self.nice is not None:
+            prefix += [NICE_CMD, "-n", str(self.nice)]
+        if self.ionice is not None:
+            io_class, level = self.ionice
+            prefix += [IONICE_CMD, "-c", str(io_class)]
+            if level is not None:
+                prefix += ["-n", str(level)]
+        return prefix
+
+
+def read_keyed(path):
+    """Read a cgroup "key value" file such as cpu.stat into a dict of ints."""
+    values = {}
+    with open(path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            key, _, value = line.partition(" ")
+            with contextlib.suppress(ValueError):
+                values[key] = int(value)
+    return values
+
+
+class Cgroup(object):
+    """A transient cgroup v2 holding a single run of an extend."""
+
+    def __init__(self, name, limits, root=CGROUP_ROOT):
+        self.root = root
+        leaf = "%s.%d" % (re.sub(r"\W", "_", name), os.getpid())
+        self.path = os.path.join(root, leaf)
+        self.limits = limits
+
+    def _write(self, path, value):
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write(value)
+
+    def create(self):
+        """Create the cgroup and apply the limits.  Raises OSError if the
+        cgroup hierarchy does not allow it."""
+        parent = os.path.dirname(self.root.rstrip("/"))
+        if not os.path.exists(os.path.join(parent, "cgroup.controllers")):
+            raise OSError("no cgroup v2 hierarchy at %s" % parent)
+        os.makedirs(self.root, exist_ok=True)
+        controllers = []
+        if self.limits.cpu_quota is not None:
+            controllers.append("+cpu")
+        if self.limits.memory_max is not None:
+            controllers.append("+memory")
+        subtree_control = os.path.join(self.root, "cgroup.subtree_control")
+        self._write(subtree_control, " ".join(controllers))
+        os.mkdir(self.path)
+        try:
+            if self.limits.cpu_quota is not None:
+                quota = int(CPU_PERIOD * self.limits.cpu_quota / 100)
+                cpu_max = os.path.join(self.path, "cpu.max")
+                self._write(cpu_max, "%d %d" % (quota, CPU_PERIOD))
+            if self.limits.memory_max is not None:
+                memory_max = os.path.join(self.path, "memory.max")
+                self._write(memory_max, self.limits.memory_max)
+        except OSError:
+            self.remove()
+            raise
+
+    def prefix(self):
+        """A command line that moves the child into the cgroup and then execs
+        the rest of the command line."""
+        procs = os.path.join(self.path, "cgroup.procs")
+        return ["/bin/sh", "-c", 'echo $$ > "$0" && exec "$@"', procs]
+
+    def stats(self):
+        """The throttling and memory counters of the finished run."""
+        stats = {}
+        with contextlib.suppress(OSError):
+            stats.update(read_keyed(os.path.join(self.path, "cpu.stat")))
+        with contextlib.suppress(OSError, ValueError):
+            with open(os.path.join(self.path, "memory.peak"), "r") as handle:
+                stats["memory_peak"] = int(handle.read())
+        with contextlib.suppress(OSError):
+            events = read_keyed(os.path.join(self.path, "memory.events"))
+            stats["oom_kill"] = events.get("oom_kill", 0)
+        return stats
+
+    def remove(self):
+        with contextlib.suppress(OSError):
+            os.rmdir(self.path)
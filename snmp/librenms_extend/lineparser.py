@@ -0,0 +1,116 @@
+r"""
+Typed key/value line parsing with first-word dispatch.
+
+The extends describe the fields they scrape from command output as a table of
+specs, keyed by field name:
+
+    SPECS = {
+        "rx_bytes": {"regex": r"^\s+rx bytes:\s*(\d+)$", "variable_type": "type_int"},
+        "ssid": {"regex": r"^\s+ssid (.+)$", "variable_type": "type_string"},
+        ...
+    }
+
+Running every regex against every line costs lines x specs regex calls.
+LineParser(SPECS) compiles the table once and files each spec under the
+literal word its regex starts with ("rx", "ssid"), so a line only meets the
+few specs filed under its own first word, usually one.  Specs whose regex
+does not start with a literal word (e.g. r"(\d+) inserts") are tried on every
+line.  A line is still tested against every spec under its word, so several
+fields can come from one line, as with iw's "channel 36 (5180 MHz), width: 80
+MHz, center1: 5210 MHz".
+
+The captured groups are converted with the spec's "variable_type": type_int,
+type_float or type_string (the default).  Groups that did not take part in the
+match stay None.  A spec with one group yields its value, one with several a
+tuple.
+"""
+
+import re
+
+CONVERTERS = {"type_int": int, "type_float": float, "type_string": str}
+
+# The first word of a line, after any indentation.
+_FIRST_WORD = re.compile(r"\s*(\w*)")
+# What a regex may start with and still be dispatched on its first word: an
+# anchor and optional whitespace.
+_LEADING = re.compile(r"\^?(?:\\s[+*?]?| [+*?]?)?")
+# Regex elements that can follow the first word without extending it: the end,
+# a literal non-word character, or a whitespace or non-word escape.
+_WORD_END = re.compile(r"$|\$|[ :,=#/-]|\\[sWbB /:#()\[\].,-]")
+
+
+def first_word(regex):
+    """The literal word every line matched by *regex* starts with, after any
+    indentation, or None if it cannot be determined."""
+    if "|" in regex:
+        # A top-level alternative could start with another word.
+        return None
+    pos = _LEADING.match(regex).end()
+    word = re.match(r"\w+", regex[pos:])
+    if word is None:
+        return None
+    rest = regex[pos + word.end() :]
+    if rest[:1] in ("*", "?", "{"):
+        # The word's last character is optional or repeated.
+        return None
+    end = _WORD_END.match(rest)
+    if end is None or rest[end.end() : end.end() + 1] in ("*", "?", "{"):
+        # The word may run on into more word characters.
+        return None
+    return word.group()
+
+
+class LineParser(object):
+    """A compiled spec table.  With *search*, specs are searched for anywhere
+    in the line (re.search), otherwise matched at its start (re.match)."""
+
+    def __init__(self, specs, search=False):
+        self.by_word = {}
+        self.fallback = []
+        for name, spec in specs.items():
+            regex = re.compile(spec["regex"])
+            convert = CONVERTERS[spec.get("variable_type", "type_string")]
+            entry = (name, regex.search if search else regex.match, convert)
+            word = first_word(spec["regex"])
+            if search and not spec["regex"].startswith("^"):
+                word = None
+            if word is None:
+                self.fallback.append(entry)
+            else:
+                self.by_word.setdefault(word, []).append(entry)
+
+    def matches(self, line):
+        """Yield (name, value) for every spec matching *line*, in table order
+        within its word.  Raises ValueError if a group does not convert."""
+        candidates = self.by_word.get(_FIRST_WORD.match(line).group(1), ())
+        for entries in (candidates, self.fallback):
+            for name, match, convert in entries:
+                found = match(line)
+                if found is not None:
+                    yield name, convert_groups(found, convert)
+
+    def parse(self, lines, data=None):
+        """Add the fields found in *lines* to the dict *data* (a new one by
+        default) and return it.  A field found on several lines keeps the
+        last value."""
+        if data is None:
+            data = {}
+        by_word = self.by_word
+        fallback = self.fallback
+        first = _FIRST_WORD.match
+        for line in lines:
+            for entries in (by_word.get(first(line).group(1), ()), fallback):
+                for name, match, convert in entries:
+                    found = match(line)
+                    if found is not None:
+                        data[name] = convert_groups(found, convert)
+        return data
+
+
+def convert_groups(found, convert):
+    """The groups of the match *found* converted with *convert*: the value
+    itself for a single group, a tuple for several."""
+    groups = found.groups()
+    if len(groups) == 1:
+        return None if groups[0] is None else convert(groups[0])
+    return tuple(None if value is None else convert(value) for value in groups)
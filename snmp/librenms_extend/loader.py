@@ -0,0 +1,252 @@
+"""
+Load an extend once and run it many times.
+
+An Extend wraps either a Python extend script or any other executable.  Python
+scripts are imported a single time and their entry function (main() by
+default) is called on every run, so the interpreter start-up, module imports
+and regex compilation are paid once per process instead of once per poll.
+Scripts that do their work at module level rather than in a function are
+compiled once and their code object is re-executed on every run.  Anything
+else is spawned as a subprocess, exactly as snmpd would.
+
+Every run returns the (output, exit code) pair snmpd would have recorded for a
+plain `extend` line: stdout with the trailing newline stripped, and the exit
+status.
+"""
+
+import contextlib
+import functools
+import io
+import os
+import re
+import subprocess
+import sys
+import threading
+
+from librenms_extend import executor, isolation, pressure
+
+# ast, importlib.util, inspect and traceback are imported where they are used:
+# every extend run directly imports this module for call_captured(), and only
+# the runner and the collector daemon load scripts.
+
+DEFAULT_ENTRY = "main"
+DEFAULT_TIMEOUT = 30
+# Exit statuses reported for runs that never produced one, as timeout(1) and
+# the shell do.
+TIMEOUT_STATUS = 124
+NOT_FOUND_STATUS = 127
+
+# sys.argv and sys.stdout are process-wide, so in-process runs are serialised.
+_IN_PROCESS_LOCK = threading.Lock()
+
+
+def module_name(path):
+    """Return a valid, unique-enough module name for an extend script path."""
+    return "librenms_extend_" + re.sub(r"\W", "_", os.path.basename(path))
+
+
+def load_script(path, name=None):
+    """Import the script at *path* as a module without running its __main__
+    block.  Works for scripts without a .py suffix (e.g. zfs-linux)."""
+    import importlib.machinery
+    import importlib.util
+
+    name = name or module_name(path)
+    loader = importlib.machinery.SourceFileLoader(name, path)
+    spec = importlib.util.spec_from_loader(name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+def defines_function(source, name):
+    """True if *source* defines a top-level function called *name*."""
+    import ast
+
+    return any(
+        isinstance(node, ast.FunctionDef) and node.name == name
+        for node in ast.parse(source).body
+    )
+
+
+def exit_code(code):
+    """Map a sys.exit() argument to the status a process would exit with."""
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    # sys.exit("message") prints the message and exits 1.
+    print(code, file=sys.stderr)
+    return 1
+
+
+def call_captured(function):
+    """Call *function* with stdout captured, the way snmpd runs a script, and
+    return (output, exit code).  SystemExit is turned into the exit code, and
+    any other exception is printed to stderr and reported as exit code 1."""
+    # Timeouts left over from an earlier run that exited early.
+    executor.reset()
+    buf = io.StringIO()
+    with contextlib.redirect_stdout(buf):
+        try:
+            code = exit_code(function())
+        except SystemExit as err:
+            code = exit_code(err.code)
+        except Exception:  # noqa: BLE001 - an extend crash must not kill the caller
+            import traceback
+
+            traceback.print_exc()
+            code = 1
+    return buf.getvalue().rstrip("\n"), code
+
+
+class Extend(object):
+    """A single extend, as configured for the collector daemon or runner."""
+
+    def __init__(
+        self,
+        name,
+        script=None,
+        command=None,
+        args=None,
+        interval=300,
+        entry=DEFAULT_ENTRY,
+        timeout=DEFAULT_TIMEOUT,
+        publish=None,
+        nice=None,
+        ionice=None,
+        cpu_quota=None,
+        memory_max=None,
+        splay=0,
+        jitter=0,
+        spacing=0,
+        pressure=None,
+        compress=False,
+        labels=None,
+    ):
+        if bool(script) == bool(command):
+            raise ValueError("%s: exactly one of script or command is required" % name)
+        self.name = name
+        self.script = script
+        self.command = list(command) if command else None
+        self.args = [str(arg) for arg in args or []]
+        self.interval = interval
+        self.entry = entry
+        self.timeout = timeout
+        self.publish = publish
+        self.limits = isolation.Limits(nice, ionice, cpu_quota, memory_max)
+        # See schedule.py.
+        self.splay = float(splay)
+        self.jitter = float(jitter)
+        self.spacing = float(spacing)
+        # pressure.Thresholds, or None.
+        self.pressure = pressure
+        # Whether the output is gzip+base64 encoded, see envelope.py.
+        self.compress = bool(compress)
+        # OpenMetrics label names for the levels of its data, see
+        # openmetrics.py.
+        self.labels = tuple(labels) if labels else None
+        self._function = None
+        self._code = None
+
+    @classmethod
+    def from_config(cls, name, config):
+        """Build an Extend from one entry of an "extends" config dict."""
+        known = (
+            "script",
+            "command",
+            "args",
+            "interval",
+            "entry",
+            "timeout",
+            "publish",
+            "nice",
+            "ionice",
+            "cpu_quota",
+            "memory_max",
+            "splay",
+            "jitter",
+            "spacing",
+            "pressure",
+            "compress",
+            "labels",
+        )
+        unknown = set(config) - set(known)
+        if unknown:
+            raise ValueError("%s: unknown keys %s" % (name, ", ".join(sorted(unknown))))
+        if config.get("pressure"):
+            thresholds = pressure.Thresholds.from_config(config["pressure"])
+            config = dict(config, pressure=thresholds)
+        return cls(name, **config)
+
+    def load(self):
+        """Import (or compile) the script so in-process runs can call it."""
+        with open(self.script, "r", encoding="utf-8") as handle:
+            source = handle.read()
+        if self.entry and defines_function(source, self.entry):
+            self._function = getattr(load_script(self.script), self.entry)
+        else:
+            self._code = compile(source, self.script, "exec")
+
+    def argv(self):
+        """The command line that runs the extend in a child process, under
+        nice/ionice if configured."""
+        if self.command:
+            return self.limits.prefix() + self.command + self.args
+        return self.limits.prefix() + [sys.executable, self.script] + self.args
+
+    def run(self):
+        """Run the extend once and return (output, exit code).  Scripts run
+        in-process, commands in a child process."""
+        if self.command:
+            return self.run_subprocess(self.timeout)
+        return self._run_in_process()
+
+    def run_subprocess(self, timeout, prefix=()):
+        """Run the extend in a child process and return (output, exit code).
+        After *timeout* seconds the child's whole process group is killed (see
+        executor.run()) and TIMEOUT_STATUS is returned.  *prefix* is prepended
+        to the command line, e.g. isolation.Cgroup.prefix()."""
+        try:
+            returncode, stdout, _ = executor.run(
+                list(prefix) + self.argv(), timeout, stderr=subprocess.DEVNULL
+            )
+        except OSError as err:
+            print("%s: %s" % (self.name, err), file=sys.stderr)
+            return "", NOT_FOUND_STATUS
+        except subprocess.TimeoutExpired:
+            return "", TIMEOUT_STATUS
+        output = stdout.decode("utf-8", errors="replace").rstrip("\n")
+        return self.encode(output), returncode
+
+    def _run_in_process(self):
+        import inspect
+
+        if self._function is None and self._code is None:
+            self.load()
+        if self._function is None:
+            globals_ = {"__name__": "__main__", "__file__": self.script}
+            function = functools.partial(exec, self._code, globals_)
+        elif inspect.signature(self._function).parameters:
+            # e.g. zfs-linux's main(args)
+            function = lambda: self._function(sys.argv[1:])  # noqa: E731
+        else:
+            function = self._function
+        with _IN_PROCESS_LOCK:
+            saved_argv = sys.argv
+            sys.argv = [self.script] + self.args
+            try:
+                output, code = call_captured(function)
+            finally:
+                sys.argv = saved_argv
+        return self.encode(output), code
+
+    def encode(self, output):
+        """*output*, gzip+base64 encoded if the extend is configured to
+        "compress"."""
+        if not self.compress:
+            return output
+        # Imported here: envelope imports timing, which imports this module.
+        from librenms_extend import envelope
+
+        return envelope.compressed(output, self.name)
@@ -0,0 +1,173 @@
+"""
+Opt-in memory profiling.
+
+Every extend that calls publish.run(main) from its __main__ block accepts:
+
+    --memory              Print a memory report for the run to stderr.
+    --memory-file PATH    Write the report to PATH as a JSON sidecar.
+    --memory-warn MIB     Warn on stderr and to syslog when the run's peak RSS
+                          exceeds MIB mebibytes.
+
+Any of them runs the extend under tracemalloc.  The report holds the peak RSS
+of the extend and of its largest child command (a child forked from the
+extend starts out at the extend's RSS, so this never reads lower), the peak
+traced by tracemalloc, and the top allocation sites and object types at the largest
+checkpoint seen.  Checkpoints are taken at the end of every timing.phase()
+and timing.command() block, so the sites reflect the data structures that are
+alive while the extend parses and encodes, not just what is left at exit:
+
+    {
+        "peak_rss_kib": 48212, "children_peak_rss_kib": 9640,
+        "traced_peak_kib": 31877.4,
+        "top_allocations": [{"site": "ss.py:339", "size_kib": 12.3,
+                             "count": 96}, ...],
+        "top_objects": [{"type": "dict", "count": 5120}, ...]
+    }
+
+tracemalloc slows an extend down several times over and its bookkeeping
+inflates the RSS it measures, so use this to size collectors, not in the
+regular poll.
+"""
+
+import collections
+import gc
+import json
+import os
+import resource
+import sys
+import syslog
+import time
+import tracemalloc
+
+from librenms_extend import loader
+
+DEFAULT_TOP = 10
+
+# The Profiler of the run in progress, or None when profiling is off.
+_profiler = None
+
+
+class Profiler(object):
+    """Keeps the tracemalloc snapshot and object counts of the checkpoint
+    with the most traced memory."""
+
+    def __init__(self, top=DEFAULT_TOP):
+        self.top = top
+        self.size = -1
+        self.snapshot = None
+        self.objects = None
+
+    def checkpoint(self):
+        size, _ = tracemalloc.get_traced_memory()
+        if size <= self.size:
+            return
+        self.size = size
+        self.snapshot = tracemalloc.take_snapshot()
+        self.objects = collections.Counter(
+            type(obj).__name__ for obj in gc.get_objects()
+        )
+
+    def report(self):
+        _, peak = tracemalloc.get_traced_memory()
+        sites = []
+        if self.snapshot is not None:
+            snapshot = self.snapshot.filter_traces(
+                (
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, __file__),
+                )
+            )
+            for stat in snapshot.statistics("lineno")[: self.top]:
+                frame = stat.traceback[0]
+                site = "%s:%d" % (os.path.basename(frame.filename), frame.lineno)
+                sites.append(
+                    {
+                        "site": site,
+                        "size_kib": round(stat.size / 1024, 1),
+                        "count": stat.count,
+                    }
+                )
+        objects = self.objects or collections.Counter()
+        # ru_maxrss is in KiB on Linux.
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        return {
+            "peak_rss_kib": rss,
+            "children_peak_rss_kib": children_rss,
+            "traced_peak_kib": round(peak / 1024, 1),
+            "top_allocations": sites,
+            "top_objects": [
+                {"type": name, "count": count}
+                for name, count in objects.most_common(self.top)
+            ],
+        }
+
+
+def checkpoint():
+    """Record the memory in use now, if a run is being profiled."""
+    if _profiler is not None:
+        _profiler.checkpoint()
+
+
+def record(main):
+    """Call *main* with stdout captured under tracemalloc.  Returns (output,
+    exit code, report)."""
+    global _profiler
+    profiler = _profiler = Profiler()
+    tracemalloc.start()
+    try:
+        output, code = loader.call_captured(main)
+        profiler.checkpoint()
+        report = profiler.report()
+    finally:
+        _profiler = None
+        tracemalloc.stop()
+    return output, code, report
+
+
+def warn(extend, report, limit_mib):
+    """Log a warning if the peak RSS in *report* exceeds *limit_mib*.  Returns
+    True if it did."""
+    peak_mib = report["peak_rss_kib"] / 1024
+    if peak_mib <= limit_mib:
+        return False
+    message = "Memory Warning: %s peak RSS %.1f MiB exceeds %.1f MiB" % (
+        extend,
+        peak_mib,
+        limit_mib,
+    )
+    print(message, file=sys.stderr)
+    syslog.syslog(syslog.LOG_WARNING, message)
+    return True
+
+
+def instrument(main, stderr=False, path=None, limit_mib=None):
+    """Wrap *main* so each call is profiled, then print the report to stderr
+    and/or write it to the sidecar *path*, and warn above *limit_mib*."""
+    # Imported here, publish imports this module.
+    from librenms_extend import publish
+
+    def profiled_main():
+        output, code, report = record(main)
+        extend = os.path.basename(sys.argv[0])
+        if limit_mib is not None:
+            report["warn_mib"] = limit_mib
+            report["warning"] = warn(extend, report, limit_mib)
+        if stderr:
+            print(json.dumps(report, indent=2), file=sys.stderr)
+        if path:
+            sidecar = {
+                "extend": extend,
+                "time": int(time.time()),
+                "exit": code,
+                "memory": report,
+            }
+            try:
+                publish.write_atomic(path, json.dumps(sidecar))
+            except OSError as err:
+                print("Memory Profile Error: '%s'" % err, file=sys.stderr)
+        if output:
+            print(output)
+        return code
+
+    return profiled_main
@@ -0,0 +1,234 @@
+"""
+OpenMetrics exposition of the collector daemon's results.
+
+Hosts that are scraped by Prometheus as well as polled by LibreNMS can serve
+both from one collection: the daemon renders every extend's latest output as
+OpenMetrics text after each collection, and a small HTTP server hands that
+snapshot to every scrape of /metrics without running anything.  The endpoint
+is part of the daemon (librenms_collectord.py, "openmetrics" in its config):
+extends run from snmpd's `extend` lines, librenms_runner.py or publish.py are
+not exposed.
+
+The numbers of an extend's JSON "data" become gauges named after the extend
+and the key holding them; the keys and list items above become labels (a list
+item is named by its "name" or "id" when it has one).  Numeric strings count
+as numbers, other strings are left out.
+
+The labels are named per extend, one name for each level of its data: by
+the extend's "labels" in the daemon config, or else by LABELS for the
+extends whose layout is known here.  Levels without a name, and every level
+of the other extends, are labelled key1, key2, ... by depth.  For example
+wireguard's
+
+    {"wg0": {"client1": {"bytes_rcvd": 1024}}}
+
+becomes
+
+    librenms_wireguard_bytes_rcvd{interface="wg0",client="client1"} 1024
+
+and with no label names it would be
+
+    librenms_wireguard_bytes_rcvd{key1="wg0",key2="client1"} 1024
+
+Every extend also gets librenms_extend_exit_code and librenms_extend_error
+(the envelope's "error") samples labelled with its name.
+"""
+
+import http.server
+import json
+import math
+import re
+import socket
+import threading
+
+from librenms_extend import envelope
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PREFIX = "librenms_"
+# Keys naming a list item, in order of preference.
+ITEM_NAMES = ("name", "id")
+# Label names for the levels of an extend's data, by the extend name LibreNMS
+# polls.
+LABELS = {
+    # {"sub": {"service": {"running": 12}}}
+    "systemd": ("state", "unit"),
+    # {"tcp": {"ESTAB": 3}, "inet6": {"udp": {"UNCONN": 1}}}
+    "ss": ("type", "netid"),
+    # {"wg0": {"client1": {"bytes_rcvd": 1024}}}
+    "wireguard": ("interface", "client"),
+}
+
+_INVALID = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def metric_name(*parts):
+    name = _INVALID.sub("_", "_".join(parts))
+    return "_" + name if name[:1].isdigit() else name
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def number(value):
+    """*value* as an int or float, or None if it is not a number."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value) if "." in value or "e" in value else int(value)
+        except ValueError:
+            return None
+    return None
+
+
+def format_number(value):
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+def flatten(value, path=()):
+    """Yield ((key, path), number) for every number in the JSON *value*,
+    *path* being the keys and list item names above *key*."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if isinstance(item, (dict, list)):
+                yield from flatten(item, path + (str(key),))
+            else:
+                sample = number(item)
+                if sample is not None:
+                    yield (str(key), path), sample
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            label = str(index)
+            if isinstance(item, dict):
+                for key in ITEM_NAMES:
+                    if isinstance(item.get(key), (str, int)):
+                        label = str(item[key])
+                        break
+            yield from flatten(item, path + (label,))
+
+
+def label_name(names, depth):
+    """The label of the *depth*th level of data, counting from 1."""
+    if depth <= len(names):
+        return metric_name(names[depth - 1])
+    return "key%d" % depth
+
+
+def extend_samples(name, output, code, names=None):
+    """Return {family: [(labels, value)]} for one extend's *output*, its
+    data levels labelled by *names* (see LABELS by default)."""
+    if names is None:
+        names = LABELS.get(name, ())
+    families = {}
+    labels = (("extend", name),)
+    families[PREFIX + "extend_exit_code"] = [(labels, code)]
+    try:
+        document = json.loads(envelope.decode(output))
+    except ValueError:
+        return families
+    if not isinstance(document, dict):
+        return families
+    error = number(document.get("error", 0))
+    families[PREFIX + "extend_error"] = [(labels, 1 if error is None else error)]
+
+    data = document.get("data", document)
+    for (key, path), value in flatten(data):
+        family = metric_name(PREFIX + name, key)
+        labels = tuple(
+            (label_name(names, depth), part) for depth, part in enumerate(path, 1)
+        )
+        families.setdefault(family, []).append((labels, value))
+    return families
+
+
+def render(results, labels=None):
+    """Render {extend name: (output, exit code)} as an OpenMetrics
+    exposition.  *labels* maps extend names to their label names, in place
+    of LABELS."""
+    labels = labels or {}
+    families = {}
+    for name, (output, code) in sorted(results.items()):
+        samples_by_family = extend_samples(name, output, code, labels.get(name))
+        for family, samples in samples_by_family.items():
+            families.setdefault(family, []).extend(samples)
+
+    lines = []
+    for family, samples in families.items():
+        lines.append("# TYPE %s gauge" % family)
+        seen = set()
+        for labels, value in samples:
+            if labels in seen:
+                continue  # e.g. two list items of the same name
+            seen.add(labels)
+            label_text = ",".join('%s="%s"' % (k, escape(v)) for k, v in labels)
+            if label_text:
+                label_text = "{" + label_text + "}"
+            lines.append("%s%s %s" % (family, label_text, format_number(value)))
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+class Snapshot(object):
+    """The last rendered exposition.  update() swaps in a complete new one,
+    so scrapes never observe a half-built one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._body = b"# EOF\n"
+
+    def update(self, results, labels=None):
+        body = render(results, labels).encode("utf-8")
+        with self._lock:
+            self._body = body
+
+    def body(self):
+        with self._lock:
+            return self._body
+
+
+def parse_address(address):
+    """'127.0.0.1:9923' or '[::1]:9923' -> (host, port)"""
+    host, _, port = address.rpartition(":")
+    return host.strip("[]") or "127.0.0.1", int(port)
+
+
+def serve(snapshot, address):
+    """Serve *snapshot* at http://*address*/metrics from a background thread
+    and return the server."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = snapshot.body()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # stdout and stderr belong to snmpd
+
+    host, port = parse_address(address)
+    server_class = http.server.ThreadingHTTPServer
+    if ":" in host:
+        server_class = type(
+            "Server6", (server_class,), {"address_family": socket.AF_INET6}
+        )
+    server = server_class((host, port), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(
+        target=server.serve_forever, name="openmetrics", daemon=True
+    )
+    thread.start()
+    return server
@@ -0,0 +1,181 @@
+"""
+Minimal snmpd pass_persist server.
+
+snmpd starts a pass_persist program once and then talks to it over stdin and
+stdout:
+
+    PING\\n               -> PONG\\n
+    get\\n<oid>\\n         -> <oid>\\n<type>\\n<value>\\n   or   NONE\\n
+    getnext\\n<oid>\\n     -> same as get, for the first OID after <oid>
+    set\\n<oid>\\n<value>\\n -> not-writable\\n
+
+Values are single lines, so any string containing a newline is sent as type
+"octet" with its bytes hex-encoded, which snmpd decodes back into an OCTET
+STRING.  The hex encoding triples the size on the pipe, and snmpd reads each
+reply line into a buffer of SNMP_MAXBUF bytes, cutting off the rest.
+
+An extend's output is therefore also served one line per row in
+nsExtendOutput2Table, as snmpd does for its own extends: an output too long
+for nsExtendOutputFull is still served whole, line by line.  Any value that
+does not fit is left out and reported on stderr, never cut short.  One long
+line (e.g. JSON) fits if it is gzip+base64 encoded (see envelope.py).
+"""
+
+import bisect
+import sys
+import threading
+
+# NET-SNMP-EXTEND-MIB::nsExtendObjects, the subtree the daemon serves
+EXTEND_OBJECTS = (1, 3, 6, 1, 4, 1, 8072, 1, 3, 2)
+EXTEND_NUM_ENTRIES = EXTEND_OBJECTS + (1, 0)
+# nsExtendOutput1Entry
+EXTEND_OUTPUT_ENTRY = EXTEND_OBJECTS + (3, 1)
+EXTEND_OUTPUT_1LINE = 1
+EXTEND_OUTPUT_FULL = 2
+EXTEND_OUT_NUM_LINES = 3
+EXTEND_RESULT = 4
+# nsExtendOutput2Entry's nsExtendOutLine column
+EXTEND_OUT_LINE = EXTEND_OBJECTS + (4, 1, 2)
+
+# snmpd's buffer for a pass_persist reply line, newline and NUL included.
+SNMP_MAXBUF = 4096
+
+
+def parse_oid(text):
+    """'.1.3.6.1' -> (1, 3, 6, 1)"""
+    return tuple(int(part) for part in text.strip().strip(".").split(".") if part)
+
+
+def format_oid(oid):
+    """(1, 3, 6, 1) -> '.1.3.6.1'"""
+    return "." + ".".join(str(part) for part in oid)
+
+
+def string_index(name):
+    """Encode *name* as a variable-length string table index (length prefix
+    followed by one sub-identifier per byte), as snmpd does for extends."""
+    raw = name.encode("utf-8")
+    return (len(raw),) + tuple(raw)
+
+
+def string_value(text):
+    """Return the (type, value) pair used to send *text* over pass_persist.
+    Raises ValueError if the value does not fit in one snmpd reply line."""
+    raw = text.encode("utf-8")
+    if "\n" in text or "\r" in text:
+        kind, value = "octet", " ".join("%02x" % byte for byte in raw)
+    else:
+        kind, value = "string", text
+    size = len(value) if kind == "octet" else len(raw)
+    if size > SNMP_MAXBUF - 2:
+        raise ValueError(
+            "%d bytes of output take %d bytes as %s, snmpd reads at most %d"
+            % (len(raw), size, kind, SNMP_MAXBUF - 2)
+        )
+    return kind, value
+
+
+def num_entries_row(count):
+    """The nsExtendNumEntries row for *count* extends."""
+    return (EXTEND_NUM_ENTRIES, "integer", str(count))
+
+
+def extend_rows(name, output, result):
+    """Build the nsExtendOutput1Table and nsExtendOutput2Table rows snmpd
+    would publish for an extend.  Values too long for snmpd are left out and
+    reported on stderr."""
+    index = string_index(name)
+    lines = output.split("\n")
+    rows = [
+        (
+            EXTEND_OUTPUT_ENTRY + (EXTEND_OUT_NUM_LINES,) + index,
+            "integer",
+            str(len(lines)),
+        ),
+        (EXTEND_OUTPUT_ENTRY + (EXTEND_RESULT,) + index, "integer", str(result)),
+    ]
+    texts = [
+        (EXTEND_OUTPUT_ENTRY + (EXTEND_OUTPUT_1LINE,) + index, lines[0]),
+        (EXTEND_OUTPUT_ENTRY + (EXTEND_OUTPUT_FULL,) + index, output),
+    ]
+    texts.extend(
+        (EXTEND_OUT_LINE + index + (number,), line)
+        for number, line in enumerate(lines, 1)
+    )
+    left_out = []
+    for oid, text in texts:
+        try:
+            rows.append((oid,) + string_value(text))
+        except ValueError as err:
+            left_out.append("%s: %s" % (format_oid(oid), err))
+    if left_out:
+        print(
+            "%s: Pass Persist Error: %d values left out, first '%s'"
+            % (name, len(left_out), left_out[0]),
+            file=sys.stderr,
+        )
+    return rows
+
+
+class OidTable(object):
+    """Sorted, read-mostly OID table.  update() swaps in a complete new table,
+    so readers never observe a half-built one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._oids = []
+        self._values = {}
+
+    def update(self, rows):
+        """Replace the table contents with *rows* of (oid, type, value)."""
+        values = {oid: (kind, value) for oid, kind, value in rows}
+        oids = sorted(values)
+        with self._lock:
+            self._oids, self._values = oids, values
+
+    def get(self, oid):
+        with self._lock:
+            values = self._values
+        entry = values.get(oid)
+        return (oid,) + entry if entry else None
+
+    def getnext(self, oid):
+        with self._lock:
+            oids, values = self._oids, self._values
+        pos = bisect.bisect_right(oids, oid)
+        if pos >= len(oids):
+            return None
+        return (oids[pos],) + values[oids[pos]]
+
+
+def serve(table, instream, outstream):
+    """Answer snmpd pass_persist requests from *table* until stdin closes."""
+
+    def reply(*lines):
+        outstream.write("".join(line + "\n" for line in lines))
+        outstream.flush()
+
+    while True:
+        command = instream.readline()
+        if not command or not command.strip():
+            return
+        command = command.strip().lower()
+        if command == "ping":
+            reply("PONG")
+        elif command in ("get", "getnext"):
+            try:
+                oid = parse_oid(instream.readline())
+            except ValueError:
+                reply("NONE")
+                continue
+            entry = table.get(oid) if command == "get" else table.getnext(oid)
+            if entry is None:
+                reply("NONE")
+            else:
+                reply(format_oid(entry[0]), entry[1], entry[2])
+        elif command == "set":
+            instream.readline()
+            instream.readline()
+            reply("not-writable")
+        else:
+            reply("NONE")
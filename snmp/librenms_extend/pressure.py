@@ -0,0 +1,156 @@
+"""
+Back off expensive extends while the host is under pressure.
+
+Running storcli, smartctl or `docker inspect -s` on a host that is already
+saturated makes the incident worse.  An extend given thresholds is deferred
+while the host exceeds any of them:
+
+  - "cpu", "io", "memory": the share of the last minute some tasks spent
+    stalled on that resource, in percent (PSI, the "some avg60" of
+    /proc/pressure/<resource>);
+  - "load": the 1 minute load average per CPU.
+
+A deferred extend is not run.  Its last output is served again with a
+"deferred" marker saying when it was collected and why it was not refreshed:
+
+    {"version": 1, "error": 0, "errorString": "", "data": {...},
+     "deferred": {"collected": 1700000000, "reason": "io 31.2 > 20"}}
+
+Once that output is "max_defer" seconds old [DEFAULT_MAX_DEFER], or if there
+is none that can carry the marker, the extend runs regardless.  Extends
+without thresholds, the cheap health checks, are always refreshed.
+
+publish.run() takes the thresholds as --pressure io=20,load=1.5, the runner
+and the collector daemon as an extend's "pressure" dict.  Hosts without PSI
+(kernels before 4.20, or booted with psi=0) are judged by their load alone.
+"""
+
+import json
+import os
+import time
+
+PSI_ROOT = "/proc/pressure"
+RESOURCES = ("cpu", "io", "memory")
+DEFAULT_MAX_DEFER = 3600
+# Seconds before the collector daemon checks a deferred extend again.
+RETRY_INTERVAL = 60
+
+
+def psi(resource, root=PSI_ROOT):
+    """The "some avg60" of *resource*, or None if the kernel has no PSI."""
+    try:
+        with open(os.path.join(root, resource), "r", encoding="ascii") as handle:
+            for line in handle:
+                if line.startswith("some "):
+                    fields = dict(field.split("=", 1) for field in line.split()[1:])
+                    return float(fields["avg60"])
+    except (OSError, KeyError, ValueError):
+        pass
+    return None
+
+
+def load_per_cpu():
+    """The 1 minute load average divided by the number of CPUs."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return None
+
+
+class Thresholds(object):
+    """The pressure an extend backs off at; None leaves a measure out."""
+
+    def __init__(
+        self, cpu=None, io=None, memory=None, load=None, max_defer=DEFAULT_MAX_DEFER
+    ):
+        self.cpu = cpu
+        self.io = io
+        self.memory = memory
+        self.load = load
+        self.max_defer = max_defer
+
+    @classmethod
+    def from_config(cls, config):
+        """Build Thresholds from a "pressure" config dict."""
+        known = RESOURCES + ("load", "max_defer")
+        unknown = set(config) - set(known)
+        if unknown:
+            raise ValueError("pressure: unknown keys %s" % ", ".join(sorted(unknown)))
+        return cls(**{key: float(value) for key, value in config.items()})
+
+    @classmethod
+    def parse(cls, spec):
+        """Build Thresholds from "io=20,load=1.5" and the like."""
+        config = {}
+        for item in spec.split(","):
+            key, sep, value = item.partition("=")
+            if not sep:
+                raise ValueError("pressure: expected key=value, got %r" % item)
+            config[key.strip()] = value
+        return cls.from_config(config)
+
+    def exceeded(self, root=PSI_ROOT):
+        """Why the host is over a threshold, e.g. "io 31.2 > 20", or None."""
+        for resource in RESOURCES:
+            limit = getattr(self, resource)
+            if limit is None:
+                continue
+            value = psi(resource, root)
+            if value is not None and value > limit:
+                return "%s %.1f > %g" % (resource, value, limit)
+        if self.load is not None:
+            value = load_per_cpu()
+            if value is not None and value > self.load:
+                return "load %.2f > %g" % (value, self.load)
+        return None
+
+
+def _document(output):
+    # Imported here: envelope imports timing, which imports loader, which
+    # imports this module.
+    from librenms_extend import envelope
+
+    try:
+        document = json.loads(envelope.decode(output))
+    except ValueError:
+        return None
+    return document if isinstance(document, dict) else None
+
+
+def collected_at(output, default):
+    """When *output* was collected: the time in its "deferred" marker, or
+    *default* if it has none."""
+    document = _document(output)
+    try:
+        return float(document["deferred"]["collected"])
+    except (TypeError, KeyError, ValueError):
+        return default
+
+
+def mark_deferred(output, collected, reason, name=None):
+    """*output* with a "deferred" marker, compressed if it was, or None if
+    it is not a JSON object and cannot carry one."""
+    from librenms_extend import envelope
+
+    document = _document(output)
+    if document is None:
+        return None
+    document["deferred"] = {"collected": int(collected), "reason": reason}
+    compress = envelope.decode(output) is not output
+    return envelope.encode(document, name, compress=compress)
+
+
+def defer(thresholds, output, collected, name=None):
+    """The output to serve instead of running the extend: *output*, which
+    was collected at *collected* (epoch seconds), marked as deferred.  None
+    if the extend is to run, because the host is within *thresholds* or
+    *output* is too old, missing or not a JSON object."""
+    if not output:
+        return None
+    reason = thresholds.exceeded()
+    if reason is None:
+        return None
+    collected = collected_at(output, collected)
+    if time.time() - collected > thresholds.max_defer:
+        return None
+    return mark_deferred(output, collected, reason, name)
@@ -0,0 +1,235 @@
+"""
+Read procfs, sysfs and kstat files without per-sample garbage.
+
+The kernel-stat extends sample the same few files over and over.  Reading
+one with open().readlines() and splitting every line costs an open, a
+close, a decoded str per line and a list per row on every sample.  Here:
+
+  - a Reader keeps its file descriptor open and pread()s the file from
+    offset 0 into a preallocated buffer that grows only when the file
+    outgrows it.  The collector daemon loads an extend once, so the readers
+    it keeps at module level (see reader()) stay open across samples;
+  - the numbers are parsed straight from the bytes, with one split of the
+    whole buffer, into a Table: an array of values plus a name -> position
+    index that is built once and reused for as long as the file lists the
+    same names in the same order.
+
+    from librenms_extend import procfs
+    stats = procfs.kstat("/proc/spl/kstat/zfs/arcstats")
+    stats["hits"], stats.get("recycle_miss", 0)
+
+Tables too large to hold in memory at once (/proc/net/tcp on a busy host)
+are read with chunks() instead, a block of whole lines at a time.
+
+A file that is removed and recreated under an open reader (a kernel module
+reloaded, a cgroup recreated) is reopened on the next read.  Failures raise
+OSError, as open() would.
+"""
+
+import array
+import collections.abc
+import os
+
+DEFAULT_SIZE = 16 * 1024
+# Bytes read at a time by chunks().
+CHUNK_SIZE = 1024 * 1024
+# kstat files: "<id> <type> ..." and "name type data" lines above the rows.
+KSTAT_HEADER_LINES = 2
+
+
+class Table(collections.abc.Mapping):
+    """Read-only name -> number mapping over an array of values."""
+
+    __slots__ = ("names", "index", "values")
+
+    def __init__(self, names, index, values):
+        self.names = names
+        self.index = index
+        self.values = values
+
+    def __getitem__(self, name):
+        return self.values[self.index[name]]
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+
+def _values(tokens):
+    """The integers of *tokens* as an array, or None if one is not an
+    integer."""
+    try:
+        return array.array("q", map(int, tokens))
+    except ValueError:
+        return None
+    except OverflowError:
+        # Beyond int64: fall back to a list of Python ints.
+        return list(map(int, tokens))
+
+
+def _table(names, tokens, previous=None):
+    """A Table of the *names* and integer *tokens* (bytes), reusing the index
+    of *previous* if it has the same names.  Rows whose value is not an
+    integer are left out."""
+    names = names[: len(tokens)]
+    values = _values(tokens)
+    if values is None:
+        rows = [(name, token) for name, token in zip(names, tokens)]
+        names, tokens = [], []
+        for name, token in rows:
+            try:
+                int(token)
+            except ValueError:
+                continue
+            names.append(name)
+            tokens.append(token)
+        values = _values(tokens)
+    if previous is not None and previous.names == names:
+        return Table(previous.names, previous.index, values)
+    index = {name.decode("utf-8", "replace"): pos for pos, name in enumerate(names)}
+    return Table(names, index, values)
+
+
+class Reader(object):
+    """A file kept open and read whole into a reusable buffer."""
+
+    def __init__(self, path, size=DEFAULT_SIZE):
+        self.path = path
+        self._fd = None
+        self._buffer = bytearray(size)
+
+    def _open(self):
+        self._fd = os.open(self.path, os.O_RDONLY | os.O_CLOEXEC)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _read_into(self):
+        total = 0
+        while True:
+            if total == len(self._buffer):
+                self._buffer.extend(bytes(len(self._buffer)))
+            view = memoryview(self._buffer)[total:]
+            try:
+                count = os.preadv(self._fd, [view], total)
+            finally:
+                view.release()
+            if not count:
+                return total
+            total += count
+
+    def read(self):
+        """The file's current content, as a memoryview of the buffer that is
+        valid until the next read()."""
+        if self._fd is not None:
+            try:
+                size = self._read_into()
+                if size:
+                    return memoryview(self._buffer)[:size]
+            except OSError:
+                pass
+            # Removed (and maybe recreated) since the last read.
+            self.close()
+        self._open()
+        return memoryview(self._buffer)[: self._read_into()]
+
+    def tokens(self, skip_lines=0):
+        """The whitespace separated words of the file below its first
+        *skip_lines* lines, as bytes."""
+        view = self.read()
+        try:
+            data = view.tobytes()
+        finally:
+            view.release()
+        if skip_lines:
+            lines = data.split(b"\n", skip_lines)
+            data = lines[skip_lines] if len(lines) > skip_lines else b""
+        return data.split()
+
+
+class KstatReader(Reader):
+    """A kstat file ("name type data" rows below two header lines), e.g.
+    /proc/spl/kstat/zfs/arcstats."""
+
+    _table = None
+
+    def sample(self):
+        """The integer rows as a Table."""
+        tokens = self.tokens(KSTAT_HEADER_LINES)
+        self._table = _table(tokens[0::3], tokens[2::3], self._table)
+        return self._table
+
+
+class PairsReader(Reader):
+    """A file of "name value" rows, e.g. /proc/vmstat or a cgroup's
+    memory.stat."""
+
+    _table = None
+
+    def sample(self):
+        """The integer rows as a Table."""
+        tokens = self.tokens()
+        self._table = _table(tokens[0::2], tokens[1::2], self._table)
+        return self._table
+
+
+# path -> Reader, kept open for the life of the process.
+_readers = {}
+
+
+def reader(path, cls=Reader):
+    """The shared *cls* reader of *path*."""
+    key = (path, cls)
+    if key not in _readers:
+        _readers[key] = cls(path)
+    return _readers[key]
+
+
+def kstat(path):
+    """The integer rows of the kstat file *path* as a Table."""
+    return reader(path, KstatReader).sample()
+
+
+def pairs(path):
+    """The integer rows of the "name value" file *path* as a Table."""
+    return reader(path, PairsReader).sample()
+
+
+def read_int(path):
+    """The single integer in the sysfs file *path*, e.g. a hwmon input."""
+    return int(reader(path).tokens()[0])
+
+
+def chunks(path, size=CHUNK_SIZE):
+    """Yield the content of *path* as bytes, in blocks of whole lines of
+    about *size* bytes each."""
+    fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        rest = b""
+        while True:
+            data = os.read(fd, size)
+            if not data:
+                if rest:
+                    yield rest
+                return
+            data = rest + data
+            end = data.rfind(b"\n") + 1
+            rest = data[end:]
+            if end:
+                yield data[:end]
+    finally:
+        os.close(fd)
+
+
+def close():
+    """Close every shared reader."""
+    for shared in _readers.values():
+        shared.close()
+    _readers.clear()
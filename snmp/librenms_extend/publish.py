@@ -0,0 +1,225 @@
+"""
+Collect in the background, publish atomically, serve with cat.
+
+Every extend that calls publish.run(main) from its __main__ block accepts:
+
+    --publish PATH   Write the extend's output to PATH instead of stdout.
+    --interval N     With --publish, keep running and re-collect every N
+                     seconds instead of exiting after one collection.
+    -Z, --compress   Print the output gzip+base64 encoded, which LibreNMS
+                     detects by itself (see envelope.py).
+
+They also accept --timings and --timings-file PATH, see timing.py,
+--memory, --memory-file PATH and --memory-warn MIB, see memprofile.py, and
+--splay N, --jitter N and --spacing N, which spread expensive collections
+over time, see schedule.py.  With --publish, --pressure THRESHOLDS (e.g.
+io=20,load=1.5) keeps the published output instead of collecting while the
+host is over those thresholds, see pressure.py.
+Every run is also recorded in the run log read by agent_self.py, see
+runlog.py.
+
+The file is replaced with os.replace(), so snmpd always reads either the
+previous or the new complete document and never blocks on a slow collector:
+
+    /etc/cron.d/librenms-ss:
+        */5 * * * * root /etc/snmp/ss.py --publish /var/run/librenms/ss.json
+
+    snmpd.conf:
+        extend ss /bin/cat /var/run/librenms/ss.json
+
+Output printed by the extend's error handler is published as well, so
+LibreNMS still sees the error envelope.  A run that crashes without printing
+anything leaves the previous file in place.
+"""
+
+import contextlib
+import os
+import sys
+import time
+import types
+
+from librenms_extend import loader, runlog, timing
+
+# The options run() takes, and their values when not given.  Most runs get
+# none of them, and are spared importing argparse and the modules behind the
+# options.
+DEFAULTS = {
+    "publish": None,
+    "interval": None,
+    "timings": False,
+    "timings_file": None,
+    "memory": False,
+    "memory_file": None,
+    "memory_warn": None,
+    "splay": 0,
+    "jitter": 0,
+    "spacing": 0,
+    "pressure": None,
+    "compress": False,
+}
+_OPTIONS = {"--" + name.replace("_", "-") for name in DEFAULTS} | {"-Z"}
+
+
+def write_atomic(path, text, end="\n"):
+    """Atomically replace *path* with *text* followed by *end*."""
+    import tempfile
+
+    dir_ = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=dir_, prefix="." + os.path.basename(path) + ".")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            os.fchmod(handle.fileno(), 0o644)
+            handle.write(text + end)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+
+
+def read_published(path):
+    """Return (output, time written) of what is published at *path*, or
+    ("", 0) if nothing is."""
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            return handle.read().rstrip("\n"), os.fstat(handle.fileno()).st_mtime
+    except (OSError, ValueError):
+        return "", 0
+
+
+def publish_deferred(path, thresholds):
+    """If the host is over *thresholds*, mark the output already published
+    at *path* as deferred instead of collecting it again (see pressure.py).
+    Returns whether it did."""
+    from librenms_extend import pressure
+
+    output, collected = read_published(path)
+    marked = pressure.defer(thresholds, output, collected)
+    if marked is None:
+        return False
+    if marked != output:
+        try:
+            write_atomic(path, marked)
+        except OSError as err:
+            print("Publish Error: '%s'" % err, file=sys.stderr)
+    name = os.path.basename(sys.argv[0])
+    runlog.append(name, 0.0, 0, len(marked.encode("utf-8")), runlog.DEFERRED)
+    return True
+
+
+def publish_once(main, path, thresholds=None):
+    """Run *main* once, publish what it printed to *path* and return its exit
+    code.  With *thresholds*, the run is skipped while the host is over
+    them."""
+    if thresholds is not None and publish_deferred(path, thresholds):
+        return 0
+    output, code = loader.call_captured(main)
+    if not output:
+        return code
+    try:
+        write_atomic(path, output)
+    except OSError as err:
+        print("Publish Error: '%s'" % err, file=sys.stderr)
+        return code or 1
+    return code
+
+
+def compressing(main):
+    """Wrap *main* so what it prints is gzip+base64 encoded."""
+    # Imported here: most runs do not compress.
+    from librenms_extend import envelope
+
+    def compressed_main():
+        output, code = loader.call_captured(main)
+        if output:
+            print(envelope.compressed(output))
+        return code
+
+    return compressed_main
+
+
+def parse_args(argv):
+    """Split the publish, timing, memory and scheduling options off *argv*;
+    returns (options, remaining)."""
+    if not any(arg.split("=", 1)[0] in _OPTIONS for arg in argv):
+        return types.SimpleNamespace(**DEFAULTS), list(argv)
+
+    import argparse
+
+    from librenms_extend import pressure
+
+    parser = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    parser.add_argument("--publish", metavar="PATH")
+    parser.add_argument("--interval", type=float, metavar="N")
+    parser.add_argument("--timings", action="store_true")
+    parser.add_argument("--timings-file", metavar="PATH")
+    parser.add_argument("--memory", action="store_true")
+    parser.add_argument("--memory-file", metavar="PATH")
+    parser.add_argument("--memory-warn", type=float, metavar="MIB")
+    parser.add_argument("--splay", type=float, metavar="N")
+    parser.add_argument("--jitter", type=float, metavar="N")
+    parser.add_argument("--spacing", type=float, metavar="N")
+    parser.add_argument("--pressure", metavar="THRESHOLDS")
+    parser.add_argument("-Z", "--compress", action="store_true")
+    parser.set_defaults(**DEFAULTS)
+    options, remaining = parser.parse_known_args(argv)
+    if options.interval is not None and not options.publish:
+        parser.error("--interval requires --publish")
+    if options.interval is not None and options.interval <= 0:
+        parser.error("--interval must be positive")
+    for name in ("splay", "jitter", "spacing"):
+        if getattr(options, name) < 0:
+            parser.error("--%s must not be negative" % name)
+    if options.pressure is not None:
+        if not options.publish:
+            parser.error("--pressure requires --publish")
+        try:
+            options.pressure = pressure.Thresholds.parse(options.pressure)
+        except ValueError as err:
+            parser.error(str(err))
+    return options, remaining
+
+
+def run(main):
+    """Entry point for an extend's __main__ block.
+
+    Without --publish this just calls main() and returns its result, so the
+    extend behaves exactly as before.  The publish options are removed from
+    sys.argv before main() runs, so the extend's own argument handling never
+    sees them."""
+    options, sys.argv[1:] = parse_args(sys.argv[1:])
+    if options.compress:
+        main = compressing(main)
+    if options.timings or options.timings_file:
+        main = timing.instrument(main, options.timings, options.timings_file)
+    if options.memory or options.memory_file or options.memory_warn is not None:
+        from librenms_extend import memprofile
+
+        main = memprofile.instrument(
+            main, options.memory, options.memory_file, options.memory_warn
+        )
+    main = runlog.instrument(main)
+    if not (options.splay or options.jitter or options.spacing):
+        if not options.publish:
+            return main()
+        if options.interval is None:
+            return publish_once(main, options.publish, options.pressure)
+
+    from librenms_extend import schedule
+
+    # Runs are due on a fixed grid from this host's offset; the jitter is
+    # added to each run without moving the grid.
+    key = os.path.basename(sys.argv[0])
+    due = time.monotonic() + schedule.offset(options.splay, key)
+    while True:
+        pause = due - time.monotonic() + schedule.jitter(options.jitter)
+        if pause > 0:
+            time.sleep(pause)
+        with schedule.spaced(options.spacing, options.interval or schedule.MAX_WAIT):
+            if options.publish:
+                code = publish_once(main, options.publish, options.pressure)
+            else:
+                code = main()
+        if options.interval is None:
+            return code
+        due = max(due + options.interval, time.monotonic())
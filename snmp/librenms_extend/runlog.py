@@ -0,0 +1,178 @@
+"""
+Fixed-size on-disk ring buffer of extend runs.
+
+Every run of a Python extend appends one record to RUNLOG_PATH: the extend's
+name, when it finished, how long it took, its exit status, how many bytes it
+printed, whether something was killed for running too long and whether it
+was deferred for host pressure.  The runs are recorded by whoever starts
+them:
+
+  - publish.run() records extends run directly by snmpd or cron, from the
+    call of main() to its end (the interpreter start-up is not included);
+  - the runner and the collector daemon record every extend they start,
+    including the ones they kill, and keep their children from recording the
+    same run again.
+
+The file holds the last SLOTS runs in 64-byte records (256 KiB) and never
+grows: the oldest record is overwritten.  Appends take an flock, so extends
+finishing at the same time never interleave.  agent_self.py reads the file
+back into per-extend latency percentiles.
+
+The LIBRENMS_RUNLOG environment variable names another file, or turns
+recording off when set to an empty string.  If the file cannot be opened,
+e.g. because the directory is missing or not writable by the user running
+the extend, nothing is recorded and the extend runs exactly as before.
+
+The file lives in SHARED_DIR, a directory of its own that only root and
+snmpd's group can write to (mode 2770, see agent_self.py), never in the
+directory extends publish their output to.  It is created mode 0660 whatever
+the umask, and takes the directory's group, so snmpd's user and root's cron
+can both append to it whichever of them created it; a symlink or a file that
+does not hold a run log is never written to.
+"""
+
+import collections
+import fcntl
+import os
+import struct
+import sys
+import time
+
+from librenms_extend import executor, loader
+
+# Shared by snmpd's user and root: root:<snmpd's group>, mode 2770.
+SHARED_DIR = "/var/run/librenms-agent"
+RUNLOG_PATH = os.path.join(SHARED_DIR, "agent_self.ring")
+RUNLOG_ENV = "LIBRENMS_RUNLOG"
+SLOTS = 4096
+
+MAGIC = b"LNMSRUN1"
+# magic, slots, runs appended since the file was created
+HEADER = struct.Struct("<8sIQ44x")
+# name, finished (epoch seconds), duration (seconds), exit status, bytes, flags
+RECORD = struct.Struct("<32sddiIB7x")
+
+# Record flags.
+TIMED_OUT = 1  # killed by the runner or the daemon
+COMMAND_TIMEOUT = 2  # a command it ran was killed, see executor.py
+NOT_STARTED = 4  # skipped, the runner's deadline had passed
+DEFERRED = 8  # not run for host pressure, see pressure.py
+
+Run = collections.namedtuple("Run", "name finished duration exit size flags")
+
+
+def default_path():
+    """The run log of this process, or "" if recording is off."""
+    return os.environ.get(RUNLOG_ENV, RUNLOG_PATH)
+
+
+def take_over():
+    """Return the run log path for a process that records the runs of the
+    extends it starts, and turn recording off for its children."""
+    path = default_path()
+    os.environ[RUNLOG_ENV] = ""
+    return path
+
+
+def open_shared(path):
+    """Open *path* read-write for the owner and group of its directory,
+    creating it mode 0660 whatever the umask.  Symlinks are not followed:
+    the file lives in a directory other users write to.  Returns the file
+    descriptor."""
+    flags = os.O_RDWR | os.O_NOFOLLOW
+    try:
+        fd = os.open(path, flags | os.O_CREAT | os.O_EXCL, 0o660)
+    except FileExistsError:
+        # Not O_CREAT: with fs.protected_regular, that fails on another
+        # user's file in a sticky directory.
+        return os.open(path, flags)
+    try:
+        os.fchmod(fd, 0o660)
+    except OSError:
+        os.close(fd)
+        raise
+    return fd
+
+
+def append(name, duration, code, size, flags=0, path=None):
+    """Append a run to the log.  Returns False if it could not be written."""
+    path = default_path() if path is None else path
+    if not path:
+        return False
+    record = RECORD.pack(
+        name.encode("utf-8")[:32],
+        time.time(),
+        duration,
+        code,
+        min(size, 0xFFFFFFFF),
+        flags,
+    )
+    try:
+        fd = open_shared(path)
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        header = os.pread(fd, HEADER.size, 0)
+        if len(header) == HEADER.size and header.startswith(MAGIC):
+            _, slots, count = HEADER.unpack(header)
+        elif not header:
+            # New file: lay out an empty ring.
+            slots, count = SLOTS, 0
+            os.ftruncate(fd, HEADER.size + slots * RECORD.size)
+        else:
+            return False  # Not a run log: leave it alone
+        os.pwrite(fd, record, HEADER.size + count % slots * RECORD.size)
+        os.pwrite(fd, HEADER.pack(MAGIC, slots, count + 1), 0)
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+    return True
+
+
+def read(path=None):
+    """Return the recorded runs, oldest first.  Raises OSError if the log
+    cannot be read."""
+    path = default_path() if path is None else path
+    with open(path, "rb") as handle:
+        fcntl.flock(handle, fcntl.LOCK_SH)
+        header = handle.read(HEADER.size)
+        if len(header) != HEADER.size or not header.startswith(MAGIC):
+            return []
+        _, slots, count = HEADER.unpack(header)
+        data = handle.read(slots * RECORD.size)
+    used = min(count, slots)
+    first = count % slots if count > slots else 0
+    runs = []
+    for index in range(used):
+        slot = (first + index) % slots
+        offset = slot * RECORD.size
+        if offset + RECORD.size > len(data):
+            continue
+        fields = RECORD.unpack_from(data, offset)
+        name = fields[0].rstrip(b"\0").decode("utf-8", errors="replace")
+        runs.append(Run(name, *fields[1:]))
+    return runs
+
+
+def instrument(main, name=None):
+    """Wrap *main* so each call is appended to the run log under *name* (the
+    script's file name by default).  Returns *main* itself if recording is
+    off or the log's directory does not exist."""
+    path = default_path()
+    if not path or not os.path.isdir(os.path.dirname(path) or "."):
+        return main
+    name = name or os.path.basename(sys.argv[0])
+
+    def logged_main():
+        started = time.monotonic()
+        output, code = loader.call_captured(main)
+        flags = COMMAND_TIMEOUT if executor.timeout_count() else 0
+        duration = time.monotonic() - started
+        append(name, duration, code, len(output.encode("utf-8")), flags, path)
+        if output:
+            print(output)
+        return code
+
+    return logged_main
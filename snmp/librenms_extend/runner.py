@@ -0,0 +1,259 @@
+"""
+Parallel multi-extend runner.
+
+Runs a configured set of extends concurrently, each in its own child process,
+at most `workers` at a time, and publishes every result to the extend's
+publish file for snmpd to cat.  The total wall time is therefore that of the
+slowest extend rather than the sum of all of them.
+
+Two deadlines bound a run:
+
+  - each extend is killed (with its whole process group) after its own
+    "timeout" seconds;
+  - no extend runs past the global "deadline", counted from the start of the
+    run.  Extends still queued when it passes are not started at all.
+
+Either way the publish file receives a LibreNMS error envelope saying so,
+instead of keeping stale data that looks current.
+
+Extends can be given a niceness, an I/O class, a CPU quota and a memory cap
+(see isolation.py) so collection stays out of the way of the host's real
+workload.  With "stats" set, every run writes the exit status, run time and
+cgroup throttling counters of each extend to that file:
+
+    {"time": 1700000000, "extends": {"storraid": {"exit": 0,
+     "elapsed": 4.21, "bytes": 2173, "nr_throttled": 12,
+     "throttled_usec": 1830551, ...}}}
+
+Every run, killed or not, is also recorded in the run log read by
+agent_self.py (see runlog.py).
+
+Extends with "splay" or "jitter" start that far into the run instead of all
+at once, and those with "spacing" take turns with the host's other heavy
+collections (see schedule.py).  Neither wait is allowed to cut into an
+extend's timeout: past the point where it would, the extend just starts.
+Extends with "pressure" thresholds keep their published output, marked as
+deferred, while the host is over them (see pressure.py).
+"""
+
+import argparse
+import concurrent.futures
+import json
+import sys
+import time
+
+from librenms_extend import isolation, loader, pressure, publish, runlog, schedule
+
+DEFAULT_CONFIG_FILE = "/etc/snmp/librenms_runner.json"
+DEFAULT_WORKERS = 4
+DEFAULT_DEADLINE = 60
+
+
+def error_envelope(error_string):
+    """A LibreNMS application envelope carrying only an error."""
+    return json.dumps(
+        {"errorString": error_string, "error": 1, "version": 1, "data": {}}
+    )
+
+
+def config_file_parser(config_path):
+    """Return (extends, workers, deadline, cgroup root, stats path) from the
+    runner config file."""
+    with open(config_path, "r", encoding="utf-8") as json_file:
+        config = json.load(json_file)
+    extends = []
+    for name, extend_config in config["extends"].items():
+        extend = loader.Extend.from_config(name, extend_config)
+        if not extend.publish:
+            raise KeyError("%s: publish" % name)
+        extends.append(extend)
+    workers = int(config.get("workers", DEFAULT_WORKERS))
+    deadline = float(config.get("deadline", DEFAULT_DEADLINE))
+    cgroup_root = config.get("cgroup_root", isolation.CGROUP_ROOT)
+    return extends, workers, deadline, cgroup_root, config.get("stats")
+
+
+def create_cgroup(extend, cgroup_root):
+    """Return a created isolation.Cgroup for *extend*, or None if it needs
+    none or the cgroup cannot be created."""
+    if not extend.limits.cgroup:
+        return None
+    cgroup = isolation.Cgroup(extend.name, extend.limits, cgroup_root)
+    try:
+        cgroup.create()
+    except OSError as err:
+        print("%s: Cgroup Error: '%s'" % (extend.name, err), file=sys.stderr)
+        return None
+    return cgroup
+
+
+def run_extend(extend, end, cgroup_root=isolation.CGROUP_ROOT, start=None):
+    """Run *extend* within its own timeout and the global deadline *end* (a
+    time.monotonic() value), not before *start* if given.  Returns (text to
+    publish, exit code, stats)."""
+    if end <= time.monotonic():
+        output = error_envelope("Runner Deadline Exceeded: not started")
+        return output, 0, {"exit": None, "elapsed": 0.0}
+
+    # Waiting for the scheduled start or the heavy slot never costs the
+    # extend any of its timeout.
+    latest = end - extend.timeout
+    if start is not None and min(start, latest) > time.monotonic():
+        time.sleep(min(start, latest) - time.monotonic())
+    if extend.pressure is not None:
+        published, collected = publish.read_published(extend.publish)
+        output = pressure.defer(extend.pressure, published, collected, extend.name)
+        if output is not None:
+            stats = {"exit": None, "elapsed": 0.0, "deferred": True}
+            return output, 0, stats
+    with schedule.spaced(extend.spacing, max(0.0, latest - time.monotonic())):
+        started = time.monotonic()
+        timeout = min(extend.timeout, max(0.0, end - started))
+        cgroup = create_cgroup(extend, cgroup_root)
+        if cgroup is None:
+            output, code = extend.run_subprocess(timeout)
+        else:
+            try:
+                output, code = extend.run_subprocess(timeout, cgroup.prefix())
+            finally:
+                cgroup_stats = cgroup.stats()
+                cgroup.remove()
+    stats = {
+        "exit": code,
+        "elapsed": round(time.monotonic() - started, 3),
+        "bytes": len(output.encode("utf-8")),
+    }
+    if cgroup is not None:
+        stats.update(cgroup_stats)
+
+    if code == loader.TIMEOUT_STATUS and not output:
+        output = error_envelope("Command Timeout: killed after %.1fs" % timeout)
+    elif stats.get("oom_kill") and not output:
+        limit = extend.limits.memory_max
+        output = error_envelope("Memory Limit Exceeded: killed at %s" % limit)
+    elif not output:
+        output = error_envelope("Command Execution Error: exit status %d" % code)
+    return output, code, stats
+
+
+def run_all(
+    extends,
+    workers,
+    deadline,
+    verbose=False,
+    cgroup_root=isolation.CGROUP_ROOT,
+    stats_path=None,
+    runlog_path="",
+):
+    """Run every extend and publish its result, and record it in the run log
+    *runlog_path*.  Returns the number of extends whose result could not be
+    published."""
+    begun = time.monotonic()
+    end = begun + deadline
+    starts = {
+        extend.name: begun
+        + schedule.offset(extend.splay, extend.name)
+        + schedule.jitter(extend.jitter)
+        for extend in extends
+    }
+    failures = 0
+    all_stats = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        # Soonest first, so waiting extends do not hold up the workers.
+        futures = {
+            pool.submit(
+                run_extend, extend, end, cgroup_root, starts[extend.name]
+            ): extend
+            for extend in sorted(extends, key=lambda extend: starts[extend.name])
+        }
+        for future in concurrent.futures.as_completed(futures):
+            extend = futures[future]
+            output, code, stats = future.result()
+            all_stats[extend.name] = stats
+            record_run(extend, code, stats, runlog_path)
+            try:
+                publish.write_atomic(extend.publish, output)
+            except OSError as err:
+                print("%s: Publish Error: '%s'" % (extend.name, err), file=sys.stderr)
+                failures += 1
+            if verbose and stats.get("deferred"):
+                print("%s: deferred for host pressure" % extend.name)
+            elif verbose:
+                print(
+                    "%s: exit %d in %.3fs%s"
+                    % (extend.name, code, stats["elapsed"], format_throttling(stats))
+                )
+    if stats_path:
+        document = {"time": int(time.time()), "extends": all_stats}
+        try:
+            publish.write_atomic(stats_path, json.dumps(document))
+        except OSError as err:
+            print("Stats Error: '%s'" % err, file=sys.stderr)
+    return failures
+
+
+def record_run(extend, code, stats, runlog_path):
+    """Append the run of *extend* described by *stats* to the run log."""
+    if stats.get("deferred"):
+        flags = runlog.DEFERRED
+    elif stats["exit"] is None:
+        flags = runlog.NOT_STARTED
+    elif code == loader.TIMEOUT_STATUS:
+        flags = runlog.TIMED_OUT
+    else:
+        flags = 0
+    runlog.append(
+        extend.name, stats["elapsed"], code, stats.get("bytes", 0), flags, runlog_path
+    )
+
+
+def format_throttling(stats):
+    """The cgroup counters in *stats* as a suffix for the verbose output."""
+    if "nr_throttled" not in stats and "memory_peak" not in stats:
+        return ""
+    return ", throttled %d/%d periods (%.3fs), memory peak %.1f MiB" % (
+        stats.get("nr_throttled", 0),
+        stats.get("nr_periods", 0),
+        stats.get("throttled_usec", 0) / 1e6,
+        stats.get("memory_peak", 0) / 1048576,
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Run LibreNMS extends in parallel and publish their output"
+    )
+    parser.add_argument(
+        "-c",
+        "--config",
+        default=DEFAULT_CONFIG_FILE,
+        help="Path to configuration JSON file (default: %s)" % DEFAULT_CONFIG_FILE,
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Print the exit status and run time of every extend",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        extends, workers, deadline, cgroup_root, stats_path = config_file_parser(
+            args.config
+        )
+    except (KeyError, TypeError, ValueError, OSError) as err:
+        print("Config File Error: '%s'" % err, file=sys.stderr)
+        return 1
+    failures = run_all(
+        extends,
+        workers,
+        deadline,
+        args.verbose,
+        cgroup_root,
+        stats_path,
+        runlog.take_over(),
+    )
+    return 1 if failures else 0
@@ -0,0 +1,138 @@
+"""
+Spread expensive collections over time, across the fleet and on each host.
+
+A `*/5` cron line starts a collection on every host at the same second, so
+storage arrays, hypervisors and API servers shared by many hosts see all of
+them at once.  Three settings spread the load:
+
+  - splay: wait a per-host offset within the given number of seconds before
+    collecting.  The offset is derived from a hash of the host name and the
+    extend's name, so it is the same on every run (each host keeps its place
+    in the cycle) but differs between hosts and between the extends of one
+    host;
+  - jitter: add up to that many seconds at random on top, on every run;
+  - spacing: treat the collection as heavy.  Heavy collections on one host
+    never overlap and start at least that many seconds after the previous one
+    ended.  They take turns through an flock on SLOT_PATH, so this holds
+    between cron jobs, the runner and the collector daemon alike.
+
+publish.run() takes them as --splay, --jitter and --spacing, the runner and
+the collector daemon as the "splay", "jitter" and "spacing" keys of an
+extend:
+
+    */5 * * * * root /etc/snmp/storraid.py --splay 180 --spacing 30 \\
+                         --publish /var/run/librenms/storraid.json
+
+Spacing is a preference, never a reason to skip a collection: when a wait
+for the slot would run past its limit, the collection runs anyway.  The
+collector daemon, which runs its extends one after the other, waits no
+longer than until its next extend is due and tries again later instead.  The
+LIBRENMS_SLOT environment variable names another slot file, or turns spacing
+off when set to an empty string.  A slot file that cannot be opened turns it
+off as well, with a warning on stderr.  Like the run log (see runlog.py),
+the slot file lives in the group-only runlog.SHARED_DIR (created as
+agent_self.py's install notes describe) and is created mode 0660 whatever
+the umask, so cron jobs run as root and the snmp user's daemon take turns
+through the same file, and it is never opened through a symlink.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import os
+import random
+import socket
+import sys
+import time
+
+from librenms_extend import runlog
+
+SLOT_PATH = os.path.join(runlog.SHARED_DIR, "heavy.slot")
+SLOT_ENV = "LIBRENMS_SLOT"
+# Seconds between attempts to take the slot.
+POLL_INTERVAL = 0.5
+# Longest a one-off collection waits for the slot: within a 5 minute cycle.
+MAX_WAIT = 240
+
+
+def offset(splay, key, host=None):
+    """This host's fixed offset for *key*, in seconds within *splay*."""
+    if not splay:
+        return 0.0
+    host = host or socket.gethostname()
+    digest = hashlib.sha1(("%s/%s" % (host, key)).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64 * splay
+
+
+def jitter(seconds):
+    """A random delay of up to *seconds*."""
+    return random.uniform(0, seconds) if seconds else 0.0
+
+
+def slot_path():
+    """The slot file of this process, or "" if spacing is off."""
+    return os.environ.get(SLOT_ENV, SLOT_PATH)
+
+
+def _last_end(handle):
+    handle.seek(0)
+    try:
+        return float(handle.read().strip() or 0)
+    except ValueError:
+        return 0.0
+
+
+@contextlib.contextmanager
+def spaced(spacing, limit=None, path=None):
+    """Hold the host's heavy collection slot for the duration of the block,
+    waiting at most *limit* seconds for it (no limit if None).  The block
+    gets False when the limit passed before its turn came; a block that
+    runs anyway then does not delay the next heavy collection."""
+    path = slot_path() if path is None else path
+    if not spacing or not path:
+        yield True
+        return
+    try:
+        fd = runlog.open_shared(path)
+    except OSError as err:
+        print("Spacing Error: '%s'" % err, file=sys.stderr)
+        yield True
+        return
+    end = None if limit is None else time.monotonic() + limit
+
+    def wait(seconds):
+        if end is not None:
+            seconds = min(seconds, end - time.monotonic())
+        if seconds <= 0:
+            return False
+        time.sleep(seconds)
+        return True
+
+    with os.fdopen(fd, "r+", encoding="ascii") as handle:
+        locked = False
+        while True:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                locked = True
+                break
+            except BlockingIOError:
+                if not wait(POLL_INTERVAL):
+                    break
+        turn = locked
+        if locked:
+            # Capped at spacing, so a clock set back cannot stall us.
+            gap = min(spacing, _last_end(handle) + spacing - time.time())
+            if gap > 0:
+                # Only waited out when it fits in the limit.
+                turn = end is None or end - time.monotonic() >= gap
+                if turn:
+                    time.sleep(gap)
+        try:
+            yield turn
+        finally:
+            if turn:
+                handle.seek(0)
+                handle.truncate()
+                handle.write("%.3f\n" % time.time())
+                handle.flush()
+                fcntl.flock(handle, fcntl.LOCK_UN)
@@ -0,0 +1,216 @@
+"""
+Opt-in per-phase timings.
+
+Extends mark the expensive parts of a run with
+
+    with timing.command(cmd):
+        poutput = subprocess.check_output(cmd, ...)
+    with timing.phase("parse"):
+        ...
+    with timing.phase("encode"):
+        text = json.dumps(output_data)
+
+which costs nothing unless timings were asked for.  Every extend that calls
+publish.run(main) from its __main__ block accepts:
+
+    --timings             Add a "timings" object to the printed envelope.
+    --timings-file PATH   Write the timings to PATH as a JSON sidecar.
+
+The timings hold the wall and CPU seconds of the whole run ("total"), of each
+named phase (summed over repeated entries, with a count), and of every command
+spawned, CPU being the child's user+system time:
+
+    "timings": {
+        "total": {"wall": 0.412, "cpu": 0.301},
+        "phases": {"parse": {"wall": 0.288, "cpu": 0.287, "count": 5}, ...},
+        "commands": [{"command": "/sbin/ss --tcp ...", "wall": 0.09,
+                      "cpu": 0.081}, ...]
+    }
+
+A command whose output is streamed into the parser (executor.iter_lines())
+runs while it is parsed, so its time and that of the "parse" phase overlap.
+Extends encoding their output with envelope.py also get an "encode" object
+with its sizes and compression ratio.
+
+Output that is not a JSON object cannot carry the timings inline; use the
+sidecar for those extends.  Compressed output is decompressed, extended and
+compressed again.
+
+The end of every phase and command block is also a memprofile checkpoint.
+"""
+
+import contextlib
+import json
+import os
+import resource
+import sys
+import time
+
+from librenms_extend import loader
+
+# The Recorder of the run in progress, or None when timings are off.
+_recorder = None
+
+
+def _checkpoint():
+    # memprofile is only imported when --memory asked for it (see publish.py).
+    memprofile = sys.modules.get("librenms_extend.memprofile")
+    if memprofile is not None:
+        memprofile.checkpoint()
+
+
+def _children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Recorder(object):
+    """Wall and CPU time of one run, per phase and per command."""
+
+    def __init__(self):
+        self.total = None
+        self.phases = {}
+        self.commands = []
+        self.notes = {}
+
+    def add_phase(self, name, wall, cpu):
+        entry = self.phases.setdefault(name, {"wall": 0.0, "cpu": 0.0, "count": 0})
+        entry["wall"] += wall
+        entry["cpu"] += cpu
+        entry["count"] += 1
+
+    def add_command(self, command, wall, cpu, failed):
+        entry = {"command": command, "wall": wall, "cpu": cpu}
+        if failed:
+            entry["failed"] = True
+        self.commands.append(entry)
+
+    def as_dict(self):
+        timings = {
+            "total": self.total,
+            "phases": self.phases,
+            "commands": self.commands,
+        }
+        timings.update(self.notes)
+        return timings
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Time the enclosed block as phase *name*."""
+    recorder = _recorder
+    if recorder is None:
+        yield
+    else:
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            recorder.add_phase(
+                name, time.perf_counter() - wall, time.process_time() - cpu
+            )
+    _checkpoint()
+
+
+@contextlib.contextmanager
+def command(cmd):
+    """Time the enclosed block as a run of the command list *cmd*.  The block
+    must wait for the child, so its CPU time is accounted."""
+    recorder = _recorder
+    if recorder is None:
+        yield
+    else:
+        wall = time.perf_counter()
+        cpu = _children_cpu()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            recorder.add_command(
+                " ".join(str(arg) for arg in cmd),
+                time.perf_counter() - wall,
+                _children_cpu() - cpu,
+                failed,
+            )
+    _checkpoint()
+
+
+def annotate(key, value):
+    """Add *value* to the timings under *key*; does nothing unless timings
+    were asked for."""
+    recorder = _recorder
+    if recorder is not None:
+        recorder.notes[key] = value
+
+
+def record(main):
+    """Call *main* with stdout captured and every phase and command timed.
+    Returns (output, exit code, Recorder)."""
+    global _recorder
+    recorder = _recorder = Recorder()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        output, code = loader.call_captured(main)
+    finally:
+        _recorder = None
+    recorder.total = {
+        "wall": time.perf_counter() - wall,
+        "cpu": time.process_time() - cpu,
+    }
+    return output, code, recorder
+
+
+def attach(output, timings):
+    """Return the JSON object *output* with a "timings" key added, or None if
+    *output* is not a JSON object."""
+    # Imported here, envelope imports this module.
+    from librenms_extend import envelope
+
+    text = envelope.decode(output)
+    try:
+        document = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(document, dict):
+        return None
+    document["timings"] = timings
+    if text is output:
+        return json.dumps(document)
+    payload = json.dumps(document).encode("utf-8")
+    return envelope.gzip_base64(payload, envelope.level_for(len(payload)))
+
+
+def instrument(main, inline=False, path=None):
+    """Wrap *main* so each call records its timings, then adds them to the
+    printed envelope (*inline*) and/or writes them to the sidecar *path*."""
+    # Imported here, publish imports this module.
+    from librenms_extend import publish
+
+    def timed_main():
+        output, code, recorder = record(main)
+        timings = recorder.as_dict()
+        if inline and output:
+            attached = attach(output, timings)
+            if attached is None:
+                print("Timings Error: output is not a JSON object", file=sys.stderr)
+            else:
+                output = attached
+        if path:
+            sidecar = {
+                "extend": os.path.basename(sys.argv[0]),
+                "time": int(time.time()),
+                "exit": code,
+                "timings": timings,
+            }
+            try:
+                publish.write_atomic(path, json.dumps(sidecar))
+            except OSError as err:
+                print("Timings Error: '%s'" % err, file=sys.stderr)
+        if output:
+            print(output)
+        return code
+
+    return timed_main
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+#
+# Name: LibreNMS Extend Runner
+# Version: 1.0
+# Description: Runs a set of extends concurrently from cron, with a timeout per
+#              extend and a deadline for the whole run, and publishes each result
+#              to a file that snmpd serves with cat.  Extends that time out get a
+#              LibreNMS error envelope instead of stale data.
+# Installation:
+#     1. Copy this script and the librenms_extend directory to /etc/snmp/ and make
+#        the script executable:
+#         chmod +x /etc/snmp/librenms_runner.py
+#     2. Create /etc/snmp/librenms_runner.json.  Top-level keys:
+#           a.) "workers"  - (optional) Extends run at the same time [4].
+#           b.) "deadline" - (optional) Seconds the whole run may take [60].
+#           c.) "stats"    - (optional) File each run writes the exit status, run
+#                            time and cgroup throttling counters of every extend to.
+#           d.) "cgroup_root" - (optional) Parent of the per-run cgroups
+#                            [/sys/fs/cgroup/librenms].
+#           e.) "extends"  - The extends to run, keyed by name, each with:
+#                 "script" or "command" - Python extend, or any command list.
+#                 "publish"             - File the output is written to.
+#                 "args"                - (optional) Extra arguments.
+#                 "timeout"             - (optional) Seconds before it is killed [30].
+#                 "nice"                - (optional) Niceness to run at.
+#                 "ionice"              - (optional) I/O class: "idle", or
+#                                         "best-effort:<level>".
+#                 "cpu_quota"           - (optional) Percent of one CPU it may use.
+#                 "memory_max"          - (optional) Memory cap, e.g. "256M".
+#                 "splay"               - (optional) Start at this host's fixed
+#                                         offset within that many seconds.
+#                 "jitter"              - (optional) Start up to that many
+#                                         seconds later, at random.
+#                 "spacing"             - (optional) Heavy: never run alongside
+#                                         another heavy collection on the host,
+#                                         and start that many seconds after it.
+#                 "pressure"            - (optional) Keep the published output
+#                                         while the host is over thresholds,
+#                                         e.g. {"io": 20, "load": 1.5}.
+#                 "compress"            - (optional) gzip+base64 encode the
+#                                         output, which LibreNMS detects by
+#                                         itself [false].
+#              See librenms_extend/isolation.py for the limits and
+#              librenms_extend/schedule.py and pressure.py for the scheduling.
+#         ```
+#         {
+#             "workers": 4,
+#             "deadline": 50,
+#             "stats": "/var/run/librenms/runner-stats.json",
+#             "extends": {
+#                 "ss": {
+#                     "script": "/etc/snmp/ss.py",
+#                     "publish": "/var/run/librenms/ss.json"
+#                 },
+#                 "systemd": {
+#                     "script": "/etc/snmp/systemd.py",
+#                     "publish": "/var/run/librenms/systemd.json",
+#                     "timeout": 10
+#                 },
+#                 "smart": {
+#                     "command": ["/etc/snmp/smart", "-c", "/etc/snmp/smart.config"],
+#                     "publish": "/var/run/librenms/smart.json",
+#                     "timeout": 45,
+#                     "nice": 19,
+#                     "ionice": "idle",
+#                     "cpu_quota": 20,
+#                     "memory_max": "128M",
+#                     "splay": 120,
+#                     "spacing": 30,
+#                     "pressure": {"io": 20, "load": 1.5}
+#                 }
+#             }
+#         }
+#         ```
+#     3. Run it from cron and serve each file from snmpd.conf:
+#         */5 * * * * root /etc/snmp/librenms_runner.py
+#         extend ss /bin/cat /var/run/librenms/ss.json
+#     4. Restart snmpd.
+
+import sys
+
+from librenms_extend import runner
+
+if __name__ == "__main__":
+    sys.exit(runner.main())
@@ -8,7 +8,8 @@
 #              LibreNMS via the linux_config_files application.  Additional distribution
 #              support may be added.
 # Installation:
-#     1. Copy this script to /etc/snmp/ and make it executable:
+#     1. Copy this script and the librenms_extend directory to /etc/snmp/ and make
+#        the script executable:
 #         chmod +x /etc/snmp/linux_config_files.py
 #     2. Edit your snmpd.conf and include:
 #         extend linux_config_files /etc/snmp/linux_config_files.py
@@ -28,10 +29,15 @@ import json
 import subprocess
 import sys
 
+from librenms_extend import executor
+
 CONFIG_FILE = "/etc/snmp/linux_config_files.json"
 PKG_SYSTEM = "rpm"
 PKG_TOOL_ARGS = {"rpm": ["--all", "--test"]}
 PKG_TOOL_CMD = {"rpm": "/sbin/rpmconf"}
+# Seconds the package tool may take before it is killed.  rpmconf reads the
+# whole rpmdb, so allow it far longer than the other extends' tools.
+COMMAND_TIMEOUT = 60
 
 
 def error_handler(error_name, err):
@@ -102,11 +108,9 @@ def command_executor(pkg_system, pkg_tool_cmd):
     poutput = None
     try:
         # Execute pkg_tool_cmd command
-        poutput = subprocess.check_output(
-            pkg_tool_cmd,
-            stdin=None,
-            stderr=subprocess.PIPE,
-        )
+        poutput = executor.check_output(pkg_tool_cmd, COMMAND_TIMEOUT)
+    except subprocess.TimeoutExpired as err:
+        error_handler("Command Timeout", err)
     except (subprocess.CalledProcessError, OSError) as err:
         # Per rpmconf man page, an error code of 5 indicates there are conf file
         # to merge, so disregard that error code.
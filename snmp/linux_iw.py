@@ -9,7 +9,8 @@ Description: This is a simple script to parse iw command output for ingestion in
              linux_iw application.  This script can be used on wireless clients as well as wireless
              access points.
 Installation:
-    1. Copy this script to /etc/snmp/ and make it executable:
+    1. Copy this script and the librenms_extend directory to /etc/snmp/ and make the
+       script executable:
         chmod +x /etc/snmp/linux_iw.py
     2. Edit your snmpd.conf and include:
         extend linux_iw /etc/snmp/linux_iw.py
@@ -36,6 +37,17 @@ Installation:
         }
         ```
     4. Restart snmpd and activate the app for desired host.
+    5. (Optional) To collect in the background instead of on every poll, run the
+       script from cron with --publish and have snmpd serve the file:
+           */5 * * * * root /etc/snmp/linux_iw.py --publish /var/run/librenms/linux_iw.json
+           extend linux_iw /bin/cat /var/run/librenms/linux_iw.json
+       Add --interval <seconds> to keep it running instead of using cron.
+       Add --timings (or --timings-file <path>) to report the time spent per
+       command and phase, see librenms_extend/timing.py.
+    6. (Optional) Served from librenms_collectord.py, the output must fit in the
+       4094 bytes snmpd reads of a pass_persist value.  On hosts where it is
+       longer, set "compress": true for linux_iw in that daemon's config, or
+       keep the host on "extend" lines (see librenms_collectord.py).
 """
 
 import json
@@ -43,6 +55,8 @@ import re
 import subprocess
 import sys
 
+from librenms_extend import envelope, executor, lineparser, publish, timing
+
 VALID_MAC_ADDR = (
     r"([0-9a-fA-F][0-9a-fA-F]:"
     + r"[0-9a-fA-F][0-9a-fA-F]:"
@@ -180,7 +194,14 @@ SUB_REGEX_MAPPER = {
         },
     },
 }
+# Each table compiled once, see librenms_extend/lineparser.py.
+SUB_PARSERS = {
+    name: lineparser.LineParser(table, search=True)
+    for name, table in SUB_REGEX_MAPPER.items()
+}
 IW_CMD = "/usr/sbin/iw"
+# Seconds each iw invocation may take before it is killed.
+COMMAND_TIMEOUT = 5
 
 
 def error_handler(error_name, err):
@@ -253,11 +274,11 @@ def command_executor(iw_cmd, iw_args, command_output_regex):
     """
     try:
         # Execute iw command
-        poutput = subprocess.check_output(
-            iw_cmd + iw_args,
-            stdin=None,
-            stderr=subprocess.PIPE,
-        )
+        with timing.command(iw_cmd + iw_args):
+            poutput = executor.check_output(iw_cmd + iw_args, COMMAND_TIMEOUT)
+    except subprocess.TimeoutExpired as err:
+        # Keep the interfaces and stations that did answer.
+        poutput = executor.record_timeout(err)
     except (subprocess.CalledProcessError, OSError) as err:
         error_handler("Command Execution Error", err)
 
@@ -269,14 +290,15 @@ def command_executor(iw_cmd, iw_args, command_output_regex):
     return poutput
 
 
-def output_parser(iw_output, iw_regex_dict):
+def output_parser(iw_output, iw_parser):
     """
     output_parser(): Parses the iw command output and returns a dictionary
                      of PSU metrics.
 
     Inputs:
         iw_output: The iw command stdout
-        iw_regex_dict: A dictionary of regex and variable type values.
+        iw_parser: The SUB_PARSERS entry compiled from the SUB_REGEX_MAPPER table for
+                   the command.
     Outputs:
         iw_data: A dictionary of iw metics.
     """
@@ -285,24 +307,11 @@ def output_parser(iw_output, iw_regex_dict):
     if not iw_output:
         return iw_data
 
-    for line in iw_output.decode("utf-8").split("\n"):
-        for metric_type, regex_dict in iw_regex_dict.items():
-            regex_search = re.search(regex_dict["regex"], line)
-
-            if not regex_search:
-                continue
-
-            try:
-                metric_value = regex_search.groups()[0]
-
-                if regex_dict["variable_type"] == "type_int":
-                    iw_data[metric_type] = int(metric_value)
-                if regex_dict["variable_type"] == "type_float":
-                    iw_data[metric_type] = float(metric_value)
-                if regex_dict["variable_type"] == "type_string":
-                    iw_data[metric_type] = str(metric_value)
-            except (IndexError, ValueError) as err:
-                error_handler("Command Output Parsing Error", err)
+    with timing.phase("parse"):
+        try:
+            iw_parser.parse(iw_output.decode("utf-8").split("\n"), iw_data)
+        except ValueError as err:
+            error_handler("Command Output Parsing Error", err)
 
     return iw_data
 
@@ -348,7 +357,7 @@ def main():
         output_data["data"]["interfaces"][interface].update(
             output_parser(
                 command_executor(iw_cmd, ["dev", interface, "info"], None),
-                SUB_REGEX_MAPPER["interface_info"],
+                SUB_PARSERS["interface_info"],
             )
         )
 
@@ -365,7 +374,7 @@ def main():
                     [interface, "survey", "dump"],
                     survey_dump_command_output_regex,
                 ),
-                SUB_REGEX_MAPPER["survey_dump"],
+                SUB_PARSERS["survey_dump"],
             )
         )
 
@@ -386,7 +395,7 @@ def main():
                     command_executor(
                         iw_cmd, ["dev", interface, "station", "get", station], None
                     ),
-                    SUB_REGEX_MAPPER["station_get"],
+                    SUB_PARSERS["station_get"],
                 )
             )
 
@@ -402,8 +411,9 @@ def main():
                 - output_data["data"]["interfaces"][interface]["noise"]
             )
 
-    print(json.dumps(output_data))
+    executor.mark_partial(output_data)
+    print(envelope.encode(output_data))
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(publish.run(main))
@@ -49,7 +49,8 @@
 #
 # - Sensors method: pip install PySensors
 # - hpasmcli method: install hp-health package for your distribution
-# - Copy this script somewhere, e.g. /usr/local/bin
+# - Copy this script and the librenms_extend directory it needs to the same
+#   place, e.g. /usr/local/bin
 # - Uncomment costPerkWh and change the value
 # - Test then customise top-level reading
 # - Add the 'extend' config to snmpd.conf
@@ -76,6 +77,8 @@ import shutil
 import subprocess
 import sys
 
+from librenms_extend import lineparser
+
 ### Option defaults
 
 method = ""  # must be one of methods array
@@ -219,6 +222,21 @@ def getSensorData():
         return sdata
 
 
+# hpasmcli "show powermeter; show powersupply" lines, after the leading
+# whitespace is removed
+hpasmSpecs = {
+    "meter": {"regex": r"^Power Meter #([0-9].*)"},
+    "meter_reading": {"regex": r"^Power Reading  :(.*)"},
+    "psu": {"regex": r"^Power supply #([0-9].*)"},
+    "present": {"regex": r"^Present  :(.*)"},
+    "redundant": {"regex": r"^Redundant:(.*)"},
+    "condition": {"regex": r"^Condition:(.*)"},
+    "hotplug": {"regex": r"^Hotplug  :(.*)"},
+    "reading": {"regex": r"^Power    :(.*)"},
+}
+hpasmParser = lineparser.LineParser(hpasmSpecs)
+
+
 def getHPASMData():
     global error, errorString
 
@@ -242,55 +260,27 @@ def getHPASMData():
     hdata["meter"] = {}
     hdata["psu"] = {}
 
-    re_meter = "^Power Meter #([0-9]+)"
-    re_meter_reading = "^Power Reading  :"
-    re_psu = "^Power supply #[0-9]+"
-    re_psu_present = "^Present  :"
-    re_psu_redundant = "^Redundant:"
-    re_psu_condition = "^Condition:"
-    re_psu_hotplug = "^Hotplug  :"
-    re_psu_reading = "^Power    :"
-
     for line in rawdata:
-        if re.match(re_meter, line):
-            verboseMsg("found power meter: " + line)
-            junk, meter_id = line.split("#", 1)
-            hdata["meter"][meter_id] = {}
-
-        elif re.match(re_meter_reading, line):
-            verboseMsg("found power meter reading: " + line)
-            junk, meter_reading = line.split(":", 1)
-            hdata["meter"][meter_id]["reading"] = meter_reading.strip()
-
-        elif re.match(re_psu, line):
-            verboseMsg("found power supply: " + line)
-            junk, psu_id = line.split("#", 1)
-            hdata["psu"][psu_id] = {}
-
-        elif re.match(re_psu_present, line):
-            verboseMsg("found power supply present: " + line)
-            junk, psu_present = line.split(":", 1)
-            hdata["psu"][psu_id]["present"] = psu_present.strip()
-
-        elif re.match(re_psu_redundant, line):
-            verboseMsg("found power supply redundant: " + line)
-            junk, psu_redundant = line.split(":", 1)
-            hdata["psu"][psu_id]["redundant"] = psu_redundant.strip()
-
-        elif re.match(re_psu_condition, line):
-            verboseMsg("found power supply condition: " + line)
-            junk, psu_condition = line.split(":", 1)
-            hdata["psu"][psu_id]["condition"] = psu_condition.strip()
-
-        elif re.match(re_psu_hotplug, line):
-            verboseMsg("found power supply hotplug: " + line)
-            junk, psu_hotplug = line.split(":", 1)
-            hdata["psu"][psu_id]["hotplug"] = psu_hotplug.strip()
-
-        elif re.match(re_psu_reading, line):
-            verboseMsg("found power supply reading: " + line)
-            junk, psu_reading = line.split(":", 1)
-            hdata["psu"][psu_id]["reading"] = psu_reading.replace("Watts", "").strip()
+        for field, value in hpasmParser.matches(line):
+            if field == "meter":
+                verboseMsg("found power meter: " + line)
+                meter_id = value
+                hdata["meter"][meter_id] = {}
+
+            elif field == "meter_reading":
+                verboseMsg("found power meter reading: " + line)
+                hdata["meter"][meter_id]["reading"] = value.strip()
+
+            elif field == "psu":
+                verboseMsg("found power supply: " + line)
+                psu_id = value
+                hdata["psu"][psu_id] = {}
+
+            else:
+                verboseMsg("found power supply " + field + ": " + line)
+                if field == "reading":
+                    value = value.replace("Watts", "")
+                hdata["psu"][psu_id][field] = value.strip()
 
     return hdata
 
@@ -10,7 +10,8 @@
 #              here:
 #     https://www.cyberpowersystems.com/product/software/power-panel-personal/powerpanel-for-linux/
 # Installation:
-#     1. Copy this script to /etc/snmp/ and make it executable:
+#     1. Copy this script and the librenms_extend directory to /etc/snmp/ and make
+#        the script executable:
 #         chmod +x /etc/snmp/pwrstatd.py
 #     2. Edit your snmpd.conf and include:
 #         extend pwrstatd /etc/snmp/pwrstatd.py
@@ -27,24 +28,34 @@
 #        single computer, then this script will be updated to support that.
 
 import json
-import re
 import subprocess
 import sys
 
+from librenms_extend import executor, lineparser
+
 CONFIG_FILE = "/etc/snmp/pwrstatd.json"
-KEY_TO_VARIABLE_MAP = {
-    "Firmware Number": "sn",
-    "Rating Voltage": "vrating",
-    "Rating Power": "wrating",
-    "Utility Voltage": "vutility",
-    "Output Voltage": "voutput",
-    "Battery Capacity": "pcapacity",
-    "Remaining Runtime": "mruntime",
-    "Load": "wload",
+# Fields of the "Key....... value" lines, matched against the stripped line.
+PWRSTAT_SPECS = {
+    "sn": {"regex": r"Firmware Number\.\.+ (.*)", "variable_type": "type_string"},
+    "vrating": {"regex": r"Rating Voltage\.\.+ (\d+)", "variable_type": "type_int"},
+    "wrating": {"regex": r"Rating Power\.\.+ (\d+)", "variable_type": "type_int"},
+    "vutility": {"regex": r"Utility Voltage\.\.+ (\d+)", "variable_type": "type_int"},
+    "voutput": {"regex": r"Output Voltage\.\.+ (\d+)", "variable_type": "type_int"},
+    "pcapacity": {
+        "regex": r"Battery Capacity\.\.+ (\d+)",
+        "variable_type": "type_int",
+    },
+    "mruntime": {
+        "regex": r"Remaining Runtime\.\.+ (\d+)",
+        "variable_type": "type_int",
+    },
+    "wload": {"regex": r"Load\.\.+ (\d+)", "variable_type": "type_int"},
 }
+PWRSTAT_PARSER = lineparser.LineParser(PWRSTAT_SPECS)
 PWRSTAT_ARGS = ["-status"]
 PWRSTAT_CMD = "/sbin/pwrstat"
-REGEX_PATTERN = r"([\w\s]+)\.\.+ (.*)"
+# Seconds pwrstat may take before it is killed.
+COMMAND_TIMEOUT = 10
 
 
 def error_handler(error_name, err):
@@ -105,41 +116,14 @@ def command_executor(pwrstat_cmd):
     """
     try:
         # Execute pwrstat command
-        poutput = subprocess.check_output(
-            pwrstat_cmd,
-            stdin=None,
-            stderr=subprocess.PIPE,
-        )
+        poutput = executor.check_output(pwrstat_cmd, COMMAND_TIMEOUT)
+    except subprocess.TimeoutExpired as err:
+        error_handler("Command Timeout", err)
     except (subprocess.CalledProcessError, OSError) as err:
         error_handler("Command Execution Error", err)
     return poutput
 
 
-def value_sanitizer(key, value):
-    """
-    value_sanitizer(): Parses the given value to extract the exact numerical (or string) value.
-
-    Inputs:
-        key: The key portion of the output after regex parsing (clean).
-        value: The entire value portion of the output after regex parsing (dirty).
-    Outputs:
-        str, int, or None depending on what key is given.
-    """
-    if key == "Firmware Number":
-        return str(value)
-    if key in (
-        "Rating Voltage",
-        "Rating Power",
-        "Utility Voltage",
-        "Output Voltage",
-        "Battery Capacity",
-        "Remaining Runtime",
-        "Load",
-    ):
-        return int(value.split(" ")[0])
-    return None
-
-
 def output_parser(pwrstat_output):
     """
     output_parser(): Parses the pwrstat command output and returns a dictionary
@@ -150,21 +134,11 @@ def output_parser(pwrstat_output):
     Outputs:
         psu_data: A dictionary of PSU metrics.
     """
-    psu_data = {}
-
-    for line in pwrstat_output.decode("utf-8").split("\n"):
-        regex_search = re.search(REGEX_PATTERN, line.strip())
-
-        if not regex_search:
-            continue
-
-        try:
-            key = regex_search.groups()[0]
-            value = regex_search.groups()[1]
-            if key in KEY_TO_VARIABLE_MAP:
-                psu_data[KEY_TO_VARIABLE_MAP[key]] = value_sanitizer(key, value)
-        except IndexError as err:
-            error_handler("Command Output Parsing Error", err)
+    lines = (line.strip() for line in pwrstat_output.decode("utf-8").split("\n"))
+    try:
+        psu_data = PWRSTAT_PARSER.parse(lines)
+    except ValueError as err:
+        error_handler("Command Output Parsing Error", err)
 
     # Manually calculate percentage load on PSU
     if "wrating" in psu_data and "wload" in psu_data and psu_data["wrating"]:
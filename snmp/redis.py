@@ -1,20 +1,44 @@
 #!/usr/bin/env python3
 
+# Requires the librenms_extend directory next to this script.
 import json
 import subprocess
 
+from librenms_extend import cache, executor
+
 shell_cmd = "redis-cli info"
-all_data = (
-    subprocess.Popen(shell_cmd, shell=True, stdout=subprocess.PIPE)
-    .stdout.read()
-    .split(b"\n")
-)
+# Seconds redis-cli may take before it is killed.
+COMMAND_TIMEOUT = 10
+# `redis-cli info` output is cached in /var/cache/librenms/redis so that
+# concurrent polls run it once; stale copies are used for at most
+# CACHE_MAX_STALE seconds while another poll refreshes it.
+CACHE_TTL = 30
+CACHE_MAX_STALE = 300
+
+
+def fetch_info():
+    # A failed or hung redis-cli raises, so its output is never cached.
+    output = executor.check_output(["/bin/sh", "-c", shell_cmd], COMMAND_TIMEOUT)
+    return output.decode("utf-8", errors="replace")
+
 
 version = 1
 error = 0
 error_string = ""
 redis_data = {}
 
+try:
+    all_data = (
+        cache.Cache("redis", CACHE_TTL, CACHE_MAX_STALE)
+        .get(fetch_info)
+        .encode("utf-8")
+        .split(b"\n")
+    )
+except (OSError, subprocess.SubprocessError) as err:
+    error = 3
+    error_string = "redis-cli error: %s" % err
+    all_data = []
+
 # stdout list to json
 try:
     category = ""
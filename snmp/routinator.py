@@ -8,9 +8,9 @@ stdout. Designed to be wired into snmpd via:
 
     extend routinator /etc/snmp/routinator.py
 
-The output is gzip+base64-compressed. LibreNMS detects and decodes this
-automatically; it shrinks the payload over SNMP and sidesteps snmpd's mangling
-of some characters.
+The output is gzip+base64-compressed (see librenms_extend/envelope.py).
+LibreNMS detects and decodes this automatically; it shrinks the payload over
+SNMP and sidesteps snmpd's mangling of some characters.
 
 The script is stateless: it reports current values only. Rates (bytes/sec etc.)
 are derived by LibreNMS from successive counter samples.
@@ -21,22 +21,37 @@ Optional config file (JSON) at /etc/snmp/routinator.json overrides the defaults:
         "url": "http://127.0.0.1:8323/api/v1/status",
         "timeout": 5,
         "include_failed_uris": true,
-        "max_failed_uris": 25
+        "max_failed_uris": 25,
+        "cache_ttl": 30,
+        "cache_max_stale": 300
     }
 
 `url` may instead be given as separate "host"/"port" keys. If the file is
 absent the built-in defaults are used; confirm the real http-listen port with
 the Routinator operator (the default 8323 is commonly changed).
+
+The API response is cached in /var/cache/librenms/routinator for `cache_ttl`
+seconds (0 disables the cache) so that several pollers polling at once cost a
+single fetch; while one run refreshes it, the others reuse the previous copy
+for up to `cache_max_stale` seconds.
+
+To keep the HTTP fetch off the poll path, run the script from cron with
+`--publish /var/run/librenms/routinator.json` (optionally `--interval N` to
+keep it running) and serve the file with `extend routinator /bin/cat <file>`.
+A running instance keeps its connection to Routinator open between fetches.
+Add `--timings` or `--timings-file <path>` to record the time spent fetching,
+parsing and encoding, and the compression ratio.
+
+The script needs the librenms_extend directory installed next to it.
 """
 
-import base64
-import gzip
 import json
 import re
 import sys
-import urllib.request
 from datetime import datetime, timezone
 
+from librenms_extend import cache, envelope, httpclient, publish, timing
+
 CONFIGFILE = "/etc/snmp/routinator.json"
 
 DEFAULTS = {
@@ -47,6 +62,8 @@ DEFAULTS = {
     "timeout": 5,
     "include_failed_uris": True,
     "max_failed_uris": 25,
+    "cache_ttl": cache.DEFAULT_TTL,
+    "cache_max_stale": cache.DEFAULT_MAX_STALE,
 }
 
 # The five production trust anchors. We iterate over whatever the API returns,
@@ -256,8 +273,7 @@ def build_data(status, cfg):
 def emit(output):
     """Serialise the envelope, gzip + base64 it, and print to stdout. LibreNMS
     auto-detects and decodes this."""
-    text = json.dumps(output)
-    print(base64.b64encode(gzip.compress(text.encode("utf-8"))).decode("ascii"))
+    print(envelope.encode(output, compress=True))
 
 
 def main():
@@ -273,9 +289,13 @@ def main():
 
     # A failed fetch is itself the most important signal (Routinator's HTTP
     # server, or the whole process, is likely down). Emit the error envelope.
+    def fetch():
+        return httpclient.get(cfg["url"], timeout=cfg["timeout"]).text()
+
     try:
-        with urllib.request.urlopen(cfg["url"], timeout=cfg["timeout"]) as resp:
-            status = json.loads(resp.read().decode("utf-8"))
+        api_cache = cache.Cache("routinator", cfg["cache_ttl"], cfg["cache_max_stale"])
+        with timing.phase("fetch"):
+            status = json.loads(api_cache.get(fetch))
     except Exception as err:  # noqa: BLE001 - any failure becomes the signal
         output["error"] = 1
         output["errorString"] = "fetch %s failed: %s" % (cfg["url"], err)
@@ -283,7 +303,8 @@ def main():
         return
 
     try:
-        output["data"] = build_data(status, cfg)
+        with timing.phase("parse"):
+            output["data"] = build_data(status, cfg)
     except Exception as err:  # noqa: BLE001 - never emit partial/garbage JSON
         output["error"] = 2
         output["errorString"] = "parse error: %s" % err
@@ -293,4 +314,4 @@ def main():
 
 
 if __name__ == "__main__":
-    sys.exit(main())
+    sys.exit(publish.run(main))
@@ -15,89 +15,114 @@
 # Clients -> version (count)
 
 import json
+import sys
+import urllib.parse
 
-import requests
+from librenms_extend import aio, envelope, httpclient, publish
 
 # Configfile content example:
 # {"url": "https://seafile.mydomain.org",
 #  "username": "some_admin_login@mail.address",
 #  "password": "password",
 #  "account_identifier": "name",
-#  "hide_monitoring_account": true
+#  "hide_monitoring_account": true,
+#  "timeout": 30
 # }
+# "timeout" (seconds per API call) is optional; without it a call waits as
+# long as the server takes, as it always has.  As with requests before,
+# https certificates are verified (against the system CA store, which
+# httpclient uses instead of requests' certifi bundle and REQUESTS_CA_BUNDLE)
+# and redirects are followed, without the token when they lead to another host.
+
+# Requires the librenms_extend directory next to this script.  The per-account
+# API calls make this slow on large installations; to collect in the background
+# run it from cron with --publish /var/run/librenms/seafile.json (optionally
+# --interval <seconds>) and use "extend seafile /bin/cat <file>".  The API calls
+# run concurrently, at most 16 at a time, over kept-alive connections.
 
 CONFIGFILE = "/etc/snmp/seafile.json"
-error = 0
-error_string = ""
+DEFAULT_TIMEOUT = None
 version = 1
 
 
-def get_data(url_path, data=None, token=None):
-    complete_url = "%s/%s" % (url, url_path)
+def get_data(config, url_path, data=None, token=None):
+    complete_url = "%s/%s" % (config["url"], url_path)
+    timeout = config["timeout"]
     headers = {"Accept": "application/json"}
     if token:
         headers["Authorization"] = "Token %s" % token
 
     try:
         if token:
-            r = requests.get(complete_url, data=data, headers=headers)
+            r = httpclient.get(
+                complete_url, headers=headers, timeout=timeout, check=False
+            )
         else:
-            r = requests.post(complete_url, data=data, headers=headers)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            r = httpclient.post(
+                complete_url,
+                urllib.parse.urlencode(data or {}),
+                headers=headers,
+                timeout=timeout,
+                check=False,
+            )
         try:
             return r.json()
-        except json.decoder.JSONDecodeError:
+        except ValueError:
             return "no valid json returned - url correct?"
-    except requests.exceptions.RequestException as err:
+    except OSError as err:
         return str(err)
 
 
-def get_devices():
+def get_devices(config, token):
     # get all devices
     url_path = "api/v2.1/admin/devices/"
-    return get_data(url_path, token=token)
+    return get_data(config, url_path, token=token)
 
 
-def get_groups():
+def get_groups(config, token):
     # get all groups
     url_path = "api/v2.1/admin/groups/"
-    return get_data(url_path, token=token)
+    return get_data(config, url_path, token=token)
 
 
-def get_sysinfo():
+def get_sysinfo(config, token):
     # get all groups
     url_path = "api/v2.1/admin/sysinfo/"
-    return get_data(url_path, token=token)
+    return get_data(config, url_path, token=token)
 
 
-def get_account_information():
+async def get_account_information(config, token):
     # get all accounts withs details
-    account_list = []
-    for account in get_data("api2/accounts/", token=token):
-
+    url_paths = []
+    for account in await aio.call(get_data, config, "api2/accounts/", token=token):
         # get account details
-        url_path = "api2/accounts/%s/" % account["email"]
-        account_data = get_data(url_path, token=token)
-
+        url_paths.append("api2/accounts/%s/" % account["email"])
         # get libraries by owner
-        url_path = "api/v2.1/admin/libraries/?owner=%s" % account["email"]
-        account_data["repos"] = get_data(url_path, token=token)["repos"]
-
+        url_paths.append("api/v2.1/admin/libraries/?owner=%s" % account["email"])
         # get deleted libraries by owner
-        url_path = "api/v2.1/admin/trash-libraries/?owner=%s" % account["email"]
-        account_data["trash_repos"] = get_data(url_path, token=token)["repos"]
+        url_paths.append("api/v2.1/admin/trash-libraries/?owner=%s" % account["email"])
 
+    results = await aio.gather(
+        [aio.call(get_data, config, url_path, token=token) for url_path in url_paths]
+    )
+    account_list = []
+    for index in range(0, len(results), 3):
+        account_data, repos, trash_repos = results[index : index + 3]
+        account_data["repos"] = repos["repos"]
+        account_data["trash_repos"] = trash_repos["repos"]
         account_list.append(account_data)
     return account_list
 
 
-def resort_devices(device_list):
+def resort_devices(device_list, config):
     data = {}
     platform = {}
     client_version = {}
     for device in device_list:
         # don't list information assigned to monitor account
-        if hide_monitoring_account:
-            if device["user"] == configfile["username"]:
+        if config["hide_monitoring_account"]:
+            if device["user"] == config["username"]:
                 continue
 
         if device["platform"] not in platform.keys():
@@ -125,9 +150,9 @@ def resort_groups(group_list):
     return data
 
 
-def resort_accounts(account_list):
-    if account_identifier in ["name", "email"]:
-        identifier = account_identifier
+def resort_accounts(account_list, config):
+    if config["account_identifier"] in ["name", "email"]:
+        identifier = config["account_identifier"]
     else:
         identifier = "name"
 
@@ -136,8 +161,8 @@ def resort_accounts(account_list):
     data = []
     for user_account in account_list:
         # don't list information assigned to monitor account
-        if hide_monitoring_account:
-            if user_account["email"] == configfile["username"]:
+        if config["hide_monitoring_account"]:
+            if user_account["email"] == config["username"]:
                 continue
 
         new_account = {}
@@ -155,51 +180,72 @@ def resort_accounts(account_list):
 
 
 # ------------------------ MAIN --------------------------------------------------------
-with open(CONFIGFILE, "r") as json_file:
-    try:
-        configfile = json.load(json_file)
-    except json.decoder.JSONDecodeError as e:
-        error = 1
-        error_string = "Configfile Error: '%s'" % e
-
-if not error:
-    url = configfile["url"]
-    username = configfile["username"]
-    password = configfile["password"]
-    try:
-        account_identifier = configfile["account_identifier"]
-    except KeyError:
-        account_identifier = None
-    try:
-        hide_monitoring_account = configfile["hide_monitoring_account"]
-    except KeyError:
-        hide_monitoring_account = False
-
-    # get token
-    login_data = {"username": username, "password": password}
-    ret = get_data("api2/auth-token/", data=login_data)
-    if type(ret) != str:
-        if "token" in ret.keys():
-            token = ret["token"]
+def main():
+    error = 0
+    error_string = ""
+
+    with open(CONFIGFILE, "r") as json_file:
+        try:
+            configfile = json.load(json_file)
+        except json.decoder.JSONDecodeError as e:
+            error = 1
+            error_string = "Configfile Error: '%s'" % e
+
+    if not error:
+        username = configfile["username"]
+        password = configfile["password"]
+        configfile.setdefault("account_identifier", None)
+        configfile.setdefault("hide_monitoring_account", False)
+        configfile.setdefault("timeout", DEFAULT_TIMEOUT)
+
+        # get token
+        login_data = {"username": username, "password": password}
+        ret = get_data(configfile, "api2/auth-token/", data=login_data)
+        if type(ret) != str:
+            if "token" in ret.keys():
+                token = ret["token"]
+            else:
+                error = 1
+                try:
+                    error_string = json.dumps(ret)
+                except:
+                    error_string = ret
         else:
             error = 1
-            try:
-                error_string = json.dumps(ret)
-            except:
-                error_string = ret
-    else:
-        error = 1
-        error_string = ret
+            error_string = ret
 
-data = {}
-if not error:
-    ret = get_account_information()
-if not error:
-    data["accounts"] = resort_accounts(ret)
-    data["devices"] = resort_devices(get_devices()["devices"])
-    data["groups"] = resort_groups(get_groups()["groups"])
-    data["sysinfo"] = get_sysinfo()
-
-output = {"error": error, "errorString": error_string, "version": version, "data": data}
-
-print(json.dumps(output))
+    data = {}
+    if not error:
+
+        async def collect():
+            return await aio.gather(
+                [
+                    get_account_information(configfile, token),
+                    aio.call(get_devices, configfile, token),
+                    aio.call(get_groups, configfile, token),
+                    aio.call(get_sysinfo, configfile, token),
+                ]
+            )
+
+        results = aio.run(collect)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        accounts, devices, groups, sysinfo = results
+        data["accounts"] = resort_accounts(accounts, configfile)
+        data["devices"] = resort_devices(devices["devices"], configfile)
+        data["groups"] = resort_groups(groups["groups"])
+        data["sysinfo"] = sysinfo
+
+    output = {
+        "error": error,
+        "errorString": error_string,
+        "version": version,
+        "data": data,
+    }
+
+    print(envelope.encode(output))
+
+
+if __name__ == "__main__":
+    sys.exit(publish.run(main))
@@ -7,7 +7,8 @@
 # Description: This is a simple script to parse "ss" output for ingestion into
 #              LibreNMS via the ss application.
 # Installation:
-#     1. Copy this script to /etc/snmp/ and make it executable:
+#     1. Copy this script and the librenms_extend directory to /etc/snmp/ and
+#        make the script executable:
 #         chmod +x /etc/snmp/ss.py
 #     2. Edit your snmpd.conf and include:
 #         extend ss /etc/snmp/ss.py
@@ -41,19 +42,57 @@
 #                                 Specifying "all" includes all of the families.
 #                                 For example: to include only inet and inet6
 #                                 families, you would specify "inet,inet6": ["all"]
-#           d.) Example file format
+#           d.) "backend"       - (optional) How the sockets are listed: "ss" runs
+#                                 ss once per socket type and address family;
+#                                 "ss-once" runs it once for all of them and
+#                                 sorts the sockets by their netid and address,
+#                                 which is far cheaper on hosts with many
+#                                 sockets.  With "ss-once", sockets of an
+#                                 "unknown" type only count towards inet and
+#                                 inet6.  "netlink" asks the kernel for the
+#                                 sockets itself, over NETLINK_SOCK_DIAG, and
+#                                 only runs ss for TIPC sockets, if the kernel
+#                                 has TIPC loaded.  Like ss, it reads the
+#                                 /proc/net table of the sockets the kernel
+#                                 has no diag module for.  "proc" reads the
+#                                 /proc/net tables instead and needs no ss at
+#                                 all, but only lists tcp, udp, raw, link,
+#                                 netlink and unix sockets; the others stay
+#                                 at zero.  ["ss"]
+#           e.) Example file format
 #           {
 #                  "ss_cmd": "/usr/bin/ss",
 #                  "socket_types": "dccp,icmp6,mptcp,p_dgr,p_raw,raw,sctp,tcp,ti_dg,ti_rd,ti_sq,ti_st,u_dgr,u_seq,u_str,udp,unknown,v_dgr,v_str,xdp",
-#                  "addr_families": "inet,inet6,link,netlink,tipc,unix,vsock"
+#                  "addr_families": "inet,inet6,link,netlink,tipc,unix,vsock",
+#                  "backend": "ss-once"
 #           }
 #
 ##     4. Restart snmpd and activate the app for desired host.
-
-import argparse
+#     5. (Optional) To collect in the background instead of on every poll, run the
+#        script from cron with --publish and have snmpd serve the file:
+#            */5 * * * * root /etc/snmp/ss.py --publish /var/run/librenms/ss.json
+#            extend ss /bin/cat /var/run/librenms/ss.json
+#        Add --interval <seconds> to keep it running instead of using cron.
+#        Add --timings (or --timings-file <path>) to report the time spent per
+#        command and phase, see librenms_extend/timing.py.
+#        Add --memory (or --memory-file <path>, --memory-warn <MiB>) to report
+#        its peak memory, see librenms_extend/memprofile.py.
+#     6. (Optional) Served from librenms_collectord.py, the output must fit in the
+#        4094 bytes snmpd reads of a pass_persist value.  On hosts where it is
+#        longer, set "compress": true for ss in that daemon's config, or
+#        keep the host on "extend" lines (see librenms_collectord.py).
+
+import collections
+import errno
 import json
+import operator
+import os
+import re
 import subprocess
 import sys
+import types
+
+from librenms_extend import envelope, executor, publish, timing
 
 DEFAULT_CONFIG_FILE = "/etc/snmp/ss.json"
 
@@ -156,7 +195,92 @@ for gentype_key, gentype_values in SOCKET_MAPPINGS.items():
     for gentype_netid in gentype_values["netids"]:
         SOCKET_ALLOW_LIST.append(gentype_netid)
 
+# The inet and inet6 socket types, listed for both families.
+INET_SOCKET_TYPES = ["dccp", "mptcp", "raw", "sctp", "tcp", "udp"]
+# Netids ss prints for sockets of the inet and inet6 families.
+INET_NETIDS = set(INET_SOCKET_TYPES + ["icmp6", "???"])
+# Netids that are not named after their socket type or address family.
+NETID_SOCKET_TYPES = {"icmp6": "raw"}
+NETID_FAMILIES = {
+    "nl": "netlink",
+    "p_dgr": "link",
+    "p_raw": "link",
+    "ti_dg": "tipc",
+    "ti_rd": "tipc",
+    "ti_sq": "tipc",
+    "ti_st": "tipc",
+    "u_dgr": "unix",
+    "u_seq": "unix",
+    "u_str": "unix",
+    "v_dgr": "vsock",
+    "v_str": "vsock",
+}
+# Protocol of the inet socket types, for the netlink backend.
+NETLINK_INET_PROTOCOLS = {
+    "dccp": 33,
+    "mptcp": 262,
+    "raw": 255,
+    "sctp": 132,
+    "tcp": 6,
+    "udp": 17,
+}
+# The SCTP states to dump: the endpoints (LISTEN and CLOSE), as ss lists the
+# associations apart from them.
+NETLINK_SCTP_STATES = 1 << 10 | 1 << 7
+# Netid of each socket type (SOCK_STREAM, ...) of the families with several.
+SOCK_TYPE_NETIDS = {
+    "unix": {1: "u_str", 2: "u_dgr", 5: "u_seq"},
+    "link": {2: "p_dgr", 3: "p_raw"},
+    "vsock": {1: "v_str", 2: "v_dgr"},
+}
+# ss's names of the kernel's (TCP) socket states.
+STATE_NAMES = [
+    "UNKNOWN",
+    "ESTAB",
+    "SYN-SENT",
+    "SYN-RECV",
+    "FIN-WAIT-1",
+    "FIN-WAIT-2",
+    "TIME-WAIT",
+    "UNCONN",
+    "CLOSE-WAIT",
+    "LAST-ACK",
+    "LISTEN",
+    "CLOSING",
+]
+TIPC_MODULE = "/sys/module/tipc"
+PROC_NET_DIR = "/proc/net"
+# The /proc/net tables of the inet sockets: (file, socket type, address
+# family).
+PROC_INET_TABLES = [
+    ("tcp", "tcp", "inet"),
+    ("tcp6", "tcp", "inet6"),
+    ("udp", "udp", "inet"),
+    ("udp6", "udp", "inet6"),
+    ("raw", "raw", "inet"),
+    ("raw6", "raw", "inet6"),
+]
+# What the proc backend counts the rows of a /proc/net table by, found with
+# one regex search over a block of rows rather than a split of every row; the
+# header lines do not match.  The state of an inet socket, after its remote
+# port, of which only the second hex digit varies (the states end at 0x0C):
+PROC_INET_ROW = re.compile(rb":[0-9A-F]{4} 0([0-9A-F]) ")
+# The flags (__SO_ACCEPTCON or none), type and state of a unix socket:
+PROC_UNIX_ROW = re.compile(rb" (000[01]0000 000[0-9A-F] 0[0-9A-F]) ")
+# The type of a packet socket:
+PROC_PACKET_ROW = re.compile(rb"^[0-9a-f]+ +\d+ +(\d+) ", re.M)
+# Netlink sockets are only counted, by their lines.
+PROC_NETLINK_ROW = None
+# ss's names of the states of /proc/net/unix (SS_UNCONNECTED, ...), and the
+# flag of the listening sockets (__SO_ACCEPTCON).
+PROC_UNIX_STATES = {1: "UNCONN", 2: "SYN-SENT", 3: "ESTAB", 4: "CLOSING"}
+PROC_UNIX_LISTENING = 1 << 16
+BACKENDS = ["ss", "ss-once", "netlink", "proc"]
+DEFAULT_BACKEND = "ss"
+
 SS_CMD = ["/sbin/ss"]
+# Seconds each ss invocation may take before it is killed.
+COMMAND_TIMEOUT = 10
 
 
 def error_handler(error_name, err):
@@ -180,6 +304,13 @@ def error_handler(error_name, err):
 
 
 def parse_args():
+    # snmpd runs this without arguments; argparse is only imported, at a
+    # cost of more than the collection itself, when there are some.
+    if len(sys.argv) == 1:
+        return types.SimpleNamespace(config=DEFAULT_CONFIG_FILE)
+
+    import argparse
+
     parser = argparse.ArgumentParser(
         description="Socket Statistics Script for LibreNMS"
     )
@@ -202,10 +333,14 @@ def config_file_parser(config_path):
     Outputs:
         ss_cmd: The full ss command to execute.
         socket_allow_list: A list of the socket types to parse output for.
+        addr_family_allow_list: A list of the address families to parse
+                                output for.
+        backend: How the sockets are listed, one of BACKENDS.
     """
     ss_cmd = SS_CMD.copy()
     socket_allow_list = SOCKET_ALLOW_LIST.copy()
     addr_family_allow_list = ADDR_FAMILY_ALLOW_LIST.copy()
+    backend = DEFAULT_BACKEND
 
     # Load configuration file if it exists
     try:
@@ -222,6 +357,7 @@ def config_file_parser(config_path):
                 socket_allow_list = socket_allow_list_clean
             if "all" not in addr_family_allow_list_clean:
                 addr_family_allow_list = addr_family_allow_list_clean
+            backend = config_file.get("backend", DEFAULT_BACKEND)
     except FileNotFoundError:
         pass
     except (KeyError, PermissionError, OSError, json.decoder.JSONDecodeError) as err:
@@ -249,34 +385,50 @@ def config_file_parser(config_path):
     if err:
         error_handler("Configuration File Error", err.strip())
 
-    # Create and return full ss command and allow lists.
-    return ss_cmd, socket_allow_list, addr_family_allow_list
+    if backend not in BACKENDS:
+        error_handler("Configuration File Error", "Invalid backend: " + str(backend))
+
+    # Create and return full ss command, allow lists and backend.
+    return ss_cmd, socket_allow_list, addr_family_allow_list, backend
 
 
 def command_executor(ss_cmd, socket_type):
     """
-    command_executor(): Execute the ss command and return the output.
+    command_executor(): Execute the ss command and yield its output line by line
+                        while it runs.
 
     Inputs:
         ss_cmd: The full ss command to execute.
         socket_type: The type of socket to collect data for.
     Outputs:
-        poutput: The stdout of the executed command (empty byte-string if error).
+        line: Each line of the stdout of the executed command (none after a timeout).
     """
     ss_socket_cmd = ss_cmd.copy()
     ss_socket_cmd.extend(SOCKET_MAPPINGS[socket_type]["args"])
     ss_socket_cmd.extend(GLOBAL_ARGS)
 
+    yield from command_lines(ss_socket_cmd)
+
+
+def command_lines(ss_socket_cmd):
+    """
+    command_lines(): Execute an ss command line and yield its output line by
+                     line while it runs.
+
+    Inputs:
+        ss_socket_cmd: The full ss command line to execute.
+    Outputs:
+        line: Each line of the stdout of the executed command (none after a timeout).
+    """
     try:
         # Execute ss command
-        poutput = subprocess.check_output(
-            ss_socket_cmd,
-            stdin=None,
-            stderr=subprocess.PIPE,
-        )
+        with timing.command(ss_socket_cmd):
+            yield from executor.iter_lines(ss_socket_cmd, COMMAND_TIMEOUT)
+    except subprocess.TimeoutExpired as err:
+        # Keep the sockets and socket types that did answer.
+        executor.record_timeout(err)
     except (subprocess.CalledProcessError, OSError) as err:
         error_handler("Command Execution Error", err)
-    return poutput
 
 
 def socket_parser(line, gentype, ss_data, socket_allow_list):
@@ -285,7 +437,8 @@ def socket_parser(line, gentype, ss_data, socket_allow_list):
                      That status type is added to the global ss_data
                      variable if it does not exist or incremented if
                      it does.  The totals for the socket type are
-                     incremented as well.
+                     incremented as well.  See lines_parser() for whole
+                     ss runs.
 
     Inputs:
         line: The sockets's status line from the ss stdout.
@@ -295,41 +448,452 @@ def socket_parser(line, gentype, ss_data, socket_allow_list):
     Outputs:
         None
     """
-    line_parsed = line.strip().split()
+    lines_parser((line,), gentype, ss_data, socket_allow_list)
+    return ss_data
 
-    netid = None
-    state = None
 
-    try:
-        if SOCKET_MAPPINGS[gentype]["netids"]:
-            netid = line_parsed[0]
-            state = line_parsed[1]
-        else:
-            state = line_parsed[0]
-    except IndexError as err:
-        error_handler("Command Output Parsing Error", err)
+def lines_parser(lines, gentype, ss_data, socket_allow_list):
+    """
+    lines_parser(): Parses the socket lines of an ss run, as they are read,
+                    for their current status, and adds them to ss_data as
+                    socket_parser() does.  Only the netid and state are
+                    split off each line, and the lines are tallied by them
+                    in one collections.Counter, so that the time taken grows
+                    with the lines but the memory only with their distinct
+                    netids and states.
 
-    if SOCKET_MAPPINGS[gentype]["netids"]:
+    Inputs:
+        lines: The sockets' status lines from the ss stdout.
+        gentype: The socket or address family to parse data for.
+        ss_data: All of the socket data as a dictionary.
+        socket_allow_list: List of sockets to parse data for.
+    Outputs:
+        None
+    """
+    # The netid and state, or the state alone.
+    fields = 2 if SOCKET_MAPPINGS[gentype]["netids"] else 1
+    split_fields = operator.methodcaller("split", None, fields)
+    first_fields = operator.itemgetter(slice(0, fields))
+    tally = collections.Counter(
+        map(tuple, map(first_fields, map(split_fields, filter(None, lines))))
+    )
+
+    for key, count in tally.items():
+        if len(key) < fields:
+            error_handler("Command Output Parsing Error", " ".join(key))
+        if fields == 1:
+            count_sockets(ss_data, key[0], count)
+            continue
+
+        netid, state = key
         # Special case to convert the question-marks symbol
         # to a safe string.
         if netid == "???":
             netid = "unknown"
 
         # Omit filtered sockets from the address families.
-        if netid not in socket_allow_list:
-            return ss_data
+        if netid in socket_allow_list and netid in ss_data:
+            count_sockets(ss_data[netid], state, count)
 
-        ss_data[netid][state] = (
-            1 if state not in ss_data[netid] else (ss_data[netid][state] + 1)
-        )
-        ss_data[netid]["TOTAL"] = (
-            1 if "TOTAL" not in ss_data[netid] else (ss_data[netid]["TOTAL"] + 1)
+
+def selected_gentypes(gentypes):
+    """
+    selected_gentypes(): Work out the socket types and address families to
+                         list together so that every one of those given is
+                         complete.
+
+    Inputs:
+        gentypes: The socket types and address families to count.
+    Outputs:
+        selected: The socket types and address families to list.
+    """
+    selected = set(gentypes)
+    # ss lists only the requested socket types of a family once some are
+    # requested, and only the requested families of a socket type.
+    if selected & {"inet", "inet6"}:
+        selected.update(INET_SOCKET_TYPES)
+    if selected & set(INET_SOCKET_TYPES):
+        selected.update(["inet", "inet6"])
+    return selected
+
+
+def single_command(ss_cmd, gentypes):
+    """
+    single_command(): Build the one ss command listing the sockets of all of
+                      the socket types and address families given.
+
+    Inputs:
+        ss_cmd: The ss command to execute.
+        gentypes: The socket types and address families to list.
+    Outputs:
+        ss_socket_cmd: The full ss command to execute.
+    """
+    selected = selected_gentypes(gentypes)
+    ss_socket_cmd = ss_cmd.copy()
+    for gentype in SOCKET_MAPPINGS:
+        if gentype in selected:
+            ss_socket_cmd.extend(SOCKET_MAPPINGS[gentype]["args"])
+    ss_socket_cmd.extend(GLOBAL_ARGS)
+    return ss_socket_cmd
+
+
+def inet_family(local_address):
+    """
+    inet_family(): Tell the address family of an inet socket from its local
+                   address as ss prints it.
+
+    Inputs:
+        local_address: The local address column, e.g. "[::1]:53".
+    Outputs:
+        family: "inet", "inet6", "*" for a wildcard address, or "old-inet6"
+                for an IPv6 address in the unbracketed form of iproute2
+                before 4.17.
+    """
+    host = local_address.rpartition(":")[0].partition("%")[0]
+    if host == "*":
+        return "*"
+    if host[:1] == "[":
+        return "inet6"
+    if ":" in host:
+        return "old-inet6"
+    return "inet"
+
+
+def state_name(state):
+    """
+    state_name(): Name a kernel socket state the way ss does.
+
+    Inputs:
+        state: The state number.
+    Outputs:
+        name: The state's name, e.g. "ESTAB".
+    """
+    return STATE_NAMES[state] if state < len(STATE_NAMES) else "UNKNOWN"
+
+
+def count_sockets(ss_data, state, count):
+    """
+    count_sockets(): Add sockets in a state to a socket type's, address
+                     family's or netid's counts and its total.
+
+    Inputs:
+        ss_data: The counts by state.
+        state: The state of the sockets.
+        count: How many sockets there are.
+    Outputs:
+        None
+    """
+    ss_data[state] = ss_data.get(state, 0) + count
+    ss_data["TOTAL"] = ss_data.get("TOTAL", 0) + count
+
+
+def single_pass(ss_cmd, output_data):
+    """
+    single_pass(): Run ss once for all of the socket types and address
+                   families in output_data and add its sockets to their
+                   counts.  The sockets are tallied by netid, state and
+                   address family in one pass over the output, then the
+                   tallies are added up by add_tally().
+
+    Inputs:
+        ss_cmd: The ss command to execute.
+        output_data: The output's "data", with the counts of every socket
+                     type, address family and allowed netid to fill in.
+    Outputs:
+        None
+    """
+    tally = {}
+    old_format = False
+
+    with timing.phase("parse"):
+        for line in command_lines(single_command(ss_cmd, list(output_data))):
+            if not line:
+                continue
+
+            fields = line.split(None, 5)
+            if len(fields) < 2:
+                error_handler("Command Output Parsing Error", line)
+
+            family = None
+            if fields[0] in INET_NETIDS and len(fields) > 4:
+                family = inet_family(fields[4])
+                if family == "old-inet6":
+                    family = "inet6"
+                    old_format = True
+
+            key = (fields[0], fields[1], family)
+            tally[key] = tally.get(key, 0) + 1
+
+    # The wildcard address: IPv4 before iproute2 4.17, a dual-stack IPv6
+    # socket since.
+    add_tally(output_data, tally, "inet" if old_format else "inet6")
+
+
+def add_tally(output_data, tally, wildcard_family="inet6"):
+    """
+    add_tally(): Add tallied sockets to the counts of every socket type,
+                 address family and netid they belong to.
+
+    Inputs:
+        output_data: The output's "data", with the counts of every socket
+                     type, address family and allowed netid to fill in.
+        tally: The number of sockets by (netid, state, address family), the
+               address family being None where the netid tells it and "*"
+               for inet sockets on a wildcard address.
+        wildcard_family: The address family of the sockets on a wildcard
+                         address.
+    Outputs:
+        None
+    """
+    for (netid, state, family), count in tally.items():
+        if family == "*":
+            family = wildcard_family
+        # Special case to convert the question-marks symbol to a safe string.
+        if netid == "???":
+            netid = "unknown"
+
+        socket_type = NETID_SOCKET_TYPES.get(netid, netid)
+        if socket_type in output_data and SOCKET_MAPPINGS[socket_type]["socket_type"]:
+            count_sockets(output_data[socket_type], state, count)
+
+        family = family or NETID_FAMILIES.get(netid)
+        if family not in output_data:
+            continue
+        if SOCKET_MAPPINGS[family]["netids"]:
+            # Only the allowed netids have counts.
+            if netid in output_data[family]:
+                count_sockets(output_data[family][netid], state, count)
+        else:
+            count_sockets(output_data[family], state, count)
+
+
+def proc_counts(path, pattern):
+    """
+    proc_counts(): Count the rows of a /proc/net table by what pattern
+                   captures of them, scanning the table a block of lines at
+                   a time.
+
+    Inputs:
+        path: The path of the table.
+        pattern: The compiled regex of the rows, with the part to count them
+                 by in its group, or None to count all of the rows under
+                 b"".
+    Outputs:
+        counts: A Counter of the rows by their captured bytes.
+    """
+    # Only imported for the tables, like sockdiag for netlink.
+    from librenms_extend import procfs
+
+    counts = collections.Counter()
+    if pattern is None:
+        # Every line but the header one.
+        rows = sum(chunk.count(b"\n") for chunk in procfs.chunks(path)) - 1
+        if rows > 0:
+            counts[b""] = rows
+        return counts
+    findall = pattern.findall
+    for chunk in procfs.chunks(path):
+        counts.update(findall(chunk))
+    return counts
+
+
+def proc_socket(kind, family, key):
+    """
+    proc_socket(): Name the netid and state of the sockets counted under a
+                   key of proc_counts().
+
+    Inputs:
+        kind: The socket type (inet tables) or netid prefix of the table.
+        family: The address family of an inet table, else None.
+        key: What the table's pattern captured.
+    Outputs:
+        netid: The netid ss would print for the sockets.
+        state: The state ss would print for the sockets.
+    """
+    if family:
+        return kind, state_name(int(key, 16))
+    if kind == "unix":
+        flags, sock_type, state = key.split()
+        netid = SOCK_TYPE_NETIDS["unix"].get(int(sock_type, 16), "???")
+        if int(flags, 16) & PROC_UNIX_LISTENING:
+            return netid, "LISTEN"
+        return netid, PROC_UNIX_STATES.get(int(state, 16), "UNKNOWN")
+    if kind == "link":
+        return SOCK_TYPE_NETIDS["link"].get(int(key), "???"), "UNCONN"
+    return kind, "UNCONN"
+
+
+def proc_tables(selected):
+    """
+    proc_tables(): Pick the /proc/net tables listing the socket types and
+                   address families given.
+
+    Inputs:
+        selected: The socket types and address families to list, from
+                  selected_gentypes().
+    Outputs:
+        tables: The tables, as {(socket type or netid prefix, inet address
+                family or None): (file, compiled regex of its rows)}.
+    """
+    tables = {}
+    for name, socket_type, family in PROC_INET_TABLES:
+        if socket_type in selected:
+            tables[(socket_type, family)] = (name, PROC_INET_ROW)
+    if "unix" in selected:
+        tables[("unix", None)] = ("unix", PROC_UNIX_ROW)
+    if "link" in selected:
+        tables[("link", None)] = ("packet", PROC_PACKET_ROW)
+    if "netlink" in selected:
+        tables[("nl", None)] = ("netlink", PROC_NETLINK_ROW)
+    return tables
+
+
+def proc_table_tally(tally, kind, family, table):
+    """
+    proc_table_tally(): Tally the sockets of a /proc/net table.
+
+    Inputs:
+        tally: The number of sockets by (netid, state, address family), as
+               add_tally() takes it, to add to.
+        kind: The socket type (inet tables) or netid prefix of the table.
+        family: The address family of an inet table, else None.
+        table: The table's file and compiled regex of its rows.
+    Outputs:
+        None
+    """
+    name, pattern = table
+    try:
+        with timing.phase("parse"):
+            counts = proc_counts(os.path.join(PROC_NET_DIR, name), pattern)
+    except FileNotFoundError:
+        # Not in this kernel (no IPv6, no packet sockets...), so none.
+        return
+    except OSError as err:
+        error_handler("Proc Table Error", err)
+
+    for key, count in counts.items():
+        netid, state = proc_socket(kind, family, key)
+        key = (netid, state, family)
+        tally[key] = tally.get(key, 0) + count
+
+
+def proc_pass(output_data):
+    """
+    proc_pass(): Count the sockets of all of the socket types and address
+                 families in output_data from the /proc/net tables, without
+                 running ss.  Those with no table (dccp, mptcp, sctp, tipc,
+                 vsock, xdp) are left at zero.
+
+    Inputs:
+        output_data: The output's "data", with the counts of every socket
+                     type, address family and allowed netid to fill in.
+    Outputs:
+        None
+    """
+    tally = {}
+    for (kind, family), table in proc_tables(selected_gentypes(output_data)).items():
+        proc_table_tally(tally, kind, family, table)
+    add_tally(output_data, tally)
+
+
+def netlink_tally(selected):
+    """
+    netlink_tally(): Dump the sockets of the socket types and address
+                     families given over NETLINK_SOCK_DIAG and tally them
+                     from the kernel's replies, without ss.
+
+    Inputs:
+        selected: The socket types and address families to list, from
+                  selected_gentypes().
+    Outputs:
+        tally: The number of sockets by (netid, state, address family), as
+               add_tally() takes it.
+    """
+    # Only imported for this backend, so that the ss ones do not pay for
+    # socket on every run.
+    import socket
+
+    from librenms_extend import sockdiag
+
+    dumps = []
+    for socket_type in INET_SOCKET_TYPES:
+        if socket_type not in selected:
+            continue
+        protocol = NETLINK_INET_PROTOCOLS[socket_type]
+        states = sockdiag.ALL_STATES
+        if socket_type == "sctp":
+            states = NETLINK_SCTP_STATES
+        for family, address_family in (
+            ("inet", socket.AF_INET),
+            ("inet6", socket.AF_INET6),
+        ):
+            request = sockdiag.inet_request(address_family, protocol, states)
+            dumps.append((socket_type, family, request, sockdiag.INET_STATE))
+    if "unix" in selected:
+        dumps.append(("unix", None, sockdiag.unix_request(), sockdiag.UNIX_TYPE_STATE))
+    if "link" in selected:
+        dumps.append(("link", None, sockdiag.packet_request(), sockdiag.PACKET_TYPE))
+    if "netlink" in selected:
+        dumps.append(("nl", None, sockdiag.netlink_request(), sockdiag.NO_FIELD))
+    if "vsock" in selected:
+        dumps.append(
+            ("vsock", None, sockdiag.vsock_request(), sockdiag.VSOCK_TYPE_STATE)
         )
-    else:
-        ss_data[state] = 1 if state not in ss_data else (ss_data[state] + 1)
-        ss_data["TOTAL"] = 1 if "TOTAL" not in ss_data else (ss_data["TOTAL"] + 1)
+    if "xdp" in selected:
+        dumps.append(("xdp", None, sockdiag.xdp_request(), sockdiag.NO_FIELD))
+
+    tally = {}
+    fallbacks = proc_tables(selected)
+    for kind, family, request, field in dumps:
+        try:
+            with timing.phase("netlink"):
+                counts = sockdiag.count(request, field, COMMAND_TIMEOUT)
+        except OSError as err:
+            if err.errno not in (errno.ENOENT, errno.EOPNOTSUPP):
+                error_handler("Netlink Error", err)
+            # Without the kernel's diag module for them, ss reads the
+            # sockets' /proc/net table if they have one, and lists none
+            # otherwise.
+            if (kind, family) in fallbacks:
+                proc_table_tally(tally, kind, family, fallbacks[(kind, family)])
+            continue
 
-    return ss_data
+        for key, count in counts.items():
+            netid = kind
+            state = "UNCONN"
+            if family:
+                state = state_name(key[0])
+            elif kind in SOCK_TYPE_NETIDS:
+                netid = SOCK_TYPE_NETIDS[kind].get(key[0], "???")
+                if len(key) > 1:
+                    state = state_name(key[1])
+            key = (netid, state, family)
+            tally[key] = tally.get(key, 0) + count
+    return tally
+
+
+def netlink_pass(ss_cmd, output_data, socket_allow_list):
+    """
+    netlink_pass(): Count the sockets of all of the socket types and
+                    address families in output_data over NETLINK_SOCK_DIAG
+                    (see netlink_tally()).  TIPC sockets are not in those
+                    dumps and are listed with ss, if the kernel has TIPC.
+
+    Inputs:
+        ss_cmd: The ss command to execute for TIPC.
+        output_data: The output's "data", with the counts of every socket
+                     type, address family and allowed netid to fill in.
+        socket_allow_list: List of sockets to parse data for.
+    Outputs:
+        None
+    """
+    selected = selected_gentypes(output_data)
+    add_tally(output_data, netlink_tally(selected))
+
+    if "tipc" in output_data and os.path.exists(TIPC_MODULE):
+        with timing.phase("parse"):
+            lines = command_executor(ss_cmd, "tipc")
+            lines_parser(lines, "tipc", output_data["tipc"], socket_allow_list)
 
 
 def main():
@@ -347,9 +911,11 @@ def main():
 
     # Parse configuration file.
     args = parse_args()
-    ss_cmd, socket_allow_list, addr_family_allow_list = config_file_parser(args.config)
+    ss_cmd, socket_allow_list, addr_family_allow_list, backend = config_file_parser(
+        args.config
+    )
 
-    # Execute ss command for socket types.
+    # Build the initial output_data datastructures.
     for gentype in list(SOCKET_MAPPINGS.keys()):
         # Skip socket types and address families disabled by the user.
         if (
@@ -360,7 +926,6 @@ def main():
         ):
             continue
 
-        # Build the initial output_data datastructures.
         output_data["data"][gentype] = {}
         for netid in SOCKET_MAPPINGS[gentype]["netids"]:
             # Skip the netid if the socket is not allowed.
@@ -368,19 +933,28 @@ def main():
                 continue
             output_data["data"][gentype][netid] = {}
 
-        for line in command_executor(ss_cmd, gentype).decode("utf-8").split("\n"):
-            if not line:
-                continue
-
-            output_data["data"][gentype] = socket_parser(
-                line,
-                gentype,
-                output_data["data"][gentype],
-                socket_allow_list,
-            )
+    # ss only prints the netid column when it lists several socket types; a
+    # single socket type or address family is one run either way.
+    if backend == "netlink":
+        netlink_pass(ss_cmd, output_data["data"], socket_allow_list)
+    elif backend == "proc":
+        proc_pass(output_data["data"])
+    elif backend == "ss-once" and len(output_data["data"]) > 1:
+        single_pass(ss_cmd, output_data["data"])
+    else:
+        # Execute ss command for socket types.
+        for gentype in output_data["data"]:
+            with timing.phase("parse"):
+                lines_parser(
+                    command_executor(ss_cmd, gentype),
+                    gentype,
+                    output_data["data"][gentype],
+                    socket_allow_list,
+                )
 
-    print(json.dumps(output_data))
+    executor.mark_partial(output_data)
+    print(envelope.encode(output_data))
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(publish.run(main))
@@ -7,7 +7,8 @@ Monitors MegaRAID/StorCLI controllers:
   - Virtual Disk (RAID array) state & rebuild progress
   - Physical Disk health, error counts, SMART alerts
 
-Requires: Python >= 3.7, storcli64 installed
+Requires: Python >= 3.7, storcli64 installed, and the librenms_extend
+directory next to this script (it provides the atomic file write)
 
 ----------------------------------------------------------------------
 Deployment model
@@ -27,6 +28,17 @@ snmpd.conf:
 
 This eliminates SNMP timeouts and graph gaps entirely — snmpd never
 blocks waiting for storcli.  Data is at most ~60 s old.
+
+To size the collector for a small host, run it once with
+--memory-file /tmp/storraid-memory.json (and --timings-file for the
+storcli call times); see librenms_extend/memprofile.py.
+
+Where many hosts share a SAN, add --splay 180 --spacing 30 to the cron
+line: each host then queries at its own fixed point of the 5 minutes,
+and never alongside another heavy collector of its own; see
+librenms_extend/schedule.py.  With --pressure io=20,load=1.5 the
+published file is kept, marked as deferred, instead of running storcli
+on a host that is already saturated; see librenms_extend/pressure.py.
 ----------------------------------------------------------------------
 
 Call sequence:
@@ -40,16 +52,15 @@ storcli64 is NOT concurrency-safe — all calls are sequential.
 
 from __future__ import annotations
 
-import base64
-import gzip
 import json
 import os
 import subprocess
 import sys
-import tempfile
 from datetime import datetime
 from typing import Any, Dict, List, Optional, Tuple
 
+from librenms_extend import envelope, publish, timing
+
 # ── Config ─────────────────────────────────────────────────────────────────────
 STORCLI_PATHS = [
     "/opt/MegaRAID/storcli/storcli64",
@@ -136,9 +147,10 @@ def run_storcli(storcli, *args):
     Returns {"error": "..."} on any failure."""
     cmd = [storcli] + list(args) + ["J"]
     try:
-        r = subprocess.run(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30
-        )
+        with timing.command(cmd):
+            r = subprocess.run(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30
+            )
         out = r.stdout.decode("utf-8", errors="replace")
         if not out.strip():
             err = r.stderr.decode("utf-8", errors="replace").strip()
@@ -580,19 +592,20 @@ def _extract_pd_detail(resp, detail_by_key, cid, eid, slot):
 
 def _envelope(error, error_string, data):
     # type: (int, str, Any) -> str
-    """Build the LibreNMS JSON envelope, gzip-compress it, and return it as a
-    base64 string.  LibreNMS detects the base64 encoding automatically and
-    gunzips before parsing, which avoids the snmpd backslash-mangling bug and
-    reduces the payload size significantly over the wire."""
-    payload = json.dumps(
+    """Build the LibreNMS JSON envelope and return it gzip-compressed and
+    base64 encoded (see envelope.py).  LibreNMS
+    detects the base64 encoding automatically and gunzips before parsing,
+    which avoids the snmpd backslash-mangling bug and reduces the payload size
+    significantly over the wire."""
+    return envelope.encode(
         {
             "error": error,
             "errorString": error_string,
             "version": "1",
             "data": data,
-        }
-    ).encode("utf-8")
-    return base64.b64encode(gzip.compress(payload)).decode("ascii")
+        },
+        compress=True,
+    )
 
 
 def write_output(text):
@@ -601,18 +614,7 @@ def write_output(text):
     so snmpd's cat always reads a complete JSON document."""
     print(text)
     try:
-        dir_ = os.path.dirname(OUTPUT_PATH) or "/tmp"
-        fd, tmp = tempfile.mkstemp(dir=dir_, prefix=".storraid_out_")
-        os.fchmod(fd, 0o644)
-        try:
-            with os.fdopen(fd, "w") as f:
-                f.write(text + "\n")
-            os.replace(tmp, OUTPUT_PATH)
-        except Exception:
-            try:
-                os.unlink(tmp)
-            except OSError:
-                pass
+        publish.write_atomic(OUTPUT_PATH, text)
     except Exception:
         pass  # Non-fatal: stdout is the authoritative output
 
@@ -743,4 +745,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(publish.run(main))
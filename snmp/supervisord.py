@@ -6,9 +6,9 @@ import sys
 from supervisor import xmlrpc
 
 if sys.version_info.major < 3:
-    from xmlrpclib import ServerProxy
+    from xmlrpclib import MultiCall, ServerProxy
 else:
-    from xmlrpc.client import ServerProxy
+    from xmlrpc.client import MultiCall, ServerProxy
 
 unix_socket_path = "/var/run/supervisor/supervisor.sock"
 
@@ -33,13 +33,19 @@ try:
         transport=xmlrpc.SupervisorTransport(None, None, "unix://" + unix_socket_path),
     )
 
-    state = server.supervisor.getState()["statename"]
+    # Both queries in a single system.multicall round trip.
+    calls = MultiCall(server)
+    calls.supervisor.getState()
+    calls.supervisor.getAllProcessInfo()
+    state_info, process_info = calls()
+
+    state = state_info["statename"]
 
     if state != "RUNNING":
         error = 1
         error_string = "Not running"
 
-    for process in server.supervisor.getAllProcessInfo():
+    for process in process_info:
         if process["statename"] == "RUNNING":
             uptime = process["now"] - process["start"]
         else:
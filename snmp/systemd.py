@@ -7,7 +7,8 @@
 # Description: This is a simple script to parse "systemctl" output for ingestion into
 #              LibreNMS via the systemd application.
 # Installation:
-#     1. Copy this script to /etc/snmp/ and make it executable:
+#     1. Copy this script and the librenms_extend directory to /etc/snmp/ and
+#        make the script executable:
 #         chmod +x /etc/snmp/systemd.py
 #     2. Edit your snmpd.conf and include:
 #         extend systemd /etc/snmp/systemd.py
@@ -22,14 +23,29 @@
 #         }
 #         ```
 #     4. Restart snmpd and activate the app for desired host.
+#     5. (Optional) To collect in the background instead of on every poll, run the
+#        script from cron with --publish and have snmpd serve the file:
+#            */5 * * * * root /etc/snmp/systemd.py --publish /var/run/librenms/systemd.json
+#            extend systemd /bin/cat /var/run/librenms/systemd.json
+#        Add --interval <seconds> to keep it running instead of using cron.
+#        Add --timings (or --timings-file <path>) to report the time spent per
+#        command and phase, see librenms_extend/timing.py.
+#     6. (Optional) Served from librenms_collectord.py, the output must fit in the
+#        4094 bytes snmpd reads of a pass_persist value.  On hosts where it is
+#        longer, set "compress": true for systemd in that daemon's config, or
+#        keep the host on "extend" lines (see librenms_collectord.py).
 
 import json
 import subprocess
 import sys
 
+from librenms_extend import envelope, executor, publish, timing
+
 CONFIG_FILE = "/etc/snmp/systemd.json"
 SYSTEMCTL_ARGS = ["list-units", "--full", "--plain", "--no-legend", "--no-page"]
 SYSTEMCTL_CMD = "/usr/bin/systemctl"
+# Seconds systemctl may take before it is killed.
+COMMAND_TIMEOUT = 10
 # The unit "sub" type is the only unit state that has three layers of
 # depth.  "load" and "active" are two layers deep.
 SYSTEMCTL_TERNARY_STATES = ["sub"]
@@ -66,7 +82,7 @@ def config_file_parser():
         systemctl_cmd: The full systemctl command to execute.
     """
     systemctl_cmd = [SYSTEMCTL_CMD]
-    systemctl_args = SYSTEMCTL_ARGS
+    systemctl_args = SYSTEMCTL_ARGS.copy()
 
     # Load configuration file if it exists
     try:
@@ -87,23 +103,22 @@ def config_file_parser():
 
 def command_executor(systemctl_cmd):
     """
-    command_executor(): Execute the systemctl command and return the output.
+    command_executor(): Execute the systemctl command and yield its output line by
+                        line while it runs.
 
     Inputs:
         systemctl_cmd: The full systemctl command to execute.
     Outputs:
-        poutput: The stdout of the executed command (empty byte-string if error).
+        line: Each line of the stdout of the executed command.
     """
     try:
         # Execute systemctl command
-        poutput = subprocess.check_output(
-            systemctl_cmd,
-            stdin=None,
-            stderr=subprocess.PIPE,
-        )
+        with timing.command(systemctl_cmd):
+            yield from executor.iter_lines(systemctl_cmd, COMMAND_TIMEOUT)
+    except subprocess.TimeoutExpired as err:
+        error_handler("Command Timeout", err)
     except (subprocess.CalledProcessError, OSError) as err:
         error_handler("Command Execution Error", err)
-    return poutput
 
 
 def unit_parser(line, systemctl_data):
@@ -180,12 +195,13 @@ def main():
     systemctl_cmd = config_file_parser()
 
     # Execute systemctl command and parse output.
-    for line in command_executor(systemctl_cmd).decode("utf-8").split("\n"):
-        if not line:
-            continue
-        output_data["data"] = unit_parser(line, output_data["data"])
-    print(json.dumps(output_data))
+    with timing.phase("parse"):
+        for line in command_executor(systemctl_cmd):
+            if not line:
+                continue
+            output_data["data"] = unit_parser(line, output_data["data"])
+    print(envelope.encode(output_data))
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(publish.run(main))
@@ -8,7 +8,8 @@
 #              via the wireguard application.  We collect traffic, a friendly identifier (arbitrary
 #              name), and last handshake time for all clients on all wireguard interfaces.
 # Installation:
-#     1. Copy this script to /etc/snmp/ and make it executable:
+#     1. Copy this script and the librenms_extend directory to /etc/snmp/ and
+#        make the script executable:
 #         chmod +x /etc/snmp/wireguard.py
 #     2. Edit your snmpd.conf and include:
 #         extend wireguard /etc/snmp/wireguard.py
@@ -37,6 +38,17 @@
 #         }
 #         ```
 #     4. Restart snmpd and activate the app for desired host.
+#     5. (Optional) To collect in the background instead of on every poll, run the
+#        script from cron with --publish and have snmpd serve the file:
+#            */5 * * * * root /etc/snmp/wireguard.py --publish /var/run/librenms/wireguard.json
+#            extend wireguard /bin/cat /var/run/librenms/wireguard.json
+#        Add --interval <seconds> to keep it running instead of using cron.
+#        Add --timings (or --timings-file <path>) to report the time spent per
+#        command and phase, see librenms_extend/timing.py.
+#     6. (Optional) Served from librenms_collectord.py, the output must fit in the
+#        4094 bytes snmpd reads of a pass_persist value.  On hosts where it is
+#        longer, set "compress": true for wireguard in that daemon's config, or
+#        keep the host on "extend" lines (see librenms_collectord.py).
 # TODO:
 #     1. If Wireguard ever implements a friendly identifier, then scrape that instead of providing
 #        arbitrary names manually in the json conf file.
@@ -45,11 +57,15 @@ import json
 import subprocess
 import sys
 from datetime import datetime
-from itertools import chain
+from itertools import chain, islice
+
+from librenms_extend import envelope, executor, publish, timing
 
 CONFIG_FILE = "/etc/snmp/wireguard.json"
 WG_CMD = "/usr/bin/wg"
 WG_ARGS_SHOW_INTFS = ["show", "interfaces"]
+# Seconds each wg invocation may take before it is killed.
+COMMAND_TIMEOUT = 10
 
 
 def error_handler(error_name, err):
@@ -136,23 +152,23 @@ def config_file_validator(interface_clients_dict):
 
 def command_executor(wg_cmd_full):
     """
-    command_executor(): Execute the wg command and return the output.
+    command_executor(): Execute the wg command and yield its output line by line while it
+                        runs.
 
     Inputs:
         wg_cmd_full: The full wg command to execute.
     Outputs:
-        poutput: The stdout of the executed command (empty byte-string if error).
+        line: Each line of the stdout of the executed command (none after a timeout).
     """
     try:
         # Execute wg command
-        poutput = subprocess.check_output(
-            wg_cmd_full,
-            stdin=None,
-            stderr=subprocess.PIPE,
-        )
+        with timing.command(wg_cmd_full):
+            yield from executor.iter_lines(wg_cmd_full, COMMAND_TIMEOUT)
+    except subprocess.TimeoutExpired as err:
+        # Keep the peers and interfaces that did answer.
+        executor.record_timeout(err)
     except (subprocess.CalledProcessError, OSError) as err:
         error_handler("Command Execution Error", err)
-    return poutput
 
 
 def output_parser(line, interface_clients_dict, interface):
@@ -228,26 +244,28 @@ def main():
 
     # Get list of interfaces
     wg_cmd_show_intfs = wg_cmd + WG_ARGS_SHOW_INTFS
-    wg_intfs = command_executor(wg_cmd_show_intfs).decode("utf-8").strip().split(" ")
+    wg_intfs = " ".join(command_executor(wg_cmd_show_intfs)).split()
 
     # Execute wg command on each discovered interface and parse output. We skip the first line
-    # ("[1:]") since that's the wireguard server's public key declaration.
+    # (islice from 1) since that's the wireguard server's public key declaration.
     for interface in wg_intfs:
         wg_cmd_dump = wg_cmd + ["show"] + [interface] + ["dump"]
         output_data["data"][interface] = {}
-        for line in command_executor(wg_cmd_dump).decode("utf-8").split("\n")[1:]:
-            if not line:
-                continue
-            # Parse each line and import the resultant dictionary into output_data.  We update the
-            # interface key with new clients as they are found and instantiate new interface keys as
-            # they are found.
-            for friendly_name, client_data in output_parser(
-                line, interface_clients_dict, interface
-            ).items():
-                output_data["data"][interface][friendly_name] = client_data
-
-    print(json.dumps(output_data))
+        with timing.phase("parse"):
+            for line in islice(command_executor(wg_cmd_dump), 1, None):
+                if not line:
+                    continue
+                # Parse each line and import the resultant dictionary into output_data.  We update
+                # the interface key with new clients as they are found and instantiate new
+                # interface keys as they are found.
+                for friendly_name, client_data in output_parser(
+                    line, interface_clients_dict, interface
+                ).items():
+                    output_data["data"][interface][friendly_name] = client_data
+
+    executor.mark_partial(output_data)
+    print(envelope.encode(output_data))
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(publish.run(main))